@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 
 """Usage:
-    analyse_quantification_run [{log_option_spec} --plot-format=<plot-format> --grouped-threshold=<threshold>] --quant-method=<quant-method> --read-length=<read-length> --read-depth=<read-depth> --paired-end=<paired-end> --error=<errors> --bias=<bias> <tpm-file> <out-file>
+    analyse_quantification_run [{log_option_spec} --plot-format=<plot-format> --grouped-threshold=<threshold>] --quant-method=<quant-method> --read-length=<read-length> --read-depth=<read-depth> --paired-end=<paired-end> --error=<errors> --bias=<bias> --threads=<threads> <tpm-file> <out-file>
 
 {help_option_spec}                                    {help_option_description}
 {ver_option_spec}                                 {ver_option_description}
@@ -13,7 +13,8 @@
 --read-depth=<read-depth>                    The depth of reads sequenced across the transcriptome.
 --paired-end=<paired-end>                    Whether paired-end sequence reads were used.
 --error=<errors>                             Whether the reads contain sequencing errors.
---bias=<bias>                                Whether the reads contain sequence bias.
+--bias=<bias>                                Whether the reads contain sequence bias, or "gc" or "positional" for GC-content or positional bias.
+--threads=<threads>                          The number of threads used for quantification.
 <tpm-file>                                   File containing real and calculated TPMs.
 <out-file>                                   Basename for output graph and data files.
 """
@@ -23,22 +24,30 @@ import collections
 import docopt
 import itertools
 import options as opt
+import os.path
 import pandas as pd
 import parameters
 import statistics
 import tpms as t
 import plot
+import run_log
 import schema
 
 from __init__ import __version__
 
 TRANSCRIPT_COUNT_LABEL = "No. transcripts per gene"
 TRUE_POSITIVES_LABEL = "true positive TPMs"
+QUANT_STEP = "quant"
 TPM_FILE = "<tpm-file>"
 OUT_FILE_BASENAME = "<out-file>"
 PLOT_FORMAT = "--plot-format"
 GROUPED_THRESHOLD = "--grouped-threshold"
 
+ASSIGNMENT_PRECISION_SUFFIX = "_assignment_precision.csv"
+CLASSIFIER_COL = "classifier"
+CLASS_COL = "class"
+ALL_TRANSCRIPTS = "all"
+
 TpmInfo = collections.namedtuple("TpmInfo", ["tpms", "label"])
 
 
@@ -75,20 +84,31 @@ def _write_overall_stats(tpms, tp_tpms, options):
     stats = t.get_stats(tpms, tp_tpms, statistics.get_statistics())
     _add_parameter_values_to_stats(stats)
 
+    # Record the wall clock time taken by the quantification tool, if this was
+    # logged when the run script was executed.
+    quant_time = run_log.get_step_duration(".", QUANT_STEP)
+    stats[statistics.QUANT_TIME] = \
+        float("nan") if quant_time is None else quant_time
+
     stats_file_name = statistics.get_stats_file(
         ".", options[OUT_FILE_BASENAME])
     statistics.write_stats_data(stats_file_name, stats, index=False)
 
 
+def _get_grouped_stats(tpms, tp_tpms, classifier):
+    stats = t.get_grouped_stats(
+        tpms, tp_tpms, classifier.get_column_name(),
+        statistics.get_statistics())
+    _add_parameter_values_to_stats(stats)
+    return stats
+
+
 def _write_stratified_stats(tpms, tp_tpms, non_zero, options):
     clsfr_stats = {}
 
     for classifier in classifiers.get_classifiers():
         if classifier.produces_grouped_stats():
-            column_name = classifier.get_column_name()
-            stats = t.get_grouped_stats(
-                tpms, tp_tpms, column_name, statistics.get_statistics())
-            _add_parameter_values_to_stats(stats)
+            stats = _get_grouped_stats(tpms, tp_tpms, classifier)
             clsfr_stats[classifier] = stats
 
             stats_file_name = statistics.get_stats_file(
@@ -151,6 +171,32 @@ def _draw_cumulative_transcript_distribution_graphs(
             options[OUT_FILE_BASENAME], ti.label, c, asc)
 
 
+def _write_assignment_precision(tpms, options):
+    # Precision of read assignment is written for transcripts as a whole, and
+    # for the groups of transcripts determined by each classifier
+    overall = t.get_assignment_precision(tpms)
+    overall[CLASSIFIER_COL] = ALL_TRANSCRIPTS
+    overall[CLASS_COL] = ALL_TRANSCRIPTS
+    precisions = [overall]
+
+    for classifier in classifiers.get_classifiers():
+        if classifier.produces_grouped_stats():
+            column_name = classifier.get_column_name()
+            precision = t.get_assignment_precision(tpms, column_name)
+            precision[CLASSIFIER_COL] = column_name
+            precision[CLASS_COL] = precision.index
+            precisions.append(precision)
+
+    precision = pd.concat(precisions)[
+        [CLASSIFIER_COL, CLASS_COL, t.ASSIGNED_READS, t.CORRECT_READS,
+         t.ASSIGNMENT_PRECISION]]
+    _add_parameter_values_to_stats(precision)
+
+    precision_file_name = os.path.join(
+        ".", options[OUT_FILE_BASENAME] + ASSIGNMENT_PRECISION_SUFFIX)
+    statistics.write_stats_data(precision_file_name, precision, index=False)
+
+
 def _prepare_data(tpms):
     # Determine whether each TPM measurement is a true/false positive/negative.
     # For our purposes, marking an TPM as positive or negative is determined by
@@ -180,7 +226,15 @@ def _write_statistics(options, tpms, tp_tpms, non_zero):
 
     # Write statistics for TPMS stratified by various classification measures
     logger.info("Writing statistics for stratified TPMs")
-    return _write_stratified_stats(tpms, tp_tpms, non_zero, options)
+    clsfr_stats = _write_stratified_stats(tpms, tp_tpms, non_zero, options)
+
+    # Write the precision with which reads were assigned to transcripts, if
+    # this could be determined from the output of the quantification method
+    if t.ASSIGNED_READS in tpms:
+        logger.info("Writing read assignment precision...")
+        _write_assignment_precision(tpms, options)
+
+    return clsfr_stats
 
 
 def _draw_graphs(options, tp_tpms, non_zero, clsfr_stats):
@@ -213,11 +267,14 @@ def _analyse_run(logger, options):
     tp_tpms = t.get_true_positives(tpms)
     non_zero = _get_non_zero_tpms(tpms)
 
+    # Statistics are calculated once, and the stratified statistics written
+    # are then also used to draw graphs
     clsfr_stats = _write_statistics(options, tpms, tp_tpms, non_zero)
 
     # Draw graphs
     logger.info("Plotting graphs...")
-    _draw_graphs(options, tp_tpms, non_zero, clsfr_stats)
+    with run_log.recording_step(".", "plots"):
+        _draw_graphs(options, tp_tpms, non_zero, clsfr_stats)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 
 """Usage:
-    assemble_quantification_data [{log_option_spec}] --method=<quantification-method> --out=<output-file> <pro-file> <transcript-count-file> <unique-sequence-file>
+    assemble_quantification_data [{log_option_spec} --true-counts=<true-counts-file> --read-assignments=<read-assignments-file>] --method=<quantification-method> --out=<output-file> <pro-file> <transcript-count-file> <unique-sequence-file>
 
 {help_option_spec}                    {help_option_description}
 {ver_option_spec}                 {ver_option_description}
@@ -9,6 +9,10 @@
 -m --method=<quant-method>   Method used to quantify transcript abundances.
 -o <output-file> --out=<output-file>
                              Output file for real and calculated TPMs.
+--true-counts=<true-counts-file>
+                             File containing true per-transcript fragment counts; ignored if it does not exist.
+--read-assignments=<read-assignments-file>
+                             File containing per-transcript counts of reads assigned, and correctly assigned, by the quantification method; ignored if it does not exist.
 <pro-file>                   Flux Simulator gene expression profile file.
 <transcript-count-file>      File containing per-gene transcript counts.
 <unique-sequence-file>       File containing unique sequence lengths per-transcript.
@@ -19,6 +23,7 @@ from schema import SchemaError
 
 import flux_simulator as fs
 import options as opt
+import os.path
 import pandas
 import quantifiers as qs
 import tpms
@@ -27,12 +32,17 @@ from __init__ import __version__
 
 QUANT_METHOD = "--method"
 OUT_FILE = "--out"
+TRUE_COUNTS_FILE = "--true-counts"
+READ_ASSIGNMENTS_FILE = "--read-assignments"
 PRO_FILE = "<pro-file>"
 COUNT_FILE = "<transcript-count-file>"
 UNIQUE_SEQ_FILE = "<unique-sequence-file>"
 
 TRANSCRIPT_COL = "transcript"
 COUNT_COL = "transcript_count"
+FRAGMENTS_COL = "fragments"
+ASSIGNED_COL = "assigned"
+CORRECT_COL = "correct"
 UNIQUE_SEQ_LENGTH_COL = "unique-length"
 
 SORTED_PREFIX = "sorted"
@@ -80,6 +90,31 @@ def _read_transcript_counts(count_file, profiles):
         profiles[fs.PRO_FILE_TRANSCRIPT_ID_COL].map(set_transcript_count)
 
 
+def _read_true_read_counts(true_counts_file, profiles):
+    true_counts = pandas.read_csv(true_counts_file, index_col=TRANSCRIPT_COL)
+
+    profiles[tpms.REAL_FRAGMENTS] = \
+        profiles[fs.PRO_FILE_TRANSCRIPT_ID_COL].map(
+            true_counts[FRAGMENTS_COL]).fillna(0)
+
+    # Read-based true TPMs are calculated from the number of fragments
+    # from each transcript per unit of its full length; the effective length
+    # of transcripts is not used, since the fragment length distribution is
+    # not recorded for every read simulator
+    rates = profiles[tpms.REAL_FRAGMENTS] / profiles[fs.PRO_FILE_LENGTH_COL]
+    profiles[tpms.REAL_READ_TPM] = 1000000 * rates / rates.sum()
+
+
+def _read_read_assignments(read_assignments_file, profiles):
+    read_assignments = pandas.read_csv(
+        read_assignments_file, index_col=TRANSCRIPT_COL)
+
+    for col, assignments_col in [(tpms.ASSIGNED_READS, ASSIGNED_COL),
+                                 (tpms.CORRECT_READS, CORRECT_COL)]:
+        profiles[col] = profiles[fs.PRO_FILE_TRANSCRIPT_ID_COL].map(
+            read_assignments[assignments_col]).fillna(0)
+
+
 def _read_unique_sequence_lengths(unique_seq_file, profiles):
     unique_seqs = pandas.read_csv(unique_seq_file, index_col=TRANSCRIPT_COL)
 
@@ -92,6 +127,13 @@ def _read_unique_sequence_lengths(unique_seq_file, profiles):
 
 
 def _write_quantification_data(out_file, profiles):
+    cols = [TRANSCRIPT_COL, tpms.LENGTH, tpms.UNIQUE_SEQ_LENGTH,
+            tpms.TRANSCRIPT_COUNT, tpms.REAL_TPM, tpms.CALCULATED_TPM]
+    if tpms.REAL_FRAGMENTS in profiles:
+        cols += [tpms.REAL_FRAGMENTS, tpms.REAL_READ_TPM]
+    if tpms.ASSIGNED_READS in profiles:
+        cols += [tpms.ASSIGNED_READS, tpms.CORRECT_READS]
+
     profiles.rename(
         columns={
             fs.PRO_FILE_TRANSCRIPT_ID_COL: TRANSCRIPT_COL,
@@ -99,10 +141,7 @@ def _write_quantification_data(out_file, profiles):
         },
         inplace=True)
 
-    profiles.to_csv(
-        out_file, index=False,
-        cols=[TRANSCRIPT_COL, tpms.LENGTH, tpms.UNIQUE_SEQ_LENGTH,
-              tpms.TRANSCRIPT_COUNT, tpms.REAL_TPM, tpms.CALCULATED_TPM])
+    profiles.to_csv(out_file, index=False, cols=cols)
 
 
 def _assemble_and_write_quantification_data(logger, options):
@@ -124,6 +163,20 @@ def _assemble_and_write_quantification_data(logger, options):
     logger.info("Reading unique sequence lengths per-transcript")
     _read_unique_sequence_lengths(options[UNIQUE_SEQ_FILE], profiles)
 
+    # Read true per-transcript fragment counts, if they were recorded when
+    # reads were simulated
+    if options[TRUE_COUNTS_FILE] is not None and \
+            os.path.exists(options[TRUE_COUNTS_FILE]):
+        logger.info("Reading true per-transcript fragment counts...")
+        _read_true_read_counts(options[TRUE_COUNTS_FILE], profiles)
+
+    # Read per-transcript counts of reads assigned by the quantification
+    # method, if they could be determined from its output
+    if options[READ_ASSIGNMENTS_FILE] is not None and \
+            os.path.exists(options[READ_ASSIGNMENTS_FILE]):
+        logger.info("Reading per-transcript read assignment counts...")
+        _read_read_assignments(options[READ_ASSIGNMENTS_FILE], profiles)
+
     # Write TPMs and other relevant data to output file
     logger.info("Writing TPMs to file {out}".format(out=options[OUT_FILE]))
     _write_quantification_data(options[OUT_FILE], profiles)
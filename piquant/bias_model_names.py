@@ -0,0 +1,15 @@
+"""
+Names of the models of sequence and coverage bias which may be simulated.
+These are kept apart from the models themselves (see bias_models), so that
+they may be used without importing the models' dependencies. Exports:
+
+PWM_BIAS: Bias towards reads whose first bases score highly against a PWM.
+GC_BIAS: Bias according to the GC content of fragments.
+POSITIONAL_BIAS: Bias according to the position of fragments in transcripts.
+BIAS_MODELS: The names of all bias models.
+"""
+
+PWM_BIAS = "pwm"
+GC_BIAS = "gc"
+POSITIONAL_BIAS = "positional"
+BIAS_MODELS = [PWM_BIAS, GC_BIAS, POSITIONAL_BIAS]
@@ -0,0 +1,192 @@
+"""
+Models of sequence and coverage bias, used to weight fragments so that a
+biased selection of them can be made - either from a set of simulated reads,
+or as fragments are simulated. Each model weights a batch of fragments at
+once, via an object describing the fragments which provides the following
+methods (of which a model calls only those it needs):
+
+first_read_bases(num_bases): Return a two-dimensional array of the character
+codes of the first bases of the first read of each fragment.
+gc_content(): Return an array of the fraction of G or C bases of each
+fragment.
+positions(): Return an array of the position of the midpoint of each fragment
+within its transcript, as a fraction of the transcript's length.
+
+Exports:
+
+get_bias_model: Return the bias model of a given name.
+count_gc: Return the number of G or C bases in each row of an array of bases.
+PWMBias: Weights fragments by the score of their first read against a PWM.
+GCBias: Weights fragments by their GC content.
+PositionalBias: Weights fragments by their position within their transcript.
+ReadFragments: A batch of fragments, described by the lines of their reads.
+"""
+
+import numpy as np
+import pwm
+
+from bias_model_names import PWM_BIAS, GC_BIAS, POSITIONAL_BIAS, BIAS_MODELS
+
+_GC_BASES = np.zeros(256, dtype=np.int64)
+for _base in "GCgc":
+    _GC_BASES[ord(_base)] = 1
+
+
+def count_gc(bases):
+    """
+    Return the number of G or C bases in each row of an array of bases.
+
+    bases: A two-dimensional array of unsigned 8-bit character codes.
+    """
+    return _GC_BASES[bases].sum(axis=1)
+
+
+class PWMBias:
+    """
+    Weights fragments by the score of their first read against a PWM.
+
+    The weight of each fragment is the score of the start of its first read
+    against a position weight matrix.
+    """
+    def __init__(self, bias_pwm):
+        self.pwm = bias_pwm
+
+    def max_weight(self):
+        """
+        Return the highest weight that any fragment can have.
+        """
+        return self.pwm.max_score()
+
+    def weigh(self, fragments):
+        """
+        Return an array of the weights of a batch of fragments.
+        """
+        return self.pwm.score_bases(
+            fragments.first_read_bases(self.pwm.length))
+
+
+class GCBias:
+    """
+    Weights fragments by their GC content.
+
+    Weights fall away, as a Gaussian function of GC content, from a maximum
+    of one for fragments of an optimal GC content, so that both GC-poor and
+    GC-rich fragments are under-represented.
+    """
+    def __init__(self, optimum=0.5, width=0.1):
+        self.optimum = optimum
+        self.width = width
+
+    def max_weight(self):
+        """
+        Return the highest weight that any fragment can have.
+        """
+        return 1.0
+
+    def weigh(self, fragments):
+        """
+        Return an array of the weights of a batch of fragments.
+        """
+        deviations = (fragments.gc_content() - self.optimum) / self.width
+        return np.exp(-0.5 * deviations ** 2)
+
+
+class PositionalBias:
+    """
+    Weights fragments by their position within their transcript.
+
+    Weights decay exponentially with the distance of the midpoint of a
+    fragment from the 3' end of its transcript (or, optionally, from its 5'
+    end), as a fraction of the transcript's length, so that coverage is
+    biased towards that end of transcripts.
+    """
+    def __init__(self, decay=2.0, three_prime=True):
+        self.decay = decay
+        self.three_prime = three_prime
+
+    def max_weight(self):
+        """
+        Return the highest weight that any fragment can have.
+        """
+        return 1.0
+
+    def weigh(self, fragments):
+        """
+        Return an array of the weights of a batch of fragments.
+        """
+        positions = np.clip(fragments.positions(), 0, 1)
+        distances = 1 - positions if self.three_prime else positions
+        return np.exp(-self.decay * distances)
+
+
+def get_bias_model(bias_model=None, pwm_file=None):
+    """
+    Return the bias model of a given name.
+
+    If no model is named, a PWM bias model is returned if a PWM file is
+    specified, and otherwise None.
+    bias_model: One of "pwm", "gc" or "positional", or None.
+    pwm_file: Path to a PWM file; this must be specified for PWM bias.
+    """
+    if bias_model is None:
+        if pwm_file is None:
+            return None
+        bias_model = PWM_BIAS
+
+    if bias_model == PWM_BIAS:
+        if pwm_file is None:
+            raise ValueError("A PWM file must be specified for PWM bias")
+        return PWMBias(pwm.PWM(pwm_file))
+    if bias_model == GC_BIAS:
+        return GCBias()
+    if bias_model == POSITIONAL_BIAS:
+        return PositionalBias()
+
+    raise ValueError("Unknown bias model: " + bias_model)
+
+
+class ReadFragments:
+    """
+    A batch of fragments, described by the lines of their reads.
+
+    The GC content of each fragment is estimated from the bases of its
+    read(s), and its position within its transcript is taken from the name
+    of its first read, which must be of the form written by FluxSimulator.
+    """
+    def __init__(self, lines, lines_per_fragment, reads_per_fragment):
+        self.lines = lines
+        self.lines_per_fragment = lines_per_fragment
+        self.lines_per_read = lines_per_fragment / reads_per_fragment
+        self.reads_per_fragment = reads_per_fragment
+
+    def first_read_bases(self, num_bases):
+        return pwm.encode_sequences(
+            [s.rstrip() for s in self.lines[1::self.lines_per_fragment]],
+            num_bases)
+
+    def gc_content(self):
+        # GC bases are counted across all read sequences at once, and the
+        # counts for each read found from their cumulative sum
+        sequences = [s.rstrip() for s in self.lines[1::self.lines_per_read]]
+        lengths = np.array([len(s) for s in sequences], dtype=np.int64)
+        is_gc = _GC_BASES[np.frombuffer("".join(sequences), dtype=np.uint8)]
+        cumulative = np.concatenate([[0], np.cumsum(is_gc)])
+        ends = np.cumsum(lengths)
+        counts = cumulative[ends] - cumulative[ends - lengths]
+
+        counts = counts.reshape(-1, self.reads_per_fragment).sum(axis=1)
+        lengths = lengths.reshape(-1, self.reads_per_fragment).sum(axis=1)
+        return counts / np.maximum(lengths, 1).astype(np.float64)
+
+    def positions(self):
+        # FluxSimulator read names end with the length of the transcript, the
+        # start and end of the fragment within it, and the fragment's
+        # orientation
+        names = self.lines[0::self.lines_per_fragment]
+        try:
+            fields = np.array([n.rstrip().split(":")[-4:-1] for n in names],
+                              dtype=np.float64).reshape(len(names), 3)
+        except ValueError:
+            raise ValueError("Read names do not give the positions of " +
+                             "fragments within transcripts")
+        return (fields[:, 1] + fields[:, 2]) / 2 / fields[:, 0]
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""Usage:
+    count_read_assignments [{log_option_spec} --sampled-tag=<tag>] <pro-file> <origins-file> <alignments-file>
+
+{help_option_spec}                 {help_option_description}
+{ver_option_spec}              {ver_option_description}
+{log_option_spec}   {log_option_description}
+--sampled-tag=<tag>       Alignment tag whose value is 1 for the alignment of each read sampled by the quantifier, and 0 for its other alignments; if not specified, the alignments file is taken to hold only sampled alignments.
+<pro-file>                Flux Simulator gene expression profile file.
+<origins-file>            Index of the transcripts of origin of simulated reads.
+<alignments-file>         SAM or BAM file of the assignment of reads to transcripts by a quantifier.
+"""
+
+import docopt
+import flux_simulator as fs
+import options as opt
+import reads
+import schema
+
+from __init__ import __version__
+
+PRO_FILE = "<pro-file>"
+ORIGINS_FILE = "<origins-file>"
+ALIGNMENTS_FILE = "<alignments-file>"
+SAMPLED_TAG = "--sampled-tag"
+
+
+def _validate_command_line_options(options):
+    try:
+        opt.validate_log_level(options)
+        opt.validate_file_option(
+            options[PRO_FILE], "Could not open expression profile file")
+        opt.validate_file_option(
+            options[ORIGINS_FILE], "Could not open read origins file")
+        opt.validate_file_option(
+            options[ALIGNMENTS_FILE], "Could not open alignments file")
+    except schema.SchemaError as exc:
+        exit(exc.code)
+
+
+def _output_read_assignment_counts(transcript_ids, assigned, correct):
+    print("transcript,assigned,correct")
+    for transcript, num_assigned, num_correct in zip(
+            transcript_ids, assigned, correct):
+        print("{t},{a},{c}".format(
+            t=transcript, a=num_assigned, c=num_correct))
+
+
+def _count_read_assignments(logger, options):
+    logger.info("Reading expression profiles...")
+    transcript_ids = list(fs.read_expression_profiles(
+        options[PRO_FILE])[fs.PRO_FILE_TRANSCRIPT_ID_COL])
+
+    logger.info("Reading read origins from {f}...".format(
+        f=options[ORIGINS_FILE]))
+    read_origins = reads.load_read_origins(options[ORIGINS_FILE])
+
+    logger.info("Counting read assignments in {f}...".format(
+        f=options[ALIGNMENTS_FILE]))
+    assigned, correct = reads.count_read_assignments(
+        options[ALIGNMENTS_FILE], read_origins, transcript_ids,
+        sampled_tag=options[SAMPLED_TAG])
+
+    logger.info("Printing read assignment counts per-transcript...")
+    _output_read_assignment_counts(transcript_ids, assigned, correct)
+
+
+if __name__ == "__main__":
+    # Read in command-line options
+    __doc__ = opt.substitute_common_options_into_usage(__doc__)
+    options = docopt.docopt(
+        __doc__, version="count_read_assignments v" + __version__)
+
+    # Validate command-line options
+    _validate_command_line_options(options)
+
+    # Set up logger
+    logger = opt.get_logger_for_options(options)
+
+    # Count the reads assigned to each transcript by a quantifier, and how
+    # many of those were assigned to the transcript they originated from
+    try:
+        _count_read_assignments(logger, options)
+    except (IOError, ValueError) as exc:
+        exit(str(exc))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""Usage:
+    count_transcript_reads [{log_option_spec}] <pro-file> <origins-file>
+
+{help_option_spec}                 {help_option_description}
+{ver_option_spec}              {ver_option_description}
+{log_option_spec}   {log_option_description}
+<pro-file>                Flux Simulator gene expression profile file.
+<origins-file>            Index of the transcripts of origin of the final reads, as written by index_read_origins.py.
+"""
+
+import docopt
+import flux_simulator as fs
+import options as opt
+import reads
+import schema
+
+from __init__ import __version__
+
+PRO_FILE = "<pro-file>"
+ORIGINS_FILE = "<origins-file>"
+
+TRANSCRIPT_COL = "transcript"
+FRAGMENTS_COL = "fragments"
+
+
+def _validate_command_line_options(options):
+    try:
+        opt.validate_log_level(options)
+        opt.validate_file_option(
+            options[PRO_FILE], "Could not open expression profile file")
+        opt.validate_file_option(
+            options[ORIGINS_FILE], "Could not open read origins file")
+    except schema.SchemaError as exc:
+        exit(exc.code)
+
+
+def _output_transcript_fragment_counts(transcript_ids, fragment_counts):
+    print(TRANSCRIPT_COL + "," + FRAGMENTS_COL)
+    for transcript, count in zip(transcript_ids, fragment_counts):
+        print("{t},{c}".format(t=transcript, c=count))
+
+
+def _count_transcript_reads(logger, options):
+    logger.info("Reading expression profiles...")
+    transcript_ids = list(fs.read_expression_profiles(
+        options[PRO_FILE])[fs.PRO_FILE_TRANSCRIPT_ID_COL])
+
+    # The origin of each fragment - for paired-end reads, of both its reads -
+    # is recorded once
+    logger.info("Counting fragments per-transcript in {f}...".format(
+        f=options[ORIGINS_FILE]))
+    fragment_counts = reads.load_read_origins(
+        options[ORIGINS_FILE]).count_transcripts(len(transcript_ids))
+
+    logger.info("Printing fragment counts per-transcript...")
+    _output_transcript_fragment_counts(transcript_ids, fragment_counts)
+
+
+if __name__ == "__main__":
+    # Read in command-line options
+    __doc__ = opt.substitute_common_options_into_usage(__doc__)
+    options = docopt.docopt(
+        __doc__, version="count_transcript_reads v" + __version__)
+
+    # Validate command-line options
+    _validate_command_line_options(options)
+
+    # Set up logger
+    logger = opt.get_logger_for_options(options)
+
+    # Count the true number of fragments in the final reads from each
+    # transcript
+    try:
+        _count_transcript_reads(logger, options)
+    except (IOError, ValueError) as exc:
+        exit(str(exc))
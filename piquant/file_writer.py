@@ -43,6 +43,8 @@ class BashScriptWriter(_Writer):
 
         self.indent_level = 0
         self.block_ends = []
+        self.num_parallel_sections = 0
+        self.parallel_sections = []
 
         with self.section():
             self.add_line("#!/bin/bash")
@@ -91,6 +93,51 @@ class BashScriptWriter(_Writer):
     def while_block(self, details):
         return self._adding_bash_block("while ", "; do", "done", details)
 
+    @contextlib.contextmanager
+    def for_block(self, details):
+        return self._adding_bash_block("for ", "; do", "done", details)
+
+    @contextlib.contextmanager
+    def parallel_section(self):
+        # Commands added within background_job() blocks inside the section are
+        # executed concurrently. At the end of the section, the script waits
+        # for all of them to finish, and exits with an error if any failed.
+        self.num_parallel_sections += 1
+        pids = "PARALLEL_PIDS_{n}".format(n=self.num_parallel_sections)
+        failed = "PARALLEL_FAILED_{n}".format(n=self.num_parallel_sections)
+
+        self.set_variable(pids, "()")
+        self.parallel_sections.append(pids)
+        try:
+            yield
+        finally:
+            self.parallel_sections.pop()
+            self.set_variable(failed, 0)
+            with self.for_block("PID in \"${" + pids + "[@]}\""):
+                self.add_line("wait $PID || " + failed + "=1")
+            with self.if_block("$" + failed + " -ne 0"):
+                self.add_line("exit 1")
+
+    @contextlib.contextmanager
+    def background_job(self):
+        # Commands added within the block are executed in a background
+        # subshell, which inherits the script's "errexit" option and so exits
+        # with an error if any command fails.
+        pids = self.parallel_sections[-1]
+
+        self.add_line("(")
+        self.indent()
+        try:
+            yield
+        finally:
+            self.deindent()
+            self.add_line(") &")
+            self.add_line(pids + "+=($!)")
+
+    @contextlib.contextmanager
+    def function_block(self, name):
+        return self._adding_bash_block("function ", " {", "}", name)
+
     @contextlib.contextmanager
     def case_block(self, details):
         return self._adding_bash_block("case ", " in", "esac", details)
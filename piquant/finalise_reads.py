@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+
+"""Usage:
+    finalise_reads [{log_option_spec} --paired-end --left-mates --seed=<seed> --buffer-size=<buffer-size> --min-reads=<min-reads> --num-reads=<num-reads> --bias-model=<bias-model> --bias-pwm=<pwm-file> --processes=<processes>] <reads-file> <out-file> [<right-out-file>]
+
+{help_option_spec}                      {help_option_description}
+{ver_option_spec}                   {ver_option_description}
+{log_option_spec}        {log_option_description}
+--paired-end                   Indicates the reads file contains paired-end reads.
+--left-mates                   Indicates the reads file contains paired-end reads, of which only left reads are output, as single-end reads.
+--seed=<seed>                  Seed for the random number generator; if not specified, reads are shuffled differently each time.
+--buffer-size=<buffer-size>    Approximate maximum memory, in megabytes, to use for holding reads; larger reads files are shuffled via temporary files [default: 1024].
+--min-reads=<min-reads>        Exit with an error if the reads file contains fewer than this number of reads [default: 0].
+--num-reads=<num-reads>        Number of reads to select for output; if not specified, all reads are output.
+--bias-model=<bias-model>      Model used to bias the selection of reads: one of "pwm", "gc" or "positional" (if not specified, but a PWM file is, "pwm").
+--bias-pwm=<pwm-file>          PWM file with positional base weights used to bias the selection of reads.
+--processes=<processes>        Number of processes among which chunks of the reads file are distributed for scoring, when a number of reads is selected [default: 1].
+<reads-file>                   FASTA/Q file containing single or paired end reads.
+<out-file>                     File to write shuffled reads to (for paired-end reads, left reads are written to this file); if the file name ends with ".gz", reads are gzip-compressed.
+<right-out-file>               For paired-end reads, file to write right reads to.
+"""
+
+import bias_models
+import docopt
+import itertools
+import numpy as np
+import options as opt
+import os.path
+import random
+import reads
+import schema
+
+from __init__ import __version__
+
+PAIRED_END = "--paired-end"
+LEFT_MATES = "--left-mates"
+SEED = "--seed"
+BUFFER_SIZE = "--buffer-size"
+MIN_READS = "--min-reads"
+NUM_READS = "--num-reads"
+BIAS_MODEL = "--bias-model"
+BIAS_PWM_FILE = "--bias-pwm"
+PROCESSES = "--processes"
+READS_FILE = "<reads-file>"
+OUT_FILE = "<out-file>"
+RIGHT_OUT_FILE = "<right-out-file>"
+
+SCORE_BATCH_SIZE = 100000
+
+
+def _validate_command_line_options(options):
+    try:
+        opt.validate_log_level(options)
+
+        options[SEED] = opt.validate_int_option(
+            options[SEED], "Seed must be non-negative",
+            nonneg=True, nullable=True)
+        options[BUFFER_SIZE] = opt.validate_int_option(
+            options[BUFFER_SIZE], "Buffer size must be non-negative",
+            nonneg=True)
+        options[MIN_READS] = opt.validate_int_option(
+            options[MIN_READS], "Minimum number of reads must be non-negative",
+            nonneg=True)
+        options[NUM_READS] = opt.validate_int_option(
+            options[NUM_READS], "Number of reads must be non-negative",
+            nonneg=True, nullable=True)
+        options[PROCESSES] = max(opt.validate_int_option(
+            options[PROCESSES], "Number of processes must be non-negative",
+            nonneg=True), 1)
+        if options[BIAS_MODEL] is not None:
+            opt.validate_list_option(
+                options[BIAS_MODEL], bias_models.BIAS_MODELS,
+                "Invalid bias model")
+        opt.validate_file_option(
+            options[BIAS_PWM_FILE], "PWM file should exist", nullable=True)
+        opt.validate_file_option(
+            options[READS_FILE], "Reads file should exist")
+    except schema.SchemaError as exc:
+        exit(exc.code)
+
+    if (options[BIAS_MODEL] is not None or
+            options[BIAS_PWM_FILE] is not None) and options[NUM_READS] is None:
+        exit("Number of reads must be specified to simulate bias")
+    if options[BIAS_MODEL] == bias_models.PWM_BIAS and \
+            options[BIAS_PWM_FILE] is None:
+        exit("A PWM file must be specified for PWM bias")
+    if options[PAIRED_END] and options[LEFT_MATES]:
+        exit("Only one of --paired-end and --left-mates may be specified")
+    if options[PAIRED_END] != (options[RIGHT_OUT_FILE] is not None):
+        exit("A right reads output file must be specified if, and only if, " +
+             "reads are paired-end")
+
+
+def _write_fragments(fragments, options):
+    if options[LEFT_MATES]:
+        with reads.writing_reads_file(options[OUT_FILE]) as out_f:
+            for fragment in fragments:
+                out_f.write(reads.split_fragment(fragment)[0])
+        return
+
+    if not options[PAIRED_END]:
+        with reads.writing_reads_file(options[OUT_FILE]) as out_f:
+            for fragment in fragments:
+                out_f.write(fragment)
+        return
+
+    with reads.writing_reads_file(options[OUT_FILE]) as left_f, \
+            reads.writing_reads_file(options[RIGHT_OUT_FILE]) as right_f:
+        for fragment in fragments:
+            left, right = reads.split_fragment(fragment)
+            left_f.write(left)
+            right_f.write(right)
+
+
+def _read_fragment_batches(reads_file, lines_per_fragment):
+    # Yield the number of the first fragment in each batch of fragments, and
+    # the batch
+    with open(reads_file) as in_f:
+        fragments = reads.read_fragments(in_f, lines_per_fragment)
+        first = 0
+        while True:
+            batch = list(itertools.islice(fragments, SCORE_BATCH_SIZE))
+            if not batch:
+                break
+            yield first, batch
+            first += len(batch)
+
+
+def _check_num_reads(logger, num_fragments, options):
+    reads_per_fragment = 2 if options[PAIRED_END] else 1
+    num_reads = num_fragments * reads_per_fragment
+    logger.info("...read {n} reads.".format(n=num_reads))
+
+    if num_reads < options[MIN_READS]:
+        exit("Exiting: {n} reads created, when {m} were required - try "
+             "increasing the number of molecules in the initial "
+             "transcript population.".format(
+                 n=num_reads, m=options[MIN_READS]))
+
+    if options[NUM_READS] is None:
+        return None
+
+    num_selected = options[NUM_READS] / reads_per_fragment
+    if num_selected > num_fragments:
+        exit("Input file did not contain enough fragments " +
+             "({ni} found, {no} required)".format(
+                 ni=num_fragments, no=num_selected))
+    return num_selected
+
+
+def _select_fragments(logger, options, lines_per_fragment):
+    # Score every fragment randomly - and, if bias is being simulated, in
+    # proportion to its weight under the bias model - retaining only the
+    # numbers of those which may be among the highest scoring, and return the
+    # numbers of the fragments selected. Chunks of the reads file, located
+    # via its fragment index, are scored in parallel; the index is not written
+    # alongside the reads file, since this may be a pool shared with other
+    # read sets.
+    reads_file = options[READS_FILE]
+    logger.info("Indexing fragments of " + reads_file)
+    index = reads.index_fragments(reads_file, lines_per_fragment)
+
+    logger.info("Scoring fragments from " + reads_file)
+    top_scoring = reads.score_fragments(
+        reads_file, index,
+        options[NUM_READS] / (2 if options[PAIRED_END] else 1),
+        lines_per_fragment,
+        2 if options[PAIRED_END] or options[LEFT_MATES] else 1,
+        bias_model=bias_models.get_bias_model(
+            options[BIAS_MODEL], options[BIAS_PWM_FILE]),
+        seed=options[SEED], processes=options[PROCESSES])
+
+    _check_num_reads(logger, top_scoring.num_fragments, options)
+    return top_scoring.selected(), top_scoring.num_fragments
+
+
+def _finalise_reads(logger, options):
+    reads_file = options[READS_FILE]
+    lines_per_fragment = reads.get_lines_per_fragment(
+        reads_file.endswith("fastq"),
+        options[PAIRED_END] or options[LEFT_MATES])
+    rng = random.Random(options[SEED])
+
+    # If a number of reads is to be selected, a first pass selects the
+    # highest-scoring fragments, so that only those fragments need then be
+    # shuffled
+    selected = None
+    size = None
+    if options[NUM_READS] is not None:
+        selected, num_fragments = \
+            _select_fragments(logger, options, lines_per_fragment)
+        size = os.path.getsize(reads_file) * len(selected) / \
+            max(num_fragments, 1)
+
+    # Temporary files are written alongside the output, since the reads file
+    # may be a pool shared with other read sets
+    with reads.shuffling_fragments(
+            reads_file, lines_per_fragment, seed=rng.getrandbits(64),
+            buffer_size=max(options[BUFFER_SIZE], 1) * 1024 * 1024,
+            temp_dir=os.path.dirname(os.path.abspath(options[OUT_FILE])),
+            size=size) as shuffler:
+
+        # Read (or re-read) fragments, distributing those selected for
+        # shuffling
+        logger.info("Reading fragments from " + reads_file)
+        next_selected = 0
+        for first, batch in \
+                _read_fragment_batches(reads_file, lines_per_fragment):
+            if selected is None:
+                for fragment in batch:
+                    shuffler.add(fragment)
+                continue
+            last_selected = np.searchsorted(selected, first + len(batch))
+            for number in selected[next_selected:last_selected]:
+                shuffler.add(batch[number - first])
+            next_selected = last_selected
+
+        if selected is None:
+            _check_num_reads(logger, shuffler.num_fragments, options)
+
+        # Write the (selected) fragments in random order, splitting
+        # paired-end fragments into left and right reads
+        logger.info("Writing shuffled reads")
+        _write_fragments(shuffler.shuffled(), options)
+
+
+if __name__ == "__main__":
+    # Read in command-line options
+    __doc__ = opt.substitute_common_options_into_usage(__doc__)
+    options = docopt.docopt(__doc__, version="finalise_reads v" + __version__)
+
+    # Validate command-line options
+    _validate_command_line_options(options)
+
+    # Set up logger
+    logger = opt.get_logger_for_options(options)
+
+    # Count, select, shuffle and split reads
+    try:
+        _finalise_reads(logger, options)
+    except (IOError, ValueError) as exc:
+        exit(str(exc))
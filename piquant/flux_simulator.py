@@ -4,6 +4,11 @@ Exports:
 
 read_expression_profiles: Return data from a FluxSimulator .pro file.
 write_flux_simulator_params_files: Write FluxSimulator parameters files.
+write_flux_simulator_library_params_files: Write FluxSimulator parameters
+files for a fragment library shared between read simulations.
+write_flux_simulator_shard_params_file: Write FluxSimulator parameters file
+for one of several concurrent read simulations.
+get_molecules_per_read: Return the number of molecules needed per read.
 
 PRO_FILE_TRANSCRIPT_ID_COL: Transcript ID column in FluxSimulator .pro file.
 PRO_FILE_LENGTH_COL: Transcript length column in FluxSimulator .pro file.
@@ -12,8 +17,13 @@ PRO_FILE_NUM_COL: Transcript count column in FluxSimulator .pro file.
 EXPRESSION_PARAMS_FILE: FluxSimulator expression parameters file name.
 EXPRESSION_PROFILE_FILE: FluxSimulator expression profile file name.
 SIMULATION_PARAMS_FILE: FluxSimulator simulation parameters file name.
+LIBRARY_PARAMS_FILE: FluxSimulator shared library parameters file name.
+LIBRARY_FILE: FluxSimulator shared fragment library file name.
 SIMULATED_READS_PREFIX: FluxSimulator reads FASTA file prefix.
 READ_NUMBER_PLACEHOLDER: Placeholder text for number of reads to simulate.
+COMPRESSED_READS_SUFFIX: Suffix of gzip-compressed reads files.
+TRUE_READ_COUNTS_FILE: Name of file of true per-transcript fragment counts.
+READ_ORIGINS_FILE: Name of file indexing the transcript of origin of each read.
 """
 
 import file_writer as fw
@@ -28,8 +38,13 @@ EXPRESSION_PARAMS_FILE = "flux_simulator_expression.par"
 EXPRESSION_PROFILE_FILE = EXPRESSION_PARAMS_FILE.replace("par", "pro")
 SIMULATION_PARAMS_FILE = "flux_simulator_simulation.par"
 SIMULATION_LIBRARY_FILE = SIMULATION_PARAMS_FILE.replace("par", "lib")
+LIBRARY_PARAMS_FILE = "flux_simulator_library.par"
+LIBRARY_FILE = LIBRARY_PARAMS_FILE.replace("par", "lib")
 SIMULATED_READS_PREFIX = "reads"
 READ_NUMBER_PLACEHOLDER = "READ_NUMBER_PLACEHOLDER"
+COMPRESSED_READS_SUFFIX = ".gz"
+TRUE_READ_COUNTS_FILE = "true_read_counts.csv"
+READ_ORIGINS_FILE = "read_origins.npz"
 TEMPORARY_DIRECTORY = "flux_simulator_tmp"
 
 _PRO_FILE_COLS = [
@@ -46,6 +61,7 @@ LEFT_READS = 'l'
 RIGHT_READS = 'r'
 
 _FRAGMENTS_PER_MOLECULE = 8.26
+_MOLECULE_HEADROOM = 1.25
 _ERROR_MODEL_LONG = 76
 
 
@@ -73,13 +89,35 @@ def _write_flux_simulator_expression_params(
         writer.add_vars(fs_params)
 
 
+def _write_flux_simulator_library_params(
+        transcript_gtf_file, genome_fasta_dir, num_molecules, output_dir):
+
+    fs_params = _get_common_flux_simulator_params(
+        transcript_gtf_file, genome_fasta_dir, num_molecules)
+
+    fs_params["PRO_FILE_NAME"] = EXPRESSION_PROFILE_FILE
+    fs_params["LIB_FILE_NAME"] = LIBRARY_FILE
+    fs_params["PCR_DISTRIBUTION"] = "none"
+
+    with fw.writing_to_file(fw.FluxSimulatorParamsWriter, output_dir,
+                            LIBRARY_PARAMS_FILE) as writer:
+        writer.add_vars(fs_params)
+
+
 def _write_flux_simulator_simulation_params(
         transcript_gtf_file, genome_fasta_dir, num_molecules,
-        read_length, paired_end, errors, output_dir):
+        read_length, paired_end, errors, output_dir, library_file,
+        seed=None):
 
     fs_params = _get_common_flux_simulator_params(
         transcript_gtf_file, genome_fasta_dir, num_molecules)
 
+    if library_file:
+        fs_params["LIB_FILE_NAME"] = library_file
+
+    if seed is not None:
+        fs_params["SEED"] = seed
+
     fs_params["SEQ_FILE_NAME"] = SIMULATED_READS_PREFIX + ".bed"
     fs_params["PRO_FILE_NAME"] = EXPRESSION_PROFILE_FILE
     fs_params["FASTA"] = "YES"
@@ -113,13 +151,15 @@ def read_expression_profiles(pro_file):
 
 def write_flux_simulator_params_files(
         transcript_gtf_file, genome_fasta_dir, num_molecules,
-        read_length, paired_end, errors, output_dir):
+        read_length, paired_end, errors, output_dir, library_file=None,
+        seed=None):
     """
     Write FluxSimulator expression and simulation parameters files.
 
     Write two FluxSimulator parameter files; the first will be used to simulate
     transcript abundances, and the second to simulate reads based on those
-    abundances.
+    abundances. If a shared fragment library is to be used, only the
+    simulation parameters file is written.
     transcript_gtf_file: Path to a GTF-formatted file describing the
     transcripts to be simulated.
     genome_fasta_dir: Path to a directory containing per-chromosome genome
@@ -130,16 +170,91 @@ def write_flux_simulator_params_files(
     errors: Whether reads should be simulated with errors or not.
     output_dir: Path to the directory into which parameter files should be
     written.
+    library_file: If not None, path to a shared fragment library from which
+    reads should be sequenced.
+    seed: If not None, seed for FluxSimulator's random number generator when
+    simulating reads.
+    """
+
+    if library_file is None:
+        _write_flux_simulator_expression_params(
+            transcript_gtf_file, genome_fasta_dir, num_molecules, output_dir)
+    _write_flux_simulator_simulation_params(
+        transcript_gtf_file, genome_fasta_dir, num_molecules,
+        read_length, paired_end, errors, output_dir, library_file, seed)
+
+
+def write_flux_simulator_library_params_files(
+        transcript_gtf_file, genome_fasta_dir, num_molecules, output_dir):
+    """
+    Write FluxSimulator parameters files for a shared fragment library.
+
+    Write two FluxSimulator parameter files; the first will be used to simulate
+    transcript abundances, and the second to create a library of fragments
+    from the transcript population, from which reads of any length, single- or
+    paired-end, may subsequently be sequenced.
+    transcript_gtf_file: Path to a GTF-formatted file describing the
+    transcripts to be simulated.
+    genome_fasta_dir: Path to a directory containing per-chromosome genome
+    sequences as FASTA files.
+    num_molecules: The number of molecules in the initial transcript
+    population.
+    output_dir: Path to the directory into which parameter files should be
+    written.
     """
 
     _write_flux_simulator_expression_params(
         transcript_gtf_file, genome_fasta_dir, num_molecules, output_dir)
+    _write_flux_simulator_library_params(
+        transcript_gtf_file, genome_fasta_dir, num_molecules, output_dir)
+
+
+def write_flux_simulator_shard_params_file(
+        transcript_gtf_file, genome_fasta_dir, num_molecules,
+        read_length, paired_end, errors, output_dir, seed,
+        library_file=None):
+    """
+    Write a FluxSimulator simulation parameters file for one shard.
+
+    Write a FluxSimulator parameter file used to simulate a share of the reads
+    required for a read simulation directory, when reads are simulated by
+    several concurrent FluxSimulator instances. Each instance must be given a
+    different seed, so that it simulates different reads; the expression
+    profile is copied into the output directory before reads are simulated.
+    transcript_gtf_file: Path to a GTF-formatted file describing the
+    transcripts to be simulated.
+    genome_fasta_dir: Path to a directory containing per-chromosome genome
+    sequences as FASTA files.
+    num_molecules: The number of molecules in the initial transcript
+    population.
+    paired_end: Whether single- or paired-end reads should be simulated.
+    errors: Whether reads should be simulated with errors or not.
+    output_dir: Path to the shard directory into which the parameter file
+    should be written.
+    seed: Seed for FluxSimulator's random number generator.
+    library_file: If not None, path to a shared fragment library from which
+    reads should be sequenced.
+    """
     _write_flux_simulator_simulation_params(
         transcript_gtf_file, genome_fasta_dir, num_molecules,
-        read_length, paired_end, errors, output_dir)
+        read_length, paired_end, errors, output_dir, library_file, seed)
+
+
+def get_molecules_per_read(paired_end):
+    """
+    Return the number of molecules needed per read to be simulated.
+
+    Return the approximate number of molecules required in the initial
+    transcript population for each read to be simulated, allowing some
+    headroom for variation in the number of fragments each molecule yields.
+    paired_end: Whether single- or paired-end reads are to be simulated.
+    """
+    reads_per_fragment = 2 if paired_end else 1
+    return _MOLECULE_HEADROOM / (_FRAGMENTS_PER_MOLECULE * reads_per_fragment)
 
 
-def get_reads_file(errors, paired_end=None, intermediate=False):
+def get_reads_file(errors, paired_end=None, intermediate=False,
+                   compressed=False):
     reads_file = SIMULATED_READS_PREFIX
     if not intermediate:
         reads_file += "_final"
@@ -147,4 +262,7 @@ def get_reads_file(errors, paired_end=None, intermediate=False):
         reads_file += ".1"
     if paired_end == RIGHT_READS:
         reads_file += ".2"
-    return reads_file + (".fastq" if errors else ".fasta")
+    reads_file += ".fastq" if errors else ".fasta"
+    if compressed:
+        reads_file += COMPRESSED_READS_SUFFIX
+    return reads_file
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""Usage:
+    index_read_origins [{log_option_spec}] <pro-file> <reads-file> <out-file>
+
+{help_option_spec}                 {help_option_description}
+{ver_option_spec}              {ver_option_description}
+{log_option_spec}   {log_option_description}
+<pro-file>                Flux Simulator gene expression profile file.
+<reads-file>              FASTA/Q file of simulated reads (or, for paired-end reads, of the left reads).
+<out-file>                File to which the index of read origins is written.
+"""
+
+import docopt
+import flux_simulator as fs
+import options as opt
+import reads
+import schema
+
+from __init__ import __version__
+
+PRO_FILE = "<pro-file>"
+READS_FILE = "<reads-file>"
+OUT_FILE = "<out-file>"
+
+
+def _validate_command_line_options(options):
+    try:
+        opt.validate_log_level(options)
+        opt.validate_file_option(
+            options[PRO_FILE], "Could not open expression profile file")
+        opt.validate_file_option(
+            options[READS_FILE], "Could not open reads file")
+    except schema.SchemaError as exc:
+        exit(exc.code)
+
+
+def _index_read_origins(logger, options):
+    logger.info("Reading expression profiles...")
+    transcript_ids = list(fs.read_expression_profiles(
+        options[PRO_FILE])[fs.PRO_FILE_TRANSCRIPT_ID_COL])
+
+    logger.info("Indexing transcripts of origin of reads in {f}...".format(
+        f=options[READS_FILE]))
+    read_origins = reads.index_read_origins(
+        options[READS_FILE], transcript_ids)
+
+    logger.info("Writing origins of {n} reads to {f}...".format(
+        n=len(read_origins.origins), f=options[OUT_FILE]))
+    read_origins.save(options[OUT_FILE])
+
+
+if __name__ == "__main__":
+    # Read in command-line options
+    __doc__ = opt.substitute_common_options_into_usage(__doc__)
+    options = docopt.docopt(
+        __doc__, version="index_read_origins v" + __version__)
+
+    # Validate command-line options
+    _validate_command_line_options(options)
+
+    # Set up logger
+    logger = opt.get_logger_for_options(options)
+
+    # Index the transcript from which each simulated read originated
+    try:
+        _index_read_origins(logger, options)
+    except (IOError, ValueError) as exc:
+        exit(str(exc))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""Usage:
+    inject_read_errors [{log_option_spec} --seed=<seed> --batch-size=<batch-size>] <reads-file> <out-file> [<right-reads-file> <right-out-file>]
+
+{help_option_spec}                      {help_option_description}
+{ver_option_spec}                   {ver_option_description}
+{log_option_spec}        {log_option_description}
+--seed=<seed>                  Seed for the random number generator; if not specified, different errors are added each time.
+--batch-size=<batch-size>      Number of reads given errors at a time [default: 100000].
+<reads-file>                   FASTA file containing error-free single-end reads, or left reads of paired-end reads.
+<out-file>                     FASTQ file to write (left) reads with errors to.
+<right-reads-file>             For paired-end reads, FASTA file containing error-free right reads.
+<right-out-file>               For paired-end reads, FASTQ file to write right reads with errors to.
+"""
+
+import docopt
+import options as opt
+import reads
+import schema
+
+from __init__ import __version__
+
+SEED = "--seed"
+BATCH_SIZE = "--batch-size"
+READS_FILE = "<reads-file>"
+OUT_FILE = "<out-file>"
+RIGHT_READS_FILE = "<right-reads-file>"
+RIGHT_OUT_FILE = "<right-out-file>"
+
+
+def _validate_command_line_options(options):
+    try:
+        opt.validate_log_level(options)
+
+        options[SEED] = opt.validate_int_option(
+            options[SEED], "Seed must be non-negative",
+            nonneg=True, nullable=True)
+        options[BATCH_SIZE] = max(opt.validate_int_option(
+            options[BATCH_SIZE], "Batch size must be non-negative",
+            nonneg=True), 1)
+        opt.validate_file_option(
+            options[READS_FILE], "Reads file should exist")
+        opt.validate_file_option(
+            options[RIGHT_READS_FILE], "Right reads file should exist",
+            nullable=True)
+    except schema.SchemaError as exc:
+        exit(exc.code)
+
+
+def _inject_read_errors(logger, options):
+    reads_files = [options[READS_FILE]]
+    out_files = [options[OUT_FILE]]
+    if options[RIGHT_READS_FILE] is not None:
+        reads_files.append(options[RIGHT_READS_FILE])
+        out_files.append(options[RIGHT_OUT_FILE])
+
+    # Left and right reads are given errors independently
+    for index, (reads_file, out_file) in enumerate(
+            zip(reads_files, out_files)):
+        logger.info("Adding errors to reads from " + reads_file)
+        seed = None if options[SEED] is None else options[SEED] + index
+        reads.inject_errors(reads_file, out_file, seed=seed,
+                            batch_size=options[BATCH_SIZE])
+
+
+if __name__ == "__main__":
+    # Read in command-line options
+    __doc__ = opt.substitute_common_options_into_usage(__doc__)
+    options = docopt.docopt(
+        __doc__, version="inject_read_errors v" + __version__)
+
+    # Validate command-line options
+    _validate_command_line_options(options)
+
+    # Set up logger
+    logger = opt.get_logger_for_options(options)
+
+    # Write reads with substitution errors, in a single pass over each file
+    try:
+        _inject_read_errors(logger, options)
+    except (IOError, ValueError) as exc:
+        exit(str(exc))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""Usage:
+    merge_reads [{log_option_spec} --seed=<seed>] <reads-file> <extra-reads-file> <out-file> [<right-reads-file> <right-extra-reads-file> <right-out-file>]
+
+{help_option_spec}                      {help_option_description}
+{ver_option_spec}                   {ver_option_description}
+{log_option_spec}        {log_option_description}
+--seed=<seed>                  Seed for the random number generator; if not specified, reads are merged in a different order each time.
+<reads-file>                   FASTA/Q file containing shuffled single-end reads, or left reads of paired-end reads.
+<extra-reads-file>             FASTA/Q file containing shuffled (left) reads to merge with these.
+<out-file>                     File to write merged (left) reads to.
+<right-reads-file>             For paired-end reads, FASTA/Q file containing right reads.
+<right-extra-reads-file>       For paired-end reads, FASTA/Q file containing right reads to merge with these.
+<right-out-file>               For paired-end reads, file to write merged right reads to.
+"""
+
+import docopt
+import options as opt
+import reads
+import schema
+
+from __init__ import __version__
+
+SEED = "--seed"
+READS_FILE = "<reads-file>"
+EXTRA_READS_FILE = "<extra-reads-file>"
+OUT_FILE = "<out-file>"
+RIGHT_READS_FILE = "<right-reads-file>"
+RIGHT_EXTRA_READS_FILE = "<right-extra-reads-file>"
+RIGHT_OUT_FILE = "<right-out-file>"
+
+
+def _validate_command_line_options(options):
+    try:
+        opt.validate_log_level(options)
+
+        options[SEED] = opt.validate_int_option(
+            options[SEED], "Seed must be non-negative",
+            nonneg=True, nullable=True)
+        opt.validate_file_option(
+            options[READS_FILE], "Reads file should exist")
+        opt.validate_file_option(
+            options[EXTRA_READS_FILE], "Extra reads file should exist")
+        opt.validate_file_option(
+            options[RIGHT_READS_FILE], "Right reads file should exist",
+            nullable=True)
+        opt.validate_file_option(
+            options[RIGHT_EXTRA_READS_FILE],
+            "Right extra reads file should exist", nullable=True)
+    except schema.SchemaError as exc:
+        exit(exc.code)
+
+
+def _merge_reads(logger, options):
+    reads_files = [options[READS_FILE]]
+    extra_reads_files = [options[EXTRA_READS_FILE]]
+    out_files = [options[OUT_FILE]]
+    if options[RIGHT_READS_FILE] is not None:
+        reads_files.append(options[RIGHT_READS_FILE])
+        extra_reads_files.append(options[RIGHT_EXTRA_READS_FILE])
+        out_files.append(options[RIGHT_OUT_FILE])
+
+    logger.info("Merging fragments from {f} and {e}".format(
+        f=", ".join(reads_files), e=", ".join(extra_reads_files)))
+    reads.merge_fragments(
+        reads_files, extra_reads_files, out_files, seed=options[SEED])
+
+
+if __name__ == "__main__":
+    # Read in command-line options
+    __doc__ = opt.substitute_common_options_into_usage(__doc__)
+    options = docopt.docopt(__doc__, version="merge_reads v" + __version__)
+
+    # Validate command-line options
+    _validate_command_line_options(options)
+
+    # Set up logger
+    logger = opt.get_logger_for_options(options)
+
+    # Merge two sets of shuffled reads in random order, keeping paired-end
+    # reads in step
+    try:
+        _merge_reads(logger, options)
+    except (IOError, ValueError) as exc:
+        exit(str(exc))
@@ -1,3 +1,4 @@
+import bias_model_names
 import itertools
 import options as opt
 import quantifiers
@@ -11,7 +12,7 @@ _RUN_PARAMETERS = []
 class _Parameter():
     def __init__(self, name, title, option_name, option_validator,
                  is_numeric=False, value_namer=None, file_namer=None,
-                 run_parameter=True):
+                 run_parameter=True, default=None):
 
         self.name = name
         self.title = title
@@ -21,6 +22,7 @@ class _Parameter():
         self.is_numeric = is_numeric
         self.value_namer = value_namer if value_namer else lambda x: x
         self.file_namer = file_namer if file_namer else self.value_namer
+        self.default = default
 
         _PARAMETERS.append(self)
         if run_parameter:
@@ -33,6 +35,28 @@ class _Parameter():
         return self.file_namer(value)
 
 
+def _validate_positive_int(int_option, msg):
+    value = opt.validate_int_option(int_option, msg, nonneg=True)
+    if value == 0:
+        raise schema.SchemaError(None, msg)
+    return value
+
+
+def _check_bias_value(bias_option):
+    # Besides True (for sequence bias simulated with a PWM) and False, the
+    # bias parameter may take the name of one of the other bias models
+    bias_option = str(bias_option)
+    if bias_option.lower() in [bias_model_names.GC_BIAS,
+                               bias_model_names.POSITIONAL_BIAS]:
+        return bias_option.lower()
+    return opt.check_boolean_value(bias_option)
+
+
+def _get_bias_name(bias, names):
+    # Bias values read back from statistics files may be strings
+    return names[_check_bias_value(bias)]
+
+
 TRANSCRIPT_GTF = _Parameter(
     "transcript_gtf", "Transcript GTF file", "--transcript-gtf",
     lambda x: opt.validate_file_option(
@@ -80,9 +104,24 @@ ERRORS = _Parameter(
 
 BIAS = _Parameter(
     "bias", "Bias", "--bias",
-    opt.check_boolean_value,
-    value_namer=lambda x: "with bias" if x else "no bias",
-    file_namer=lambda x: "bias" if x else "no_bias")
+    _check_bias_value,
+    value_namer=lambda x: _get_bias_name(x, {
+        False: "no bias", True: "with bias",
+        bias_model_names.GC_BIAS: "with GC bias",
+        bias_model_names.POSITIONAL_BIAS: "with positional bias"}),
+    file_namer=lambda x: _get_bias_name(x, {
+        False: "no_bias", True: "bias",
+        bias_model_names.GC_BIAS: "gc_bias",
+        bias_model_names.POSITIONAL_BIAS: "positional_bias"}))
+
+THREADS = _Parameter(
+    "threads", "Threads", "--threads",
+    lambda x: _validate_positive_int(
+        x, "Number of threads must be a positive integer"),
+    is_numeric=True,
+    value_namer=lambda x: "{t} threads".format(t=x),
+    file_namer=lambda x: "{t}t".format(t=x),
+    default=8)
 
 
 def get_run_parameters():
@@ -112,7 +151,9 @@ def validate_command_line_parameter_sets(
                 param_vals[param.name] = set(validated_vals) \
                     if param.run_parameter else validated_vals[0]
 
-        if param.name not in param_vals:
+        # Parameters with a default value need not be specified; they are
+        # then omitted from the parameter sets, and the default used
+        if param.name not in param_vals and param.default is None:
             raise schema.SchemaError(
                 None, param.title + " parameter values must be specified.")
 
@@ -120,10 +161,15 @@ def validate_command_line_parameter_sets(
 
 
 def get_file_name(**params):
+    # Parameters with a default value (i.e. the number of threads) are only
+    # named when they take a value other than the default, so that the names
+    # of runs are unchanged by the introduction of such parameters
     elements = []
     for param in _RUN_PARAMETERS:
         if param.name in params:
             value = params[param.name]
+            if param.default is not None and value == param.default:
+                continue
             elements.append(param.get_file_name_part(value))
     return "_".join(elements)
 
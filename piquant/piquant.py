@@ -1,14 +1,15 @@
 #!/usr/bin/env python
 
 """Usage:
-    piquant prepare_read_dirs [{log_option_spec} --out-dir=<out_dir> --num-molecules=<num-molecules> --nocleanup --params-file=<params-file> --read-length=<read-lengths> --read-depth=<read-depths> --paired-end=<paired-ends> --error=<errors> --bias=<biases> --transcript-gtf=<transcript-gtf-file> --genome-fasta=<genome-fasta-dir>]
+    piquant prepare_read_dirs [{log_option_spec} --out-dir=<out_dir> --num-molecules=<num-molecules> --auto-molecules --nocleanup --metrics-file=<metrics-file> --seed=<seed> --compress-reads --nested-depths --derived-reads --extend-depth=<depth> --shared-library --simulation-shards=<shards> --read-simulator=<simulator> --params-file=<params-file> --read-length=<read-lengths> --read-depth=<read-depths> --paired-end=<paired-ends> --error=<errors> --bias=<biases> --transcript-gtf=<transcript-gtf-file> --genome-fasta=<genome-fasta-dir>]
     piquant create_reads [{log_option_spec} --out-dir=<out_dir> --params-file=<params-file> --read-length=<read-lengths> --read-depth=<read-depths> --paired-end=<paired-ends> --error=<errors> --bias=<biases>]
-    piquant check_reads [{log_option_spec} --out-dir=<out_dir> --params-file=<params-file> --read-length=<read-lengths> --read-depth=<read-depths> --paired-end=<paired-ends> --error=<errors> --bias=<biases>]
-    piquant prepare_quant_dirs [{log_option_spec} --out-dir=<out-dir> --nocleanup --params-file=<params-file> --quant-method=<quant-methods> --read-length=<read-lengths> --read-depth=<read-depths> --paired-end=<paired-ends> --error=<errors> --bias=<biases> --transcript-gtf=<transcript-gtf-file> --genome-fasta=<genome-fasta-dir> --plot-format=<plot-format> --grouped-threshold=<threshold>]
-    piquant prequantify [{log_option_spec} --out-dir=<out-dir> --params-file=<params-file> --quant-method=<quant-methods> --read-length=<read-lengths> --read-depth=<read-depths> --paired-end=<paired-ends> --error=<errors> --bias=<biases>]
-    piquant quantify [{log_option_spec} --out-dir=<out-dir> --params-file=<params-file> --quant-method=<quant-methods> --read-length=<read-lengths> --read-depth=<read-depths> --paired-end=<paired-ends> --error=<errors> --bias=<biases>]
-    piquant check_quant [{log_option_spec} --out-dir=<out-dir> --params-file=<params-file> --quant-method=<quant-methods> --read-length=<read-lengths> --read-depth=<read-depths> --paired-end=<paired-ends> --error=<errors> --bias=<biases>]
-    piquant analyse_runs [{log_option_spec} --out-dir=<out-dir> --stats-dir=<stats-dir> --params-file=<params-file> --quant-method=<quant-methods> --read-length=<read-lengths> --read-depth=<read-depths> --paired-end=<paired-ends> --error=<errors> --bias=<biases> --plot-format=<plot-format>]
+    piquant check_reads [{log_option_spec} --out-dir=<out_dir> --compress-reads --params-file=<params-file> --read-length=<read-lengths> --read-depth=<read-depths> --paired-end=<paired-ends> --error=<errors> --bias=<biases>]
+    piquant prepare_quant_dirs [{log_option_spec} --out-dir=<out-dir> --nocleanup --metrics-file=<metrics-file> --compress-reads --params-file=<params-file> --quant-method=<quant-methods> --read-length=<read-lengths> --read-depth=<read-depths> --paired-end=<paired-ends> --error=<errors> --bias=<biases> --threads=<threads> --transcript-gtf=<transcript-gtf-file> --genome-fasta=<genome-fasta-dir> --plot-format=<plot-format> --grouped-threshold=<threshold> --assignment-precision]
+    piquant prequantify [{log_option_spec} --out-dir=<out-dir> --params-file=<params-file> --quant-method=<quant-methods> --read-length=<read-lengths> --read-depth=<read-depths> --paired-end=<paired-ends> --error=<errors> --bias=<biases> --threads=<threads>]
+    piquant quantify [{log_option_spec} --out-dir=<out-dir> --params-file=<params-file> --quant-method=<quant-methods> --read-length=<read-lengths> --read-depth=<read-depths> --paired-end=<paired-ends> --error=<errors> --bias=<biases> --threads=<threads>]
+    piquant check_quant [{log_option_spec} --out-dir=<out-dir> --params-file=<params-file> --quant-method=<quant-methods> --read-length=<read-lengths> --read-depth=<read-depths> --paired-end=<paired-ends> --error=<errors> --bias=<biases> --threads=<threads>]
+    piquant analyse_runs [{log_option_spec} --out-dir=<out-dir> --stats-dir=<stats-dir> --params-file=<params-file> --quant-method=<quant-methods> --read-length=<read-lengths> --read-depth=<read-depths> --paired-end=<paired-ends> --error=<errors> --bias=<biases> --threads=<threads> --plot-format=<plot-format>]
+    piquant trace_runs [{log_option_spec} --out-dir=<out-dir> --trace-file=<trace-file> --params-file=<params-file> --quant-method=<quant-methods> --read-length=<read-lengths> --read-depth=<read-depths> --paired-end=<paired-ends> --error=<errors> --bias=<biases> --threads=<threads>]
 
 Options:
 {help_option_spec}                                {help_option_description}
@@ -16,23 +17,38 @@ Options:
 {log_option_spec}                  {log_option_description}
 --out-dir=<out-dir>                      Parent output directory to which quantification run directories will be written [default: output].
 --stats-dir=<stats-dir>                  Directory to output assembled stats and graphs to [default: output/analysis].
+--trace-file=<trace-file>                File to write a timeline of read simulation and quantification runs to, in Chrome trace event format [default: output/piquant_trace.json].
 --num-molecules=<num-molecules>          Flux Simulator parameters will be set for simulation to start with this number of transcript molecules in the initial population [default: 30000000].
+--auto-molecules                         If specified, the number of transcript molecules in the initial population is set for each read simulation directory according to the number of reads to be simulated (unless a shared fragment library is used).
 --nocleanup                              If not specified, files non-essential for subsequent quantification (when creating reads) and assessing quantification accuracy (when quantifying) will be deleted.
+--metrics-file=<metrics-file>            If specified, run scripts will update this file with metrics describing the progress of all runs, in Prometheus text format.
+--compress-reads                         If specified, simulated reads are written to gzip-compressed files (this option must be given consistently when preparing read and quantification directories, and when checking reads).
+--nested-depths                          If specified, reads are simulated only for the highest read depth of each combination of other sequencing parameters; reads for lower depths are subsampled from these.
+--derived-reads                          If specified, reads are simulated only for paired-end (if these are required), unbiased (if these are required), error-free (if these are required) reads; single-end, biased and error-containing reads are derived from these, by taking left reads, by a biased selection of reads and by adding substitution errors respectively.
+--extend-depth=<depth>                   If specified, reads for read depths higher than this are not simulated afresh, but by extending the reads for this depth (which must already have been, or also be, prepared) with only the extra reads required.
+--shared-library                         If specified, Flux Simulator creates a single expression profile and library of fragments, which is shared by all read simulations; only the sequencing of reads is performed separately for each read length and end.
+--simulation-shards=<shards>             Number of Flux Simulator instances among which the simulation of reads for each read simulation directory is split; these run concurrently, with different seeds; when reads are simulated by piquant's own read simulator, this is instead the number of processes it uses [default: 1].
+--read-simulator=<simulator>             Simulator used to create reads from the Flux Simulator expression profile: "flux" for Flux Simulator, or "numpy" for piquant's own, faster, NumPy-based read simulator [default: flux].
+--seed=<seed>                            Seed for the random number generator used to shuffle simulated reads (if not specified, a seed is chosen at random for each read simulation run).
 -f --params-file=<params-file>           File containing specification of quantification methods, read-lengths, read-depths and end, error and bias parameter values to create reads for.
 -q --quant-method=<quant-methods>        Comma-separated list of quantification methods to run.
 -l --read-length=<read-lengths>          Comma-separated list of read-lengths to perform quantification for.
 -d --read-depth=<read-depths>            Comma-separated list of read-depths to perform quantification for.
 -p --paired-end=<paired-ends>            Comma-separated list of True/False strings indicating whether quantification should be performed for single or paired-end reads.
 -e --error=<errors>                      Comma-separated list of True/False strings indicating whether quantification should be performed with or without read errors.
--b --bias=<biases>                       Comma-separated list of True/False strings indicating whether quantification should be performed with or without read sequence bias.
+-b --bias=<biases>                       Comma-separated list of True/False strings indicating whether quantification should be performed with or without read sequence bias; "gc" or "positional" may also be given, for reads with GC-content or positional (3') coverage bias.
+-t --threads=<threads>                   Comma-separated list of numbers of threads quantification tools should use (if not specified, 8 threads are used).
 --transcript-gtf=<transcript-gtf-file>   GTF formatted file describing the transcripts to be simulated.
 --genome-fasta=<genome-fasta-dir>        Directory containing per-chromosome sequences as FASTA files.
 --plot-format=<plot-format>              Output format for graphs (one of {plot_formats}) [default: pdf].
 --grouped-threshold=<threshold>          Minimum number of data points required for a group of transcripts to be shown on a plot [default: 300].
+--assignment-precision                   If specified, quantification tools able to do so (RSEM and eXpress) record a sampled assignment of each read to a transcript, and the precision of these assignments is assessed.
 """
 
 import docopt
 import flux_simulator as fs
+import hashlib
+import json
 import options as opt
 import os
 import os.path
@@ -44,7 +60,9 @@ import prepare_quantification_run as prq
 import prepare_read_simulation as prs
 import process
 import schema
+import run_log
 import statistics
+import sweep_trace
 import sys
 import time
 
@@ -66,6 +84,24 @@ def _get_parameters_dir(options, **params):
                         parameters.get_file_name(**params))
 
 
+def _get_reads_params(params):
+    """
+    Return the parameters describing a reads directory.
+
+    Return a copy of a dictionary of run parameters, from which those
+    parameters relevant only to quantification (i.e. the quantification method
+    and number of threads) have been removed.
+
+    params: A dictionary mapping from parameters._Parameter instances to
+    parameter values.
+    """
+    reads_params = dict(params)
+    for param in [parameters.QUANT_METHOD, parameters.THREADS]:
+        if param.name in reads_params:
+            del reads_params[param.name]
+    return reads_params
+
+
 def _reads_directory_checker(should_exist):
     """
     Return a function checking the existence of a reads directory.
@@ -78,11 +114,7 @@ def _reads_directory_checker(should_exist):
     will exit if the reads or quantification directory does already exist.
     """
     def check_reads_directory(logger, options, **params):
-        params = dict(params)
-        if parameters.QUANT_METHOD.name in params:
-            del params[parameters.QUANT_METHOD.name]
-
-        reads_dir = _get_parameters_dir(options, **params)
+        reads_dir = _get_parameters_dir(options, **_get_reads_params(params))
         if should_exist != os.path.exists(reads_dir):
             sys.exit("Reads directory '{d}' should {n}already exist.".
                      format(d=reads_dir, n=("" if should_exist else "not ")))
@@ -90,6 +122,53 @@ def _reads_directory_checker(should_exist):
     return check_reads_directory
 
 
+def _get_library_dir(options, **params):
+    # A shared fragment library is specific to the transcript annotation,
+    # genome, initial number of molecules and seed, so that read simulation
+    # runs with different seeds remain independent
+    library_key = "|".join([
+        os.path.abspath(params[parameters.TRANSCRIPT_GTF.name]),
+        os.path.abspath(params[parameters.GENOME_FASTA_DIR.name]),
+        str(params[parameters.NUM_MOLECULES.name]),
+        str(options[po.SEED])])
+    return os.path.join(
+        options[po.OUTPUT_DIRECTORY],
+        "flux_library_" + hashlib.md5(library_key).hexdigest()[:8])
+
+
+def _get_run_params(params):
+    return {p.name: params[p.name] for p in parameters.get_run_parameters()
+            if p.name in params}
+
+
+def _get_derived_reads_source_params(derived_reads, **params):
+    # Reads are simulated for paired-end reads if any are required (since
+    # single-end reads can be derived from these), and for unbiased reads if
+    # any are required (since biased reads can be selected from these)
+    source_params = dict(params)
+    source_params[parameters.PAIRED_END.name] = \
+        max(derived_reads[parameters.PAIRED_END.name])
+    if False in derived_reads[parameters.BIAS.name]:
+        source_params[parameters.BIAS.name] = False
+    return source_params
+
+
+def _get_reads_pool_factor(derived_reads, **params):
+    # Simulated reads from which others are derived form a pool large enough
+    # to select the reads for each derived read set: twice as many fragments
+    # are needed to take single-end reads from paired-end fragments, and
+    # twice as many again to make a biased selection of reads
+    pool_factor = 1
+    if derived_reads:
+        if params[parameters.PAIRED_END.name] and \
+                False in derived_reads[parameters.PAIRED_END.name]:
+            pool_factor *= 2
+        if not params[parameters.BIAS.name] and \
+                any(derived_reads[parameters.BIAS.name]):
+            pool_factor *= 2
+    return pool_factor
+
+
 def _prepare_read_simulation(logger, options, **params):
     """
     Write bash script and support files to perform RNA-seq read simulation.
@@ -106,8 +185,82 @@ def _prepare_read_simulation(logger, options, **params):
     performed.
     """
     reads_dir = _get_parameters_dir(options, **params)
+
+    # In nested depth mode, reads for all but the highest depth are
+    # subsampled from those simulated for the highest depth
+    nested_depth = options[po.NESTED_DEPTHS]
+    if nested_depth and params[parameters.READ_DEPTH.name] != nested_depth:
+        source_params = dict(params)
+        source_params[parameters.READ_DEPTH.name] = nested_depth
+        prs.create_subsampling_files(
+            reads_dir, _get_parameters_dir(options, **source_params),
+            metrics_file=options[po.METRICS_FILE], seed=options[po.SEED],
+            compress_reads=options[po.COMPRESS_READS],
+            **_get_run_params(params))
+        return
+
+    # In derived reads mode, reads with errors are derived by adding errors to
+    # the error-free reads for the same other parameters, while single-end
+    # and biased reads are derived from the paired-end and unbiased reads
+    # simulated for the same read length, depth and errors
+    derived_reads = options[po.DERIVED_READS]
+    if derived_reads and params[parameters.ERRORS.name] and \
+            False in derived_reads[parameters.ERRORS.name]:
+        source_params = dict(params)
+        source_params[parameters.ERRORS.name] = False
+        prs.create_error_injection_files(
+            reads_dir, _get_parameters_dir(options, **source_params),
+            metrics_file=options[po.METRICS_FILE], seed=options[po.SEED],
+            compress_reads=options[po.COMPRESS_READS],
+            **_get_run_params(params))
+        return
+
+    if derived_reads:
+        source_params = _get_derived_reads_source_params(
+            derived_reads, **params)
+        if source_params != params:
+            left_mates = params[parameters.PAIRED_END.name] != \
+                source_params[parameters.PAIRED_END.name]
+            prs.create_derivation_files(
+                reads_dir, _get_parameters_dir(options, **source_params),
+                left_mates, metrics_file=options[po.METRICS_FILE],
+                seed=options[po.SEED],
+                compress_reads=options[po.COMPRESS_READS],
+                **_get_run_params(params))
+            return
+
+    # In extended depth mode, reads for depths higher than that extended are
+    # simulated only in addition to those for that depth, from the same
+    # expression profile, and merged with them
+    extend_depth = options[po.EXTEND_DEPTH]
+    source_reads_dir = None
+    if extend_depth and params[parameters.READ_DEPTH.name] > extend_depth:
+        source_params = dict(params)
+        source_params[parameters.READ_DEPTH.name] = extend_depth
+        source_reads_dir = _get_parameters_dir(options, **source_params)
+
+    # When a shared fragment library is used, the directory in which it will
+    # be created is prepared along with the first read simulation directory
+    # to use it; extended reads cannot be simulated from a shared library
+    library_dir = None
+    if options[po.SHARED_LIBRARY] and source_reads_dir is None:
+        library_dir = _get_library_dir(options, **params)
+        if not os.path.exists(library_dir):
+            prs.create_library_files(
+                library_dir, metrics_file=options[po.METRICS_FILE],
+                transcript_gtf=params[parameters.TRANSCRIPT_GTF.name],
+                genome_fasta=params[parameters.GENOME_FASTA_DIR.name],
+                num_molecules=params[parameters.NUM_MOLECULES.name])
+
     cleanup = not options[po.NO_CLEANUP]
-    prs.create_simulation_files(reads_dir, cleanup, **params)
+    prs.create_simulation_files(
+        reads_dir, cleanup, metrics_file=options[po.METRICS_FILE],
+        seed=options[po.SEED], compress_reads=options[po.COMPRESS_READS],
+        pool_factor=_get_reads_pool_factor(derived_reads, **params),
+        library_dir=library_dir, num_shards=options[po.SIMULATION_SHARDS],
+        auto_molecules=options[po.AUTO_MOLECULES],
+        read_simulator=options[po.READ_SIMULATOR],
+        source_reads_dir=source_reads_dir, **params)
 
 
 def _create_reads(logger, options, **params):
@@ -120,11 +273,23 @@ def _check_reads_created(logger, options, **params):
     reads_file = fs.get_reads_file(
         params[parameters.ERRORS.name],
         paired_end=(fs.LEFT_READS if params[parameters.PAIRED_END.name]
-                    else None))
+                    else None),
+        compressed=options[po.COMPRESS_READS])
 
+    run_name = os.path.basename(reads_dir)
     if not os.path.exists(os.path.join(reads_dir, reads_file)):
-        run_name = os.path.basename(reads_dir)
         logger.error("Run " + run_name + " did not complete.")
+        return
+
+    # The statistics recorded when the reads were scanned at the end of the
+    # run describe any problems found in them
+    stats_file = os.path.join(reads_dir, prs.READS_STATS_FILE)
+    if os.path.exists(stats_file):
+        with open(stats_file) as f:
+            stats = json.load(f)
+        if not stats["valid"]:
+            logger.error("Run " + run_name + " has invalid reads: " +
+                         "; ".join(stats["errors"]))
 
 
 def _run_directory_checker(should_exist):
@@ -158,9 +323,7 @@ def _prepare_quantification(logger, options, **params):
     """
     run_dir = _get_parameters_dir(options, **params)
 
-    reads_params = dict(params)
-    del reads_params[parameters.QUANT_METHOD.name]
-    reads_dir = _get_parameters_dir(options, **reads_params)
+    reads_dir = _get_parameters_dir(options, **_get_reads_params(params))
 
     prq.write_run_quantification_script(reads_dir, run_dir, options, **params)
 
@@ -213,11 +376,42 @@ class _StatsAccumulator:
         self.overall_stats_df = self.overall_stats_df.append(stats_df)
 
     def _write_stats(self):
+        stats_df = self.overall_stats_df
+        if not self.stratified_stats_type:
+            # Compare the wall clock time of runs differing only in the
+            # number of threads used
+            stats_df = statistics.add_scaling_statistics(
+                stats_df, parameters.THREADS.name,
+                [p.name for p in parameters.get_run_parameters()
+                 if p != parameters.THREADS])
+
         overall_stats_file = statistics.get_stats_file(
             options[po.STATS_DIRECTORY], statistics.OVERALL_STATS_PREFIX,
             **self.stratified_stats_type)
         statistics.write_stats_data(
-            overall_stats_file, self.overall_stats_df, index=False)
+            overall_stats_file, stats_df, index=False)
+
+
+class _RunLogAccumulator:
+    def __init__(self):
+        self.run_logs = {}
+
+    def __call__(self, logger, options, **params):
+        reads_params = _get_reads_params(params)
+        for run_dir in [_get_parameters_dir(options, **reads_params),
+                        _get_parameters_dir(options, **params)]:
+            if run_dir not in self.run_logs:
+                self.run_logs[run_dir] = run_log.read_run_log(run_dir)
+
+    def _write_trace(self, logger, trace_file):
+        run_logs = [log for run_dir, log in sorted(self.run_logs.items())
+                    if log is not None]
+        logger.info("Writing trace of {n} runs to {f}".format(
+            n=len(run_logs), f=trace_file))
+        sweep_trace.write_trace(trace_file, run_logs)
+
+
+_RUN_LOG_ACCUMULATOR = _RunLogAccumulator()
 
 
 def _get_executables_for_commands():
@@ -240,6 +434,8 @@ def _get_executables_for_commands():
     execs[po.ANALYSE_RUNS] = \
         [_run_directory_checker(True)] + \
         [_StatsAccumulator(t) for t in statistics.get_stratified_stats_types()]
+    execs[po.TRACE_RUNS] = \
+        [_RUN_LOG_ACCUMULATOR]
     return execs
 
 
@@ -309,6 +505,8 @@ def _run_piquant_command(logger, options):
 
     if piquant_command == po.ANALYSE_RUNS:
         _analyse_runs()
+    elif piquant_command == po.TRACE_RUNS:
+        _RUN_LOG_ACCUMULATOR._write_trace(logger, options[po.TRACE_FILE])
 
 
 if __name__ == "__main__":
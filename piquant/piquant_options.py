@@ -2,13 +2,27 @@ import options as opt
 import os.path
 import parameters
 import plot
+import prepare_read_simulation as prs
+import schema
 
 OUTPUT_DIRECTORY = "--out-dir"
 STATS_DIRECTORY = "--stats-dir"
 NO_CLEANUP = "--nocleanup"
+METRICS_FILE = "--metrics-file"
+TRACE_FILE = "--trace-file"
+SEED = "--seed"
+COMPRESS_READS = "--compress-reads"
+NESTED_DEPTHS = "--nested-depths"
+DERIVED_READS = "--derived-reads"
+EXTEND_DEPTH = "--extend-depth"
+SHARED_LIBRARY = "--shared-library"
+SIMULATION_SHARDS = "--simulation-shards"
+AUTO_MOLECULES = "--auto-molecules"
+READ_SIMULATOR = "--read-simulator"
 PARAMS_FILE = "--params-file"
 PLOT_FORMAT = "--plot-format"
 GROUPED_THRESHOLD = "--grouped-threshold"
+ASSIGNMENT_PRECISION = "--assignment-precision"
 
 # commands
 PREPARE_READ_DIRS = "prepare_read_dirs"
@@ -19,6 +33,7 @@ PREQUANTIFY = "prequantify"
 QUANTIFY = "quantify"
 CHECK_QUANTIFICATION = "check_quant"
 ANALYSE_RUNS = "analyse_runs"
+TRACE_RUNS = "trace_runs"
 
 
 def validate_command_line_options(options):
@@ -33,10 +48,40 @@ def validate_command_line_options(options):
         "Parameter specification file should exist",
         nullable=True)
 
+    if options[METRICS_FILE] is not None:
+        options[METRICS_FILE] = os.path.abspath(options[METRICS_FILE])
+        opt.validate_dir_option(
+            os.path.dirname(options[METRICS_FILE]),
+            "Metrics file directory does not exist")
+
+    options[SEED] = opt.validate_int_option(
+        options[SEED], "Seed must be non-negative", nonneg=True, nullable=True)
+    options[SIMULATION_SHARDS] = max(opt.validate_int_option(
+        options[SIMULATION_SHARDS],
+        "Number of simulation shards must be non-negative", nonneg=True), 1)
+    options[EXTEND_DEPTH] = opt.validate_int_option(
+        options[EXTEND_DEPTH], "Read depth to extend must be non-negative",
+        nonneg=True, nullable=True)
+    if options[EXTEND_DEPTH] is not None and \
+            (options[NESTED_DEPTHS] or options[DERIVED_READS]):
+        raise schema.SchemaError(
+            None, "Reads cannot be extended in nested depths or " +
+            "derived reads mode")
+    opt.validate_list_option(
+        options[READ_SIMULATOR], prs.READ_SIMULATORS,
+        "Invalid read simulator")
+
+    if options[TRACE_RUNS]:
+        options[TRACE_FILE] = os.path.abspath(options[TRACE_FILE])
+        opt.validate_dir_option(
+            os.path.dirname(options[TRACE_FILE]),
+            "Trace file directory does not exist")
+
     processing_reads = options[PREPARE_READ_DIRS] or \
         options[CREATE_READS] or options[CHECK_READS]
 
-    ignore_params = [parameters.QUANT_METHOD] if processing_reads else []
+    ignore_params = [parameters.QUANT_METHOD, parameters.THREADS] \
+        if processing_reads else []
 
     if not (options[PREPARE_READ_DIRS] or options[PREPARE_QUANT_DIRS]):
         ignore_params += [parameters.TRANSCRIPT_GTF,
@@ -48,6 +93,21 @@ def validate_command_line_options(options):
     param_values = parameters.validate_command_line_parameter_sets(
         options[PARAMS_FILE], options, ignore_params=ignore_params)
 
+    # In nested depth mode, the highest read depth is recorded as that for
+    # which reads are simulated
+    if options[NESTED_DEPTHS]:
+        options[NESTED_DEPTHS] = max(
+            param_values[parameters.READ_DEPTH.name])
+
+    # In derived reads mode, the end, error and bias parameter values swept
+    # over are recorded, so that the root read sets from which others are
+    # derived can be determined
+    if options[DERIVED_READS]:
+        options[DERIVED_READS] = {
+            param.name: set(param_values[param.name])
+            for param in [parameters.PAIRED_END, parameters.ERRORS,
+                          parameters.BIAS]}
+
     opt.validate_list_option(
         options[PLOT_FORMAT], plot.PLOT_FORMATS, "Invalid plot format")
     options[GROUPED_THRESHOLD] = opt.validate_int_option(
@@ -371,6 +371,13 @@ def draw_overall_stats_graphs(fformat, stats_dir, overall_stats, param_values):
     numerical_params = \
         [p for p in parameters.get_run_parameters() if p.is_numeric]
 
+    # Running time statistics are only available for those runs whose run
+    # scripts logged the wall clock time taken by quantification
+    graphed_stats = statistics.get_graphable_statistics() | \
+        set([s for s in statistics.get_timing_statistics()
+             if s.name in overall_stats and
+             overall_stats[s.name].notnull().any()])
+
     for param in _get_non_degenerate_params(
             parameters.get_run_parameters(), param_values):
 
@@ -394,7 +401,7 @@ def draw_overall_stats_graphs(fformat, stats_dir, overall_stats, param_values):
                 stats_df, fixed_param_values = _get_stats_for_fixed_params(
                     overall_stats, fixed_params, fp_values_set)
 
-                for stat in statistics.get_graphable_statistics():
+                for stat in graphed_stats:
                     statistic_dir = _get_plot_subdirectory(
                         num_param_stats_dir, stat.name)
 
@@ -4,6 +4,8 @@ import quantifiers as qs
 import os.path
 import parameters
 import piquant_options as po
+import run_log
+import worker
 
 RUN_SCRIPT = "run_quantification.sh"
 
@@ -11,6 +13,7 @@ TRANSCRIPT_COUNTS_SCRIPT = "count_transcripts_for_genes.py"
 UNIQUE_SEQUENCE_SCRIPT = "calculate_unique_transcript_sequence.py"
 ASSEMBLE_DATA_SCRIPT = "assemble_quantification_data.py"
 ANALYSE_DATA_SCRIPT = "analyse_quantification_run.py"
+COUNT_READ_ASSIGNMENTS_SCRIPT = "count_read_assignments.py"
 
 RUN_PREQUANTIFICATION_VARIABLE = "RUN_PREQUANTIFICATION"
 QUANTIFY_TRANSCRIPTS_VARIABLE = "QUANTIFY_TRANSCRIPTS"
@@ -19,6 +22,7 @@ ANALYSE_RESULTS_VARIABLE = "ANALYSE_RESULTS"
 TPMS_FILE = "tpms.csv"
 TRANSCRIPT_COUNTS_FILE = "transcript_counts.csv"
 UNIQUE_SEQUENCE_FILE = "unique_sequence.csv"
+READ_ASSIGNMENTS_FILE = "read_assignments.csv"
 
 
 def _get_script_path(script_name):
@@ -26,6 +30,11 @@ def _get_script_path(script_name):
         os.path.abspath(os.path.dirname(__file__)), script_name)
 
 
+def _get_script_command(script_name):
+    # Support scripts are run via the persistent worker, if it is running
+    return worker.get_script_command(_get_script_path(script_name))
+
+
 def _get_transcript_counts_file(quantifier_dir):
     return os.path.join(quantifier_dir, TRANSCRIPT_COUNTS_FILE)
 
@@ -38,28 +47,73 @@ def _add_run_prequantification(
         writer, quant_method, quant_params,
         quantifier_dir, transcript_gtf_file):
 
-    with writer.if_block("-n \"$RUN_PREQUANTIFICATION\""):
-        # Perform preparatory tasks required by a particular quantification
-        # method prior to calculating abundances; for example, this might
-        # include mapping reads to the genome with TopHat
-        quant_method.write_preparatory_commands(writer, quant_params)
-        with writer.section():
-            _add_calculate_transcripts_per_gene(
-                writer, quantifier_dir, transcript_gtf_file)
+    with writer.if_block("-n \"$RUN_PREQUANTIFICATION\""), \
+            run_log.logged_step(writer, "prequant"):
+        # Transcript counts and unique sequence lengths are written to the
+        # quantifier directory, which must therefore exist before the
+        # following tasks are started
         with writer.section():
-            _add_calculate_unique_sequence_length(
-                writer, quantifier_dir, transcript_gtf_file)
-
-
-def _add_quantify_transcripts(writer, quant_method, quant_params, cleanup):
+            writer.add_line("mkdir -p " + quantifier_dir)
+
+        with writer.parallel_section():
+            # The following tasks are independent of each other, and so are
+            # executed concurrently.
+            with writer.section(), writer.background_job():
+                # Perform preparatory tasks required by a particular
+                # quantification method prior to calculating abundances; for
+                # example, this might include building a transcript index
+                quant_method.write_preparatory_commands(writer, quant_params)
+            with writer.section(), writer.background_job():
+                _add_calculate_transcripts_per_gene(
+                    writer, quantifier_dir, transcript_gtf_file)
+            with writer.section(), writer.background_job():
+                _add_calculate_unique_sequence_length(
+                    writer, quantifier_dir, transcript_gtf_file)
+
+
+def _add_count_read_assignments(
+        writer, reads_dir, quant_method, assignment_precision):
+    # If requested, the transcript to which the quantification method
+    # assigned each read is compared with the transcript the read originated
+    # from, if the method records sampled assignments and the origins of the
+    # reads were indexed
+    alignments_file = quant_method.get_read_alignments_file()
+    if not assignment_precision or alignments_file is None:
+        return
+
+    sampled_tag = quant_method.get_sampled_alignment_tag()
+
+    origins_file = os.path.join(reads_dir, fs.READ_ORIGINS_FILE)
+    with writer.section(), writer.if_block("-f " + origins_file), \
+            run_log.logged_step(writer, "assignments"):
+        writer.add_comment(
+            ("Count the reads {method} assigned to each transcript, and " +
+             "assigned correctly.").format(method=quant_method))
+        writer.add_line(
+            "{command} {tag}{pro} {origins} {alignments} > {out}".format(
+                command=_get_script_command(COUNT_READ_ASSIGNMENTS_SCRIPT),
+                tag="" if sampled_tag is None else
+                "--sampled-tag=" + sampled_tag + " ",
+                pro=os.path.join(reads_dir, fs.EXPRESSION_PROFILE_FILE),
+                origins=origins_file,
+                alignments=alignments_file,
+                out=READ_ASSIGNMENTS_FILE))
+
+
+def _add_quantify_transcripts(
+        writer, reads_dir, quant_method, quant_params, cleanup):
     # Use the specified quantification method to calculate per-transcript TPMs
     with writer.if_block("-n \"$QUANTIFY_TRANSCRIPTS\""):
-        with writer.section():
+        with writer.section(), run_log.logged_step(writer, "quant"):
             writer.add_comment(
                 "Use {method} to calculate per-transcript TPMs.".format(
                     method=quant_method))
             quant_method.write_quantification_commands(writer, quant_params)
 
+        _add_count_read_assignments(
+            writer, reads_dir, quant_method,
+            quant_params[qs.SAMPLED_ASSIGNMENTS])
+
         if cleanup:
             writer.add_comment(
                 "Remove files not necessary for analysis of quantification.")
@@ -75,7 +129,7 @@ def _add_calculate_transcripts_per_gene(
     counts_file = _get_transcript_counts_file(quantifier_dir)
     with writer.if_block("! -f " + counts_file):
         writer.add_line("{command} {transcript_gtf} > {counts_file}".format(
-            command=_get_script_path(TRANSCRIPT_COUNTS_SCRIPT),
+            command=_get_script_command(TRANSCRIPT_COUNTS_SCRIPT),
             transcript_gtf=transcript_gtf_file,
             counts_file=counts_file))
 
@@ -92,7 +146,7 @@ def _add_calculate_unique_sequence_length(
     with writer.if_block("! -f " + unique_seq_file):
         writer.add_line(
             "{command} {transcript_gtf} > {unique_seq_file}".format(
-                command=_get_script_path(UNIQUE_SEQUENCE_SCRIPT),
+                command=_get_script_command(UNIQUE_SEQUENCE_SCRIPT),
                 transcript_gtf=transcript_gtf_file,
                 unique_seq_file=unique_seq_file))
 
@@ -106,12 +160,19 @@ def _add_assemble_quantification_data(
         "Assemble data required for analysis of quantification performance " +
         "into one file")
 
+    # True per-transcript fragment counts, from the reads directory, are
+    # included if they were recorded when reads were simulated
     writer.add_line(
-        ("{command} --method={method} --out={out_file} {fs_pro_file} " +
+        ("{command} --method={method} --out={out_file} " +
+         "--true-counts={true_counts_file} " +
+         "--read-assignments={read_assignments_file} {fs_pro_file} " +
          "{counts_file} {unique_seq_file}").format(
-            command=_get_script_path(ASSEMBLE_DATA_SCRIPT),
+            command=_get_script_command(ASSEMBLE_DATA_SCRIPT),
             method=quant_method,
             out_file=TPMS_FILE,
+            true_counts_file=os.path.join(
+                os.path.dirname(fs_pro_file), fs.TRUE_READ_COUNTS_FILE),
+            read_assignments_file=READ_ASSIGNMENTS_FILE,
             fs_pro_file=fs_pro_file,
             counts_file=_get_transcript_counts_file(quantifier_dir),
             unique_seq_file=_get_unique_sequence_file(quantifier_dir)))
@@ -136,7 +197,7 @@ def _add_analyse_quantification_results(
         ("{command} --plot-format={format} " +
          "--grouped-threshold={gp_threshold} {params_spec} " +
          "{tpms_file} {output_basename}").format(
-            command=_get_script_path(ANALYSE_DATA_SCRIPT),
+            command=_get_script_command(ANALYSE_DATA_SCRIPT),
             format=piquant_options[po.PLOT_FORMAT],
             gp_threshold=piquant_options[po.GROUPED_THRESHOLD],
             params_spec=params_spec,
@@ -168,41 +229,50 @@ def _add_process_command_line_options(writer):
 
 def _add_analyse_results(
         writer, reads_dir, run_dir, quantifier_dir, piquant_options,
-        quant_method, read_length, read_depth, paired_end, errors, bias):
+        quant_method, read_length, read_depth, paired_end, errors, bias,
+        threads):
 
     fs_pro_file = os.path.join(reads_dir, fs.EXPRESSION_PROFILE_FILE)
 
     with writer.if_block("-n \"$ANALYSE_RESULTS\""):
-        with writer.section():
+        with writer.section(), run_log.logged_step(writer, "assemble"):
             _add_assemble_quantification_data(
                 writer, quantifier_dir, fs_pro_file, quant_method)
-        _add_analyse_quantification_results(
-            writer, run_dir, piquant_options,
-            quant_method=quant_method,
-            read_length=read_length, read_depth=read_depth,
-            paired_end=paired_end, errors=errors, bias=bias)
+        with run_log.logged_step(writer, "analyse"):
+            _add_analyse_quantification_results(
+                writer, run_dir, piquant_options,
+                quant_method=quant_method,
+                read_length=read_length, read_depth=read_depth,
+                paired_end=paired_end, errors=errors, bias=bias,
+                threads=threads)
 
 
 def _get_quant_params(reads_dir, quantifier_dir, transcript_gtf,
-                      genome_fasta, paired_end, errors):
+                      genome_fasta, paired_end, errors, threads,
+                      compress_reads, assignment_precision):
 
     quant_params = {
         qs.TRANSCRIPT_GTF_FILE: transcript_gtf,
         qs.GENOME_FASTA_DIR: genome_fasta,
         qs.QUANTIFIER_DIRECTORY: quantifier_dir,
-        qs.FASTQ_READS: errors
+        qs.FASTQ_READS: errors,
+        qs.NUM_THREADS: threads,
+        qs.SAMPLED_ASSIGNMENTS: assignment_precision
     }
 
     if paired_end:
         quant_params[qs.LEFT_SIMULATED_READS] = \
             os.path.join(reads_dir,
-                         fs.get_reads_file(errors, paired_end=fs.LEFT_READS))
+                         fs.get_reads_file(errors, paired_end=fs.LEFT_READS,
+                                           compressed=compress_reads))
         quant_params[qs.RIGHT_SIMULATED_READS] = \
             os.path.join(reads_dir,
-                         fs.get_reads_file(errors, paired_end=fs.RIGHT_READS))
+                         fs.get_reads_file(errors, paired_end=fs.RIGHT_READS,
+                                           compressed=compress_reads))
     else:
         quant_params[qs.SIMULATED_READS] = \
-            os.path.join(reads_dir, fs.get_reads_file(errors))
+            os.path.join(reads_dir, fs.get_reads_file(
+                errors, compressed=compress_reads))
 
     return quant_params
 
@@ -211,21 +281,33 @@ def write_run_quantification_script(
         reads_dir, run_dir, piquant_options,
         quant_method=None, read_length=50, read_depth=10,
         paired_end=False, errors=False, bias=False,
+        threads=parameters.THREADS.default,
         transcript_gtf=None, genome_fasta=None):
 
     os.mkdir(run_dir)
 
+    run_log.write_run_log_header(
+        run_dir, run_log.QUANTIFICATION_RUN,
+        quant_method=quant_method, read_length=read_length,
+        read_depth=read_depth, paired_end=paired_end,
+        errors=errors, bias=bias, threads=threads)
+
     with fw.writing_to_file(
             fw.BashScriptWriter, run_dir, RUN_SCRIPT) as writer:
         with writer.section():
             _add_process_command_line_options(writer)
 
+        run_log.add_run_logging(
+            writer, run_dir, piquant_options[po.METRICS_FILE])
+
         quantifier_dir = os.path.join(
             piquant_options[po.OUTPUT_DIRECTORY], "quantifier_scratch")
 
         quant_params = _get_quant_params(
             reads_dir, quantifier_dir, transcript_gtf,
-            genome_fasta, paired_end, errors)
+            genome_fasta, paired_end, errors, threads,
+            piquant_options[po.COMPRESS_READS],
+            piquant_options[po.ASSIGNMENT_PRECISION])
 
         with writer.section():
             _add_run_prequantification(
@@ -235,8 +317,9 @@ def write_run_quantification_script(
         with writer.section():
             cleanup = not piquant_options[po.NO_CLEANUP]
             _add_quantify_transcripts(
-                writer, quant_method, quant_params, cleanup)
+                writer, reads_dir, quant_method, quant_params, cleanup)
 
         _add_analyse_results(
             writer, reads_dir, run_dir, quantifier_dir, piquant_options,
-            quant_method, read_length, read_depth, paired_end, errors, bias)
+            quant_method, read_length, read_depth, paired_end, errors, bias,
+            threads)
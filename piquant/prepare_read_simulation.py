@@ -1,16 +1,36 @@
 import file_writer as fw
 import flux_simulator as fs
 import os.path
+import random
+import run_log
+import worker
 
 RUN_SCRIPT = "run_simulation.sh"
+LIBRARY_SCRIPT = "run_library.sh"
+LIBRARY_CLAIM_DIRECTORY = "claimed"
+SHARD_DIRECTORY = "shard{n}"
+EXTRA_READS_PREFIX = "extra_"
+EXTENSION_READ_NAME_PREFIX = "depth{d}_"
+
+_MAX_SIMULATION_ATTEMPTS = 3
+
+FLUX_SIMULATOR = "flux"
+NUMPY_SIMULATOR = "numpy"
+READ_SIMULATORS = [FLUX_SIMULATOR, NUMPY_SIMULATOR]
 
 CALC_READ_DEPTH_SCRIPT = "calculate_reads_for_depth.py"
-SIMULATE_BIAS_SCRIPT = "simulate_read_bias.py"
+FINALISE_READS_SCRIPT = "finalise_reads.py"
+SUBSAMPLE_READS_SCRIPT = "subsample_reads.py"
+SIMULATE_READS_SCRIPT = "simulate_reads.py"
+INJECT_ERRORS_SCRIPT = "inject_read_errors.py"
+SCAN_READS_SCRIPT = "scan_reads.py"
+COUNT_TRANSCRIPT_READS_SCRIPT = "count_transcript_reads.py"
+INDEX_READ_ORIGINS_SCRIPT = "index_read_origins.py"
+MERGE_READS_SCRIPT = "merge_reads.py"
 BIAS_PWM_FILE = "bias_motif.pwm"
+READS_STATS_FILE = "reads_stats.json"
 
-TMP_READS_FILE = "reads.tmp"
-TMP_LEFT_READS_FILE = "lr.tmp"
-TMP_RIGHT_READS_FILE = "rr.tmp"
+_MAX_SEED = 2 ** 31 - 1
 
 
 def _get_script_path(script_name):
@@ -18,6 +38,19 @@ def _get_script_path(script_name):
         os.path.abspath(os.path.dirname(__file__)), script_name)
 
 
+def _get_script_command(script_name):
+    # Support scripts are run via the persistent worker, if it is running
+    return worker.get_script_command(_get_script_path(script_name))
+
+
+def _get_bias_spec(bias):
+    # Sequence bias is simulated with the bias PWM; other values of the bias
+    # parameter name the bias model to use
+    if bias is True:
+        return "--bias-pwm=" + _get_script_path(BIAS_PWM_FILE) + " "
+    return "--bias-model=" + bias + " "
+
+
 def _add_create_flux_simulator_temporary_directory(writer):
     writer.add_comment("Create temporary directory for FluxSimulator")
     writer.add_line("mkdir " + fs.TEMPORARY_DIRECTORY)
@@ -26,8 +59,31 @@ def _add_create_flux_simulator_temporary_directory(writer):
 def _add_create_expression_profiles(writer):
     writer.add_comment(
         "First run Flux Simulator to create expression profiles.")
+    writer.add_line(run_log.measured_command(
+        "flux-simulator -t simulator -x -p " + fs.EXPRESSION_PARAMS_FILE))
+
+
+def _add_create_library(writer):
+    writer.add_comment(
+        "Run Flux Simulator to create a library of fragments from the " +
+        "transcript population.")
+    writer.add_line(run_log.measured_command(
+        "flux-simulator -t simulator -l -p " + fs.LIBRARY_PARAMS_FILE))
+    writer.add_line("rm -rf " + fs.TEMPORARY_DIRECTORY)
+
+
+def _add_use_shared_library(writer, library_dir):
+    # The first read simulation run to claim the shared library creates it;
+    # other runs wait for it to be created
+    writer.add_comment(
+        "Create the shared fragment library in " + library_dir +
+        ", unless another run has already claimed it, and wait for it to " +
+        "be created.")
     writer.add_line(
-        "flux-simulator -t simulator -x -p " + fs.EXPRESSION_PARAMS_FILE)
+        "mkdir {claim} 2> /dev/null && (cd {dir} && ./{script}) || true".
+        format(claim=os.path.join(library_dir, LIBRARY_CLAIM_DIRECTORY),
+               dir=library_dir, script=LIBRARY_SCRIPT))
+    run_log.add_wait_for_run(writer, library_dir)
 
 
 def _add_fix_zero_length_transcripts(writer):
@@ -50,7 +106,9 @@ def _add_fix_zero_length_transcripts(writer):
         " > tmp; mv tmp " + fs.EXPRESSION_PROFILE_FILE)
 
 
-def _add_calculate_required_read_depth(writer, read_length, read_depth, bias):
+def _add_calculate_required_read_depth(
+        writer, read_length, read_depth, bias, pool_factor=1,
+        source_reads_dir=None, source_reads_files=None):
 
     # Given the expression profile created, calculate the number of reads
     # required to give the (approximate) read depth specified. Then edit the
@@ -61,32 +119,176 @@ def _add_calculate_required_read_depth(writer, read_length, read_depth, bias):
         " across the transcriptome, given a read length of " +
         str(read_length))
     writer.set_variable(
-        "READS", "$(" + _get_script_path(CALC_READ_DEPTH_SCRIPT) + " " +
+        "READS", "$(" + _get_script_command(CALC_READ_DEPTH_SCRIPT) + " " +
         fs.EXPRESSION_PROFILE_FILE + " " + str(read_length) + " " +
         str(read_depth) + ")")
 
+    if source_reads_dir is not None:
+        _add_subtract_source_reads(
+            writer, source_reads_dir, source_reads_files)
+
     if bias:
         writer.add_comment(
             "If we're simulating read bias, we'll generate twice the " +
             "required number of reads, and later make a biased " +
             "selection from these.")
+        pool_factor *= 2
+
+    if pool_factor > 1:
+        writer.add_comment(
+            "Simulate a pool of {f} times the required number of reads, ".
+            format(f=pool_factor) +
+            "from which the required reads will be selected.")
         writer.set_variable("FINAL_READS", "$READS")
-        writer.set_variable("READS", "$(echo \"2*$READS\" | bc)")
+        writer.set_variable(
+            "READS", "$(echo \"{f}*$READS\" | bc)".format(f=pool_factor))
+
+
+def _add_subtract_source_reads(writer, source_reads_dir, source_reads_files):
+    # When extending the reads of another directory to a higher depth, only
+    # the reads additional to those already simulated there are required
+    writer.add_comment(
+        "Only simulate the reads required in addition to those already " +
+        "simulated in " + source_reads_dir + ".")
+    writer.set_variable(
+        "SOURCE_READS", "$({c} {f})".format(
+            c=_get_script_command(SCAN_READS_SCRIPT),
+            f=" ".join([os.path.join(source_reads_dir, f)
+                        for f in source_reads_files])))
+    with writer.if_block("$READS -le $SOURCE_READS"):
+        writer.add_echo(
+            "\"Exiting: $SOURCE_READS reads were already simulated in " +
+            source_reads_dir + ", when $READS are required.\"")
+        writer.add_line("exit 1")
+    writer.set_variable("READS", "$((READS - SOURCE_READS))")
+
+
+def _add_calculate_reads_lower_bound(writer):
+    # Because the number of reads created is never exactly the number of reads
+    # asked for, we just check that the number created is not "too many" fewer
+    # than the number required (i.e. no. created is more than 99% of no.
+    # required)
+    writer.set_variable(
+        "READS_LOWER_BOUND", "$(echo \"($READS * 0.99)/1\" | bc)")
 
 
-def _add_update_flux_simulator_parameters(writer):
+def _add_calculate_molecules(writer, paired_end, auto_molecules, num_shards):
+    if auto_molecules:
+        # Size the initial transcript population according to the number of
+        # reads to be simulated (by each Flux Simulator instance, if reads are
+        # simulated in shards)
+        writer.add_comment(
+            "Calculate the number of molecules in the initial transcript " +
+            "population required to produce this number of reads.")
+        writer.set_variable(
+            "MOLECULES", "$(echo \"($READS * {f:.8f})/1 + 1\" | bc)".format(
+                f=fs.get_molecules_per_read(paired_end) / num_shards))
+    else:
+        writer.add_comment(
+            "Record the number of molecules in the initial transcript " +
+            "population.")
+        writer.set_variable(
+            "MOLECULES", "$(awk '{{s += ${c}}} END {{print s}}' {f})".format(
+                c=fs.PRO_FILE_NUM_COL + 1, f=fs.EXPRESSION_PROFILE_FILE))
+
+
+def _add_set_molecules(writer, num_shards):
+    # The molecule counts in the expression profile are scaled so that the
+    # initial transcript population contains the required number of
+    # molecules, without changing relative transcript abundances
     writer.add_comment(
-        "Update the Flux Simulator parameters file with this number of reads.")
+        "Scale the expression profile to a population of $MOLECULES " +
+        "molecules.")
+    writer.add_line(
+        ("awk -v t=$MOLECULES 'NR == FNR {{n += ${c}; next}} " +
+         "BEGIN {{OFS = \"\\t\"}} {{${c} = int(${c} * t / n + 0.5)}} 1' " +
+         "{f} {f} > tmp; mv tmp {f}").format(
+            c=fs.PRO_FILE_NUM_COL + 1, f=fs.EXPRESSION_PROFILE_FILE))
     writer.add_line(
-        "sed -i \"s/" + fs.READ_NUMBER_PLACEHOLDER + "/$READS/\" " +
-        fs.SIMULATION_PARAMS_FILE)
+        "sed -i \"s/^NB_MOLECULES .*/NB_MOLECULES $MOLECULES/\" " +
+        " ".join(_get_simulation_params_files(num_shards)))
+
+
+def _add_check_reads_simulated(writer, errors, num_shards):
+    # If too few reads were simulated, the library and sequencing steps are
+    # retried with more molecules - in proportion to the shortfall, with some
+    # headroom, but at least twice as many - up to a maximum number of
+    # attempts. Only the complete reads in the simulated reads file are
+    # counted; any problems with them are left to be reported when the reads
+    # are finalised. If the reads could not be scanned at all (e.g. because
+    # no reads file was written), no reads are counted, and the simulation is
+    # retried.
+    reads_file = fs.get_reads_file(errors, intermediate=True)
+    writer.set_variable(
+        "CREATED_READS", "$({c} {f}) || true".format(
+            c=_get_script_command(SCAN_READS_SCRIPT), f=reads_file))
+    writer.set_variable("CREATED_READS", "${CREATED_READS:-0}")
+    with writer.if_block("$CREATED_READS -ge $READS_LOWER_BOUND"):
+        writer.add_line("break")
+    with writer.if_block("$ATTEMPT -ge " + str(_MAX_SIMULATION_ATTEMPTS)):
+        writer.add_echo(
+            "\"Exiting: $CREATED_READS reads created, when " +
+            "$READS_LOWER_BOUND were required, after $ATTEMPT attempts - " +
+            "try increasing the number of molecules in the initial " +
+            "transcript population.\"")
+        writer.add_line("exit 1")
+    writer.add_echo(
+        "\"$CREATED_READS reads created, when $READS_LOWER_BOUND were " +
+        "required - retrying with more molecules.\"")
+    writer.set_variable("ATTEMPT", "$((ATTEMPT + 1))")
+    writer.set_variable(
+        "SCALED_MOLECULES",
+        "$((MOLECULES * READS * 5 / (4 * CREATED_READS + 1)))")
+    writer.set_variable(
+        "MOLECULES",
+        "$((SCALED_MOLECULES > MOLECULES * 2 ? " +
+        "SCALED_MOLECULES : MOLECULES * 2))")
 
+    shard_dirs = _get_shard_dirs(num_shards) if num_shards > 1 else []
+    outputs = [fs.SIMULATION_LIBRARY_FILE, reads_file,
+               fs.SIMULATED_READS_PREFIX + ".bed"]
+    writer.add_line("rm -f " + " ".join(
+        [os.path.join(d, o) for d in [""] + shard_dirs for o in outputs]))
+    writer.add_line("mkdir -p " + fs.TEMPORARY_DIRECTORY)
 
-def _add_simulate_reads(writer):
-    # Now use Flux Simulator to simulate reads
-    writer.add_comment("Now use Flux Simulator to simulate reads.")
+
+def _get_simulation_params_files(num_shards):
+    if num_shards == 1:
+        return [fs.SIMULATION_PARAMS_FILE]
+    return [os.path.join(d, fs.SIMULATION_PARAMS_FILE)
+            for d in _get_shard_dirs(num_shards)]
+
+
+def _add_update_flux_simulator_parameters(writer, num_shards):
+    if num_shards == 1:
+        writer.add_comment(
+            "Update the Flux Simulator parameters file with this number " +
+            "of reads.")
+        writer.add_line(
+            "sed -i \"s/" + fs.READ_NUMBER_PLACEHOLDER + "/$READS/\" " +
+            fs.SIMULATION_PARAMS_FILE)
+        return
+
+    writer.add_comment(
+        "Split the reads to be simulated between {n} ".format(n=num_shards) +
+        "Flux Simulator instances, and update the parameters file of each " +
+        "with its share of reads.")
+    writer.set_variable(
+        "SHARD_READS",
+        "$(echo \"($READS + {n} - 1) / {n}\" | bc)".format(n=num_shards))
     writer.add_line(
-        "flux-simulator -t simulator -l -s -p " + fs.SIMULATION_PARAMS_FILE)
+        "sed -i \"s/" + fs.READ_NUMBER_PLACEHOLDER + "/$SHARD_READS/\" " +
+        " ".join(_get_simulation_params_files(num_shards)))
+
+
+def _add_simulate_reads(writer, create_library):
+    # Now use Flux Simulator to simulate reads; when a shared library is
+    # used, fragments have already been created and need only be sequenced
+    writer.add_comment("Now use Flux Simulator to simulate reads.")
+    writer.add_line(run_log.measured_command(
+        "flux-simulator -t simulator {l}-s -p {p}".format(
+            l="-l " if create_library else "",
+            p=fs.SIMULATION_PARAMS_FILE)))
 
     # I can't see why we'd ever want to retain FluxSimulator's temporary files,
     # but if that became necessary, these lines could be moved to
@@ -94,179 +296,701 @@ def _add_simulate_reads(writer):
     writer.add_line("rm -rf " + fs.TEMPORARY_DIRECTORY)
 
 
-def _check_correct_number_of_reads_created(writer, errors):
+def _add_simulate_reads_with_numpy(
+        writer, read_length, paired_end, errors, bias, seed, num_processes,
+        transcript_gtf, genome_fasta):
+    # Alternatively, reads are simulated directly from the expression profile
+    # by piquant's own NumPy-based simulator, which writes reads and their
+    # locations in the same form as Flux Simulator. Sequence bias is
+    # simulated as fragments are drawn, rather than by selecting reads from a
+    # larger pool.
+    writer.add_comment("Now use piquant's read simulator to simulate reads.")
+    writer.add_line(run_log.measured_command(
+        ("{command} --read-length={l} --num-reads=$READS {p}{e}{b}" +
+         "--seed={s} --processes={n} {pro} {gtf} {genome} {prefix}").format(
+            command=_get_script_command(SIMULATE_READS_SCRIPT),
+            l=read_length, p="--paired-end " if paired_end else "",
+            e="--errors " if errors else "",
+            b=_get_bias_spec(bias) if bias else "",
+            s=seed, n=num_processes,
+            pro=fs.EXPRESSION_PROFILE_FILE,
+            gtf=os.path.abspath(transcript_gtf),
+            genome=os.path.abspath(genome_fasta),
+            prefix=fs.SIMULATED_READS_PREFIX)))
+    writer.add_line("rm -rf " + fs.TEMPORARY_DIRECTORY)
+
+
+def _get_final_reads_files(paired_end, errors, compress_reads):
+    return [fs.get_reads_file(errors, paired_end=end,
+                              compressed=compress_reads)
+            for end in ([fs.LEFT_READS, fs.RIGHT_READS]
+                        if paired_end else [None])]
+
+
+def _get_shard_dirs(num_shards):
+    return [SHARD_DIRECTORY.format(n=i + 1) for i in range(num_shards)]
+
+
+def _add_simulate_sharded_reads(writer, create_library, num_shards):
+    # Split the simulation of reads between several Flux Simulator instances,
+    # each running in its own shard directory with its own seed, temporary
+    # directory and copy of the expression profile
     writer.add_comment(
-        "Check that the number of transcript molecules in the initial " +
-        "population was high enough to create the required number of reads.")
+        "Run {n} Flux Simulator instances concurrently.".format(n=num_shards))
+
+    with writer.parallel_section():
+        for shard_dir in _get_shard_dirs(num_shards):
+            with writer.background_job():
+                writer.add_line("cd " + shard_dir)
+                writer.add_line("mkdir " + fs.TEMPORARY_DIRECTORY)
+                writer.add_line(
+                    "cp ../" + fs.EXPRESSION_PROFILE_FILE + " .")
+                _add_simulate_reads(writer, create_library)
+
 
-    lines_per_read = 2
-    if errors:
-        lines_per_read *= 2
+def _get_read_name_lines(errors):
+    # An awk pattern matching the lines of a reads file which hold read names
+    return "FNR % 4 == 1 || (FNR % 4 == 3 && length($0) > 1)" \
+        if errors else "FNR % 2 == 1"
+
+
+def _add_merge_sharded_reads(writer, errors, num_shards):
+    # Reads simulated by each instance are concatenated (they will be
+    # shuffled subsequently), prefixing read names - in the reads and BED
+    # files - with the shard name so that they remain unique
+    writer.add_comment(
+        "Merge the reads simulated by each Flux Simulator instance, " +
+        "prefixing read names with the name of the shard.")
 
+    shard_dirs = _get_shard_dirs(num_shards)
     reads_file = fs.get_reads_file(errors, intermediate=True)
+    bed_file = fs.SIMULATED_READS_PREFIX + ".bed"
 
-    # Because the number of reads created is never exactly the number of reads
-    # asked for, we just check that the number created is not "too many" fewer
-    # than the number required (i.e. no. created is more than 99% of no.
-    # required)
-    with writer.section():
-        writer.set_variable(
-            "READS_PRODUCED",
-            "$(echo \"$(wc -l " + reads_file + " | awk '{print $1}') / " +
-            str(lines_per_read) + "\" | bc)")
-        writer.set_variable(
-            "READS_LOWER_BOUND",
-            "$(echo \"($READS * 0.99)/1\" | bc)")
+    writer.add_line(
+        "awk '" + _get_read_name_lines(errors) +
+        " {split(FILENAME, s, \"/\"); " +
+        "$0 = substr($0, 1, 1) s[1] \"_\" substr($0, 2)} 1' " +
+        " ".join([os.path.join(d, reads_file) for d in shard_dirs]) +
+        " > " + reads_file)
+    writer.add_line(
+        "awk 'BEGIN {OFS = \"\\t\"} {split(FILENAME, s, \"/\"); " +
+        "$4 = s[1] \"_\" $4} 1' " +
+        " ".join([os.path.join(d, bed_file) for d in shard_dirs]) +
+        " > " + bed_file)
 
-    with writer.if_block("$READS_PRODUCED -lt $READS_LOWER_BOUND"):
-        writer.add_echo(
-            "\"Exiting: $READS_PRODUCED reads created, when $READS were " +
-            "required - try increasing the number of molecules in the " +
-            "initial transcript population.\"")
-        writer.add_line("exit 1")
+
+def _add_prefix_read_names(writer, errors, prefix):
+    # Reads simulated to extend those of another directory are named
+    # distinctly from them, in the same way as the reads of simulation shards
+    writer.add_comment(
+        "Prefix the names of the reads simulated with \"" + prefix + "\".")
+    reads_file = fs.get_reads_file(errors, intermediate=True)
+    writer.add_line(
+        "awk '" + _get_read_name_lines(errors) +
+        " {$0 = substr($0, 1, 1) \"" + prefix + "\" substr($0, 2)} 1' " +
+        reads_file + " > tmp; mv tmp " + reads_file)
 
 
-def _add_shuffle_simulated_reads(writer, paired_end, errors):
-    # Some isoform quantifiers (e.g. eXpress) require reads to be presented in
-    # a random order, but the reads output by Flux Simulator do have an order -
-    # hence we shuffle them.
-    lines_per_fragment = 2
-    if errors:
-        lines_per_fragment *= 2
-    if paired_end:
-        lines_per_fragment *= 2
+def _add_remove_shard_dirs(writer, num_shards):
+    writer.add_comment("Remove the Flux Simulator shard directories.")
+    writer.add_line("rm -rf " + fs.TEMPORARY_DIRECTORY + " " +
+                    " ".join(_get_shard_dirs(num_shards)))
 
+
+def _add_finalise_reads(
+        writer, paired_end, errors, bias, seed, compress_reads,
+        keep_pool=False, out_files=None, num_processes=1):
+    # In a single pass over the reads output by Flux Simulator, check that
+    # enough reads were created, shuffle them (some isoform quantifiers, e.g.
+    # eXpress, require reads to be presented in a random order), make a biased
+    # selection of reads if required and, for paired-end reads, split them
+    # into files of left and right reads.
     writer.add_comment(
-        "Some isoform quantifiers require reads to be presented in a " +
-        "random order, hence we shuffle the reads output by Flux Simulator.")
+        "Check, shuffle and (if simulating bias) select the reads output " +
+        "by Flux Simulator, writing them to the final reads file(s).")
+
+    # Select the required number of reads from a larger pool if one was
+    # simulated, using a position weight matrix (or another bias model) to
+    # simulate bias in the reads if required
+    bias_spec = ""
+    if bias or keep_pool:
+        bias_spec = "--num-reads=$FINAL_READS "
+    if bias:
+        bias_spec += _get_bias_spec(bias)
+
+    # Reads to be selected are scored by as many processes as were used to
+    # simulate them
+    if bias_spec and num_processes > 1:
+        bias_spec += "--processes={n} ".format(n=num_processes)
 
     reads_file = fs.get_reads_file(errors, intermediate=True)
-    writer.add_pipe(
-        "paste " + ("- " * lines_per_fragment) + "< " + reads_file,
-        "shuf",
-        "tr '\\t' '\\n' > " + TMP_READS_FILE
-    )
-    writer.add_line("mv " + TMP_READS_FILE + " " + reads_file)
+    writer.add_line(
+        _get_script_command(FINALISE_READS_SCRIPT) +
+        " --seed=" + str(seed) + " --min-reads=$READS_LOWER_BOUND " +
+        ("--paired-end " if paired_end else "") + bias_spec +
+        reads_file + " " +
+        " ".join(out_files or
+                 _get_final_reads_files(paired_end, errors, compress_reads)))
+
+    # A pool of reads from which other read sets are derived is retained
+    if not keep_pool:
+        writer.add_line("rm " + reads_file)
 
 
-def _add_simulate_read_bias(writer, paired_end, errors):
-    # Use a position weight matrix to simulate sequence bias in the reads
+def _add_copy_expression_profile(writer, source_reads_dir):
+    # Reads derived from those in another directory share its expression
+    # profile, which is needed to calculate the reads required for a read
+    # depth and, later, the true abundances of transcripts
     writer.add_comment(
-        "Use a position weight matrix to simulate sequence bias in " +
-        "the reads.")
+        "Copy the expression profile from " + source_reads_dir)
+    writer.add_line("cp " + os.path.join(
+        source_reads_dir, fs.EXPRESSION_PROFILE_FILE) + " .")
+
+
+def _add_subsample_reads(
+        writer, source_reads_dir, paired_end, errors, seed, compress_reads):
+    # Rather than simulating reads for this depth, select a random subsample
+    # of the reads simulated for a higher depth
+    writer.add_comment(
+        "Select the required number of reads from those simulated for a " +
+        "higher read depth.")
+
+    final_reads_files = _get_final_reads_files(
+        paired_end, errors, compress_reads)
+    files_spec = " ".join([
+        os.path.join(source_reads_dir, f) + " " + f
+        for f in final_reads_files])
 
-    reads_file = fs.get_reads_file(errors, intermediate=True)
-    out_prefix = "bias"
     writer.add_line(
-        _get_script_path(SIMULATE_BIAS_SCRIPT) +
-        " -n $FINAL_READS --out-prefix=" + out_prefix + " " +
-        ("--paired-end" if paired_end else "") + " " +
-        _get_script_path(BIAS_PWM_FILE) + " " + reads_file)
-    writer.add_line("mv " + out_prefix + "." + reads_file + " " + reads_file)
+        _get_script_command(SUBSAMPLE_READS_SCRIPT) +
+        " --seed=" + str(seed) + " --num-reads=$READS " + files_spec)
 
 
-def _create_final_reads_files(writer, paired_end, errors):
-    reads_file = fs.get_reads_file(errors, intermediate=True)
+def _add_derive_reads(
+        writer, source_reads_dir, paired_end, errors, bias, left_mates, seed,
+        compress_reads):
+    # Rather than simulating reads, select reads from the pool simulated in
+    # another directory; single-end reads are taken from the left reads of
+    # paired-end fragments, and sequence bias is simulated by a biased
+    # selection of reads
+    writer.add_comment(
+        "Select the required number of reads from the pool simulated in " +
+        source_reads_dir + ".")
 
-    if paired_end:
-        # If we've specified paired end reads, split the FASTA/Q file output by
-        # Flux Simulator into separate files for forward and reverse reads
-        writer.add_comment(
-            "We've produced paired-end reads - split the Flux Simulator " +
-            "output into files containing left and right reads.")
-
-        writer.add_pipe(
-            "paste " + ("- - - -" if errors else "- -") + " < " + reads_file,
-            "awk -F '\\t' '$1~/\/1/ " +
-            "{print $0 > \"" + TMP_LEFT_READS_FILE + "\"} " +
-            "$1~/\/2/ {print $0 > \"" + TMP_RIGHT_READS_FILE + "\"}'"
-        )
-        writer.add_line("rm " + reads_file)
+    source_spec = "--left-mates " if left_mates else \
+        ("--paired-end " if paired_end else "")
+    if bias:
+        source_spec += _get_bias_spec(bias)
 
-        writer.add_line(
-            "tr '\\t' '\\n' < " + TMP_LEFT_READS_FILE + " > " +
-            fs.get_reads_file(errors, paired_end=fs.LEFT_READS))
-        writer.add_line("rm " + TMP_LEFT_READS_FILE)
-        writer.add_line(
-            "tr '\\t' '\\n' < " + TMP_RIGHT_READS_FILE + " > " +
-            fs.get_reads_file(errors, paired_end=fs.RIGHT_READS))
-        writer.add_line("rm " + TMP_RIGHT_READS_FILE)
+    writer.add_line(
+        _get_script_command(FINALISE_READS_SCRIPT) +
+        " --seed=" + str(seed) + " --num-reads=$READS " + source_spec +
+        os.path.join(source_reads_dir,
+                     fs.get_reads_file(errors, intermediate=True)) + " " +
+        " ".join(_get_final_reads_files(paired_end, errors, compress_reads)))
+
+
+def _add_inject_errors(
+        writer, source_reads_dir, paired_end, seed, compress_reads):
+    # Rather than simulating reads with errors, add substitution errors to
+    # the error-free reads simulated in another directory
+    writer.add_comment(
+        "Add errors to the error-free reads simulated in " +
+        source_reads_dir + ".")
+
+    files_spec = " ".join([
+        os.path.join(source_reads_dir, source_file) + " " + out_file
+        for source_file, out_file in zip(
+            _get_final_reads_files(paired_end, False, compress_reads),
+            _get_final_reads_files(paired_end, True, compress_reads))])
+
+    writer.add_line(
+        _get_script_command(INJECT_ERRORS_SCRIPT) +
+        " --seed=" + str(seed) + " " + files_spec)
+
+
+def _get_extra_reads_files(paired_end, errors):
+    # Reads simulated to extend those of another directory are finalised to
+    # uncompressed files, before being merged with those reads
+    return [EXTRA_READS_PREFIX + f
+            for f in _get_final_reads_files(paired_end, errors, False)]
+
+
+def _add_merge_extra_reads(
+        writer, source_reads_dir, paired_end, errors, seed, compress_reads):
+    # The additional reads are merged with the (shuffled) final reads of the
+    # directory they extend, in random order, so that the merged reads are
+    # also shuffled
+    writer.add_comment(
+        "Merge the reads simulated with those simulated in " +
+        source_reads_dir + ", writing them to the final reads file(s).")
+
+    final_reads_files = _get_final_reads_files(
+        paired_end, errors, compress_reads)
+    extra_reads_files = _get_extra_reads_files(paired_end, errors)
+    files_spec = " ".join([
+        os.path.join(source_reads_dir, final_file) + " " + extra_file +
+        " " + final_file
+        for final_file, extra_file in zip(
+            final_reads_files, extra_reads_files)])
+
+    writer.add_line(
+        _get_script_command(MERGE_READS_SCRIPT) +
+        " --seed=" + str(seed) + " " + files_spec)
+    writer.add_line("rm " + " ".join(extra_reads_files))
+
+
+def _add_record_final_reads_size(writer, paired_end, errors, compress_reads):
+    # The final reads are checked for complete records and matching mates,
+    # and their statistics recorded; the run script exits with an error if
+    # they are invalid
+    final_reads_files = _get_final_reads_files(
+        paired_end, errors, compress_reads)
+    writer.set_variable(
+        "FINAL_READS", "$({c} --stats-file={s} {f})".format(
+            c=_get_script_command(SCAN_READS_SCRIPT), s=READS_STATS_FILE,
+            f=" ".join(final_reads_files)))
+    writer.add_echo("\"$FINAL_READS reads created.\"")
+    run_log.add_record_file_sizes(writer, "reads", final_reads_files)
+
+
+def _add_index_read_origins(writer, paired_end, errors, compress_reads):
+    # The transcript from which each final read (or, for paired-end reads,
+    # each fragment) originated is indexed, so that the assignment of reads
+    # to transcripts by quantifiers can later be assessed
+    writer.add_comment(
+        "Index the transcript of origin of each read.")
+    writer.add_line("{c} {pro} {reads} {out}".format(
+        c=_get_script_command(INDEX_READ_ORIGINS_SCRIPT),
+        pro=fs.EXPRESSION_PROFILE_FILE,
+        reads=_get_final_reads_files(paired_end, errors, compress_reads)[0],
+        out=fs.READ_ORIGINS_FILE))
+
+
+def _add_count_true_reads(writer):
+    # True per-transcript fragment counts are those of the final reads -
+    # those selected from a pool, subsampled, derived or merged - and so are
+    # counted from the index of the origins of those reads
+    writer.add_comment(
+        "Count the fragments in the final reads from each transcript.")
+    writer.add_line("{c} {pro} {origins} > {out}".format(
+        c=_get_script_command(COUNT_TRANSCRIPT_READS_SCRIPT),
+        pro=fs.EXPRESSION_PROFILE_FILE,
+        origins=fs.READ_ORIGINS_FILE,
+        out=fs.TRUE_READ_COUNTS_FILE))
+
+
+def _add_index_and_count_read_origins(
+        writer, paired_end, errors, compress_reads):
+    with writer.section(), run_log.logged_step(
+            writer, "index_read_origins"):
+        _add_index_read_origins(
+            writer, paired_end, errors, compress_reads)
+    with writer.section(), run_log.logged_step(writer, "count_true_reads"):
+        _add_count_true_reads(writer)
+
+
+def _add_simulate_reads_or_shards(
+        writer, errors, create_library, num_shards):
+    if num_shards == 1:
+        with writer.section():
+            _add_simulate_reads(writer, create_library)
     else:
-        writer.add_comment("Create final simulated reads file.")
-        writer.add_line("mv " + reads_file + " " + fs.get_reads_file(errors))
+        with writer.section():
+            _add_simulate_sharded_reads(writer, create_library, num_shards)
+        with writer.section():
+            _add_merge_sharded_reads(writer, errors, num_shards)
 
 
 def _add_create_reads(
-        writer, read_length, read_depth, paired_end, errors, bias):
+        writer, read_length, read_depth, paired_end, errors, bias, seed,
+        compress_reads, pool_factor, library_dir, num_shards,
+        auto_molecules, read_simulator, transcript_gtf, genome_fasta,
+        source_reads_dir=None):
+
+    # Only reads simulated by Flux Simulator need to be biased by selection
+    # from a pool of twice the required size
+    simulation_bias = bias if read_simulator == NUMPY_SIMULATOR else False
+    selection_bias = False if simulation_bias else bias
 
     with writer.section():
         _add_create_flux_simulator_temporary_directory(writer)
-    with writer.section():
-        _add_create_expression_profiles(writer)
-    with writer.section():
-        _add_fix_zero_length_transcripts(writer)
-    with writer.section():
-        _add_calculate_required_read_depth(
-            writer, read_length, read_depth, bias)
-    with writer.section():
-        _add_update_flux_simulator_parameters(writer)
-    with writer.section():
-        _add_simulate_reads(writer)
-    with writer.section():
-        _check_correct_number_of_reads_created(writer, errors)
-    with writer.section():
-        _add_shuffle_simulated_reads(writer, paired_end, errors)
-
-    if bias:
+    if source_reads_dir is not None:
+        # Reads extending those of another directory are simulated from the
+        # same expression profile, once those reads have been simulated
+        with writer.section(), run_log.logged_step(writer, "extend"):
+            with writer.section():
+                writer.add_comment(
+                    "Wait for reads to be simulated in " + source_reads_dir)
+                run_log.add_wait_for_run(writer, source_reads_dir)
+            _add_copy_expression_profile(writer, source_reads_dir)
+    elif library_dir is None:
+        with writer.section(), \
+                run_log.logged_step(writer, "flux_expression"):
+            with writer.section():
+                _add_create_expression_profiles(writer)
+            _add_fix_zero_length_transcripts(writer)
+    else:
+        with writer.section(), run_log.logged_step(writer, "flux_library"):
+            with writer.section():
+                _add_use_shared_library(writer, library_dir)
+            _add_copy_expression_profile(writer, library_dir)
+    with writer.section(), run_log.logged_step(writer, "flux_simulation"):
         with writer.section():
-            _add_simulate_read_bias(writer, paired_end, errors)
-
+            _add_calculate_required_read_depth(
+                writer, read_length, read_depth, selection_bias, pool_factor,
+                source_reads_dir,
+                _get_final_reads_files(paired_end, errors, compress_reads))
+            _add_calculate_reads_lower_bound(writer)
+        if read_simulator == FLUX_SIMULATOR:
+            with writer.section():
+                _add_update_flux_simulator_parameters(writer, num_shards)
+
+        if read_simulator == NUMPY_SIMULATOR:
+            # The NumPy read simulator always creates the number of reads
+            # requested, dividing the work between processes rather than
+            # Flux Simulator instances
+            _add_simulate_reads_with_numpy(
+                writer, read_length, paired_end, errors, simulation_bias,
+                seed, num_shards, transcript_gtf, genome_fasta)
+        elif library_dir is None:
+            # The library and sequencing steps may be retried with a larger
+            # transcript population if too few reads are simulated
+            with writer.section():
+                _add_calculate_molecules(
+                    writer, paired_end, auto_molecules, num_shards)
+                writer.set_variable("ATTEMPT", 1)
+            with writer.while_block("true"):
+                with writer.section():
+                    _add_set_molecules(writer, num_shards)
+                _add_simulate_reads_or_shards(
+                    writer, errors, library_dir is None, num_shards)
+                _add_check_reads_simulated(writer, errors, num_shards)
+        else:
+            _add_simulate_reads_or_shards(
+                writer, errors, library_dir is None, num_shards)
+
+        if read_simulator == FLUX_SIMULATOR and num_shards > 1:
+            with writer.section():
+                _add_remove_shard_dirs(writer, num_shards)
+        if source_reads_dir is not None:
+            with writer.section():
+                _add_prefix_read_names(
+                    writer, errors,
+                    EXTENSION_READ_NAME_PREFIX.format(d=read_depth))
+    with writer.section(), run_log.logged_step(writer, "finalise"):
+        _add_finalise_reads(
+            writer, paired_end, errors, selection_bias, seed, compress_reads,
+            keep_pool=pool_factor > 1,
+            out_files=None if source_reads_dir is None else
+            _get_extra_reads_files(paired_end, errors),
+            num_processes=num_shards)
+    if source_reads_dir is not None:
+        with writer.section(), run_log.logged_step(writer, "merge"):
+            _add_merge_extra_reads(
+                writer, source_reads_dir, paired_end, errors, seed,
+                compress_reads)
     with writer.section():
-        _create_final_reads_files(writer, paired_end, errors)
+        _add_record_final_reads_size(
+            writer, paired_end, errors, compress_reads)
+    _add_index_and_count_read_origins(
+        writer, paired_end, errors, compress_reads)
 
 
-def _add_cleanup_intermediate_files(writer):
+def _add_cleanup_intermediate_files(writer, remove_library):
     with writer.section():
         writer.add_comment(
             "Remove intermediate files not necessary for quantification.")
-        writer.add_line("rm " + fs.SIMULATION_LIBRARY_FILE)
+        if remove_library:
+            writer.add_line("rm " + fs.SIMULATION_LIBRARY_FILE)
         writer.add_line("rm " + fs.SIMULATED_READS_PREFIX + ".bed")
 
 
 def _create_simulator_parameter_files(
         reads_dir, transcript_gtf_file, genome_fasta_dir,
-        num_molecules, read_length, paired_end, errors):
+        num_molecules, read_length, paired_end, errors, library_dir,
+        num_shards, seed, seed_simulation=False):
 
+    # When reads are extended, Flux Simulator must be seeded so that the
+    # fragments it simulates differ from those of the reads extended
+    library_file = None if library_dir is None else \
+        os.path.join(library_dir, fs.LIBRARY_FILE)
     fs.write_flux_simulator_params_files(
         transcript_gtf_file, genome_fasta_dir, num_molecules,
-        read_length, paired_end, errors, reads_dir)
+        read_length, paired_end, errors, reads_dir, library_file,
+        seed if seed_simulation else None)
+
+    # When read simulation is sharded, each Flux Simulator instance is given
+    # a distinct (non-zero) seed
+    if num_shards > 1:
+        for index, shard_dir in enumerate(_get_shard_dirs(num_shards)):
+            shard_dir = os.path.join(reads_dir, shard_dir)
+            os.mkdir(shard_dir)
+            fs.write_flux_simulator_shard_params_file(
+                transcript_gtf_file, genome_fasta_dir, num_molecules,
+                read_length, paired_end, errors, shard_dir,
+                seed + index + 1, library_file)
 
 
 def _write_read_simulation_script(
-        reads_dir, read_length, read_depth, paired_end, errors, bias, cleanup):
+        reads_dir, read_length, read_depth, paired_end, errors, bias,
+        cleanup, metrics_file, seed, compress_reads, pool_factor,
+        library_dir, num_shards, auto_molecules, read_simulator,
+        transcript_gtf, genome_fasta, source_reads_dir):
 
     with fw.writing_to_file(
             fw.BashScriptWriter, reads_dir, RUN_SCRIPT) as writer:
 
+        run_log.add_run_logging(writer, reads_dir, metrics_file)
+
         _add_create_reads(writer, read_length, read_depth,
-                          paired_end, errors, bias)
+                          paired_end, errors, bias, seed, compress_reads,
+                          pool_factor, library_dir, num_shards,
+                          auto_molecules, read_simulator, transcript_gtf,
+                          genome_fasta, source_reads_dir)
 
         if cleanup:
-            _add_cleanup_intermediate_files(writer)
+            _add_cleanup_intermediate_files(
+                writer, read_simulator == FLUX_SIMULATOR and
+                library_dir is None and num_shards == 1)
+
+
+def _write_library_script(library_dir, metrics_file):
+    with fw.writing_to_file(
+            fw.BashScriptWriter, library_dir, LIBRARY_SCRIPT) as writer:
+
+        run_log.add_run_logging(writer, library_dir, metrics_file)
+
+        with writer.section():
+            _add_create_flux_simulator_temporary_directory(writer)
+        with writer.section(), \
+                run_log.logged_step(writer, "flux_expression"):
+            with writer.section():
+                _add_create_expression_profiles(writer)
+            _add_fix_zero_length_transcripts(writer)
+        with writer.section(), run_log.logged_step(writer, "flux_library"):
+            _add_create_library(writer)
+
+
+def _write_read_subsampling_script(
+        reads_dir, source_reads_dir, read_length, read_depth, paired_end,
+        errors, metrics_file, seed, compress_reads):
+
+    with fw.writing_to_file(
+            fw.BashScriptWriter, reads_dir, RUN_SCRIPT) as writer:
+
+        run_log.add_run_logging(writer, reads_dir, metrics_file)
+
+        with writer.section(), run_log.logged_step(writer, "subsample"):
+            with writer.section():
+                writer.add_comment(
+                    "Wait for reads to be simulated in " + source_reads_dir)
+                run_log.add_wait_for_run(writer, source_reads_dir)
+            with writer.section():
+                _add_copy_expression_profile(writer, source_reads_dir)
+            with writer.section():
+                _add_calculate_required_read_depth(
+                    writer, read_length, read_depth, False)
+            _add_subsample_reads(
+                writer, source_reads_dir, paired_end, errors, seed,
+                compress_reads)
+        with writer.section():
+            _add_record_final_reads_size(
+                writer, paired_end, errors, compress_reads)
+        _add_index_and_count_read_origins(
+            writer, paired_end, errors, compress_reads)
+
+
+def _write_read_derivation_script(
+        reads_dir, source_reads_dir, read_length, read_depth, paired_end,
+        errors, bias, left_mates, metrics_file, seed, compress_reads):
+
+    with fw.writing_to_file(
+            fw.BashScriptWriter, reads_dir, RUN_SCRIPT) as writer:
+
+        run_log.add_run_logging(writer, reads_dir, metrics_file)
+
+        with writer.section(), run_log.logged_step(writer, "derive"):
+            with writer.section():
+                writer.add_comment(
+                    "Wait for reads to be simulated in " + source_reads_dir)
+                run_log.add_wait_for_run(writer, source_reads_dir)
+            with writer.section():
+                _add_copy_expression_profile(writer, source_reads_dir)
+            with writer.section():
+                _add_calculate_required_read_depth(
+                    writer, read_length, read_depth, False)
+            _add_derive_reads(
+                writer, source_reads_dir, paired_end, errors, bias,
+                left_mates, seed, compress_reads)
+        with writer.section():
+            _add_record_final_reads_size(
+                writer, paired_end, errors, compress_reads)
+        _add_index_and_count_read_origins(
+            writer, paired_end, errors, compress_reads)
+
+
+def _write_error_injection_script(
+        reads_dir, source_reads_dir, paired_end, metrics_file, seed,
+        compress_reads):
+
+    with fw.writing_to_file(
+            fw.BashScriptWriter, reads_dir, RUN_SCRIPT) as writer:
+
+        run_log.add_run_logging(writer, reads_dir, metrics_file)
+
+        with writer.section(), run_log.logged_step(writer, "inject_errors"):
+            with writer.section():
+                writer.add_comment(
+                    "Wait for reads to be simulated in " + source_reads_dir)
+                run_log.add_wait_for_run(writer, source_reads_dir)
+            with writer.section():
+                _add_copy_expression_profile(writer, source_reads_dir)
+            _add_inject_errors(
+                writer, source_reads_dir, paired_end, seed, compress_reads)
+        with writer.section():
+            _add_record_final_reads_size(
+                writer, paired_end, True, compress_reads)
+        _add_index_and_count_read_origins(
+            writer, paired_end, True, compress_reads)
+
+
+def _get_seed(seed):
+    # Reads are shuffled or subsampled reproducibly each time a script is
+    # run; if no seed was specified, one is chosen now
+    return random.randint(0, _MAX_SEED) if seed is None else seed
+
+
+def _get_derived_seed(seed, *run_params):
+    # Reads created from those of another directory must be selected with a
+    # seed distinct from that of the source directory, and from those of any
+    # other directories whose reads are created from the same source, but
+    # still reproducibly for a given seed
+    return _get_seed(None) if seed is None else \
+        random.Random((seed,) + run_params).randint(0, _MAX_SEED)
+
+
+def _get_extension_seed(seed, read_depth):
+    # Reads extending those of another directory must be simulated with a
+    # different seed to those reads
+    return _get_derived_seed(seed, read_depth)
 
 
 def create_simulation_files(
-        reads_dir, cleanup, read_length=30, read_depth=10, paired_end=False,
-        errors=False, bias=False, transcript_gtf=None, genome_fasta=None,
-        num_molecules=30000000):
+        reads_dir, cleanup, metrics_file=None, seed=None,
+        compress_reads=False, pool_factor=1, library_dir=None, num_shards=1,
+        auto_molecules=False, read_simulator=FLUX_SIMULATOR, read_length=30,
+        read_depth=10, paired_end=False, errors=False, bias=False,
+        transcript_gtf=None, genome_fasta=None, num_molecules=30000000,
+        source_reads_dir=None):
 
     os.mkdir(reads_dir)
+    seed = _get_seed(seed) if source_reads_dir is None else \
+        _get_extension_seed(seed, read_depth)
 
-    # Write Flux Simulator parameters files
+    run_log.write_run_log_header(
+        reads_dir, run_log.SIMULATION_RUN,
+        read_length=read_length, read_depth=read_depth,
+        paired_end=paired_end, errors=errors, bias=bias)
+
+    # Write Flux Simulator parameters files; shards are only used when Flux
+    # Simulator itself simulates reads
     _create_simulator_parameter_files(
         reads_dir, transcript_gtf, genome_fasta,
-        num_molecules, read_length, paired_end, errors)
+        num_molecules, read_length, paired_end, errors, library_dir,
+        num_shards if read_simulator == FLUX_SIMULATOR else 1, seed,
+        seed_simulation=source_reads_dir is not None)
 
-    # Write shell script to run read simulation
+    # Write shell script to run read simulation; if the reads of another
+    # directory are extended to this depth, only the extra reads required
+    # are simulated, and then merged with those reads
     _write_read_simulation_script(
-        reads_dir, read_length, read_depth, paired_end, errors, bias, cleanup)
+        reads_dir, read_length, read_depth, paired_end, errors, bias,
+        cleanup, metrics_file, seed, compress_reads, pool_factor,
+        library_dir, num_shards, auto_molecules, read_simulator,
+        transcript_gtf, genome_fasta, source_reads_dir)
+
+
+def create_library_files(
+        library_dir, metrics_file=None, transcript_gtf=None,
+        genome_fasta=None, num_molecules=30000000):
+
+    os.mkdir(library_dir)
+
+    run_log.write_run_log_header(
+        library_dir, run_log.LIBRARY_RUN, num_molecules=num_molecules)
+
+    # Write Flux Simulator parameters files
+    fs.write_flux_simulator_library_params_files(
+        transcript_gtf, genome_fasta, num_molecules, library_dir)
+
+    # Write shell script to create the shared fragment library
+    _write_library_script(library_dir, metrics_file)
+
+
+def create_subsampling_files(
+        reads_dir, source_reads_dir, metrics_file=None, seed=None,
+        compress_reads=False, read_length=30, read_depth=10, paired_end=False,
+        errors=False, bias=False):
+
+    os.mkdir(reads_dir)
+
+    run_log.write_run_log_header(
+        reads_dir, run_log.SIMULATION_RUN,
+        read_length=read_length, read_depth=read_depth,
+        paired_end=paired_end, errors=errors, bias=bias)
+
+    # Write shell script to subsample reads from those simulated, at a higher
+    # depth, in the source reads directory; the subsample for each depth is
+    # selected with its own seed
+    _write_read_subsampling_script(
+        reads_dir, source_reads_dir, read_length, read_depth, paired_end,
+        errors, metrics_file,
+        _get_derived_seed(
+            seed, read_length, read_depth, paired_end, errors, bias),
+        compress_reads)
+
+
+def create_derivation_files(
+        reads_dir, source_reads_dir, left_mates, metrics_file=None,
+        seed=None, compress_reads=False, read_length=30, read_depth=10,
+        paired_end=False, errors=False, bias=False):
+
+    os.mkdir(reads_dir)
+
+    run_log.write_run_log_header(
+        reads_dir, run_log.SIMULATION_RUN,
+        read_length=read_length, read_depth=read_depth,
+        paired_end=paired_end, errors=errors, bias=bias)
+
+    # Write shell script to derive reads from the pool of reads simulated in
+    # the source reads directory; reads are selected from the pool with a
+    # seed distinct from that with which the source directory's own reads,
+    # and those of other derived directories, are selected
+    _write_read_derivation_script(
+        reads_dir, source_reads_dir, read_length, read_depth, paired_end,
+        errors, bias, left_mates, metrics_file,
+        _get_derived_seed(
+            seed, read_length, read_depth, paired_end, errors, bias),
+        compress_reads)
+
+
+def create_error_injection_files(
+        reads_dir, source_reads_dir, metrics_file=None, seed=None,
+        compress_reads=False, read_length=30, read_depth=10,
+        paired_end=False, errors=True, bias=False):
+
+    os.mkdir(reads_dir)
+
+    run_log.write_run_log_header(
+        reads_dir, run_log.SIMULATION_RUN,
+        read_length=read_length, read_depth=read_depth,
+        paired_end=paired_end, errors=errors, bias=bias)
+
+    # Write shell script to add errors to the error-free reads simulated in
+    # the source reads directory
+    _write_error_injection_script(
+        reads_dir, source_reads_dir, paired_end, metrics_file,
+        _get_derived_seed(
+            seed, read_length, read_depth, paired_end, errors, bias),
+        compress_reads)
@@ -1,7 +1,37 @@
+import numpy as np
 import operator
 
 NEUTRAL_SCORE = 0.25
 
+_BASES = "acgtn"
+_PADDING = "\0"
+
+# Maps each character to its column in the log-space weight matrix; upper and
+# lower case bases are equivalent, padding beyond the end of a short sequence
+# scores as neutral, and any other character is invalid.
+_BASE_COLUMNS = np.zeros(256, dtype=np.intp) + len(_BASES) + 1
+for _column, _base in enumerate(_BASES):
+    _BASE_COLUMNS[ord(_base)] = _column
+    _BASE_COLUMNS[ord(_base.upper())] = _column
+_BASE_COLUMNS[ord(_PADDING)] = len(_BASES)
+
+
+def encode_sequences(sequences, length):
+    """
+    Return a batch of sequences as a two-dimensional array of character codes.
+
+    Each sequence is truncated, or padded, to the specified length; padding
+    scores as neutral against a PWM.
+    sequences: A list of sequence strings.
+    length: The number of bases of each sequence to encode.
+    """
+    if len(sequences) == 0:
+        return np.zeros((0, length), dtype=np.uint8)
+
+    return np.frombuffer(
+        "".join([s[0: length].ljust(length, _PADDING) for s in sequences]),
+        dtype=np.uint8).reshape(len(sequences), length)
+
 
 class PWM:
     def __init__(self, filename):
@@ -15,6 +45,14 @@ class PWM:
                     for l in zip(*base_weights)]
         self.length = len(self.pos)
 
+        # For batch scoring, weights are held as logarithms in a matrix with
+        # a row per position, and a column per base (plus one for padding)
+        weights = np.array(
+            [[p[base] for base in _BASES] + [NEUTRAL_SCORE]
+             for p in self.pos])
+        with np.errstate(divide="ignore"):
+            self.log_weights = np.log(weights)
+
     def score(self, sequence):
         sequence = sequence[0: self.length].lower()
         scores = [self.pos[i][base] for i, base in enumerate(sequence)]
@@ -24,3 +62,44 @@ class PWM:
             scores += [NEUTRAL_SCORE] * (self.length - score_length)
 
         return reduce(operator.mul, scores)
+
+    def max_score(self):
+        """
+        Return the highest score that any sequence can have.
+        """
+        return np.exp(self.log_weights[:, :len(_BASES)].max(axis=1).sum())
+
+    def score_batch(self, sequences):
+        """
+        Return an array of the scores of a batch of sequences.
+
+        Scores are those that would be returned by score() for each
+        sequence, but are calculated for all sequences at once: sequences are
+        encoded as an array of weight matrix columns, and the logarithms of
+        their weights are summed. A ValueError is raised if any sequence
+        contains a character other than a base or 'n'.
+        sequences: A list of sequence strings.
+        """
+        return self.score_bases(encode_sequences(sequences, self.length))
+
+    def score_bases(self, bases):
+        """
+        Return an array of the scores of a batch of encoded sequences.
+
+        As score_batch(), but for sequences held as the rows of a
+        two-dimensional array of character codes; only the first bases of
+        each row, up to the length of the PWM, are scored.
+        bases: A two-dimensional array of unsigned 8-bit character codes.
+        """
+        bases = bases[:, 0: self.length]
+        if bases.shape[1] < self.length:
+            padding = np.zeros((len(bases), self.length - bases.shape[1]),
+                               dtype=np.uint8) + ord(_PADDING)
+            bases = np.hstack([bases, padding])
+
+        columns = _BASE_COLUMNS[bases]
+        if (columns > len(_BASES)).any():
+            raise ValueError("Sequences contain characters other than bases")
+
+        return np.exp(self.log_weights[
+            np.arange(self.length), columns].sum(axis=1))
@@ -1,5 +1,7 @@
+import flux_simulator as fs
 import pandas as pd
 import os.path
+import run_log
 
 TRANSCRIPT_GTF_FILE = "TRANSCRIPT_GTF_FILE"
 GENOME_FASTA_DIR = "GENOME_FASTA_DIR"
@@ -8,6 +10,8 @@ LEFT_SIMULATED_READS = "LEFT_SIMULATED_READS"
 RIGHT_SIMULATED_READS = "RIGHT_SIMULATED_READS"
 FASTQ_READS = "FASTQ_READS"
 QUANTIFIER_DIRECTORY = "QUANTIFIER_DIRECTORY"
+NUM_THREADS = "NUM_THREADS"
+SAMPLED_ASSIGNMENTS = "SAMPLED_ASSIGNMENTS"
 
 _QUANT_METHODS = {}
 
@@ -28,6 +32,35 @@ class _QuantifierBase(object):
     def __str__(self):
         return self.__class__.get_name()
 
+    @classmethod
+    def _reads_compressed_natively(cls):
+        return False
+
+    @classmethod
+    def get_read_alignments_file(cls):
+        # Quantifiers which, when the SAMPLED_ASSIGNMENTS parameter is set,
+        # record a single assignment of each read to a transcript, sampled
+        # according to its posterior probabilities, in SAM or BAM format,
+        # return the name of the file in which they do so
+        return None
+
+    @classmethod
+    def get_sampled_alignment_tag(cls):
+        # Quantifiers which record all alignments of each read, but give the
+        # alignment sampled a weight of 1 in an alignment tag, return the
+        # name of the tag
+        return None
+
+    @classmethod
+    def _get_reads(cls, params, reads_param):
+        # Quantifiers unable to read gzip-compressed reads files themselves are
+        # given decompressed reads via process substitution
+        reads_file = params[reads_param]
+        if reads_file.endswith(fs.COMPRESSED_READS_SUFFIX) and \
+                not cls._reads_compressed_natively():
+            return "<(gzip -dc " + reads_file + ")"
+        return reads_file
+
 
 @_Quantifier
 class _Cufflinks(_QuantifierBase):
@@ -49,10 +82,11 @@ class _Cufflinks(_QuantifierBase):
         "bowtie-inspect {bowtie_index} > {bowtie_index}.fa"
 
     MAP_READS_TO_GENOME_WITH_TOPHAT = \
-        "tophat {stranded_spec} --no-coverage-search -p 8 " + \
+        "tophat {stranded_spec} --no-coverage-search -p {num_threads} " + \
         "-o tho {bowtie_index} {reads_spec}"
     QUANTIFY_ISOFORM_EXPRESSION = \
-        "cufflinks -o transcriptome -u -b {bowtie_index}.fa -p 8 " + \
+        "cufflinks -o transcriptome -u -b {bowtie_index}.fa " + \
+        "-p {num_threads} " + \
         "{stranded_spec} -G {transcript_gtf} tho/accepted_hits.bam"
 
     REMOVE_TOPHAT_OUTPUT_DIRECTORY = \
@@ -64,6 +98,10 @@ class _Cufflinks(_QuantifierBase):
     def get_name(cls):
         return "Cufflinks"
 
+    @classmethod
+    def _reads_compressed_natively(cls):
+        return True
+
     @classmethod
     def _get_bowtie_index(cls, quantifier_dir):
         return os.path.join(quantifier_dir, "bowtie-index", "index")
@@ -87,33 +125,39 @@ class _Cufflinks(_QuantifierBase):
                     cls.GET_GENOME_REFERENCE_FASTA_FILE_LIST.format(
                         genome_fasta_dir=params[GENOME_FASTA_DIR]))
                 writer.add_line(cls.STRIP_TRAILING_COMMA_FROM_FASTA_FILE_LIST)
-                writer.add_line(cls.BUILD_BOWTIE_INDEX.format(
-                    bowtie_index=bowtie_index))
-                writer.add_line(cls.CONSTRUCT_BOWTIE_REFERENCE_FASTA.format(
-                    bowtie_index=bowtie_index))
+                writer.add_line(run_log.measured_command(
+                    cls.BUILD_BOWTIE_INDEX.format(bowtie_index=bowtie_index)))
+                writer.add_line(run_log.measured_command(
+                    cls.CONSTRUCT_BOWTIE_REFERENCE_FASTA.format(
+                        bowtie_index=bowtie_index)))
 
     @classmethod
     def write_quantification_commands(cls, writer, params):
         bowtie_index = cls._get_bowtie_index(params[QUANTIFIER_DIRECTORY])
 
-        reads_spec = params[SIMULATED_READS] if SIMULATED_READS in params \
+        reads_spec = cls._get_reads(params, SIMULATED_READS) \
+            if SIMULATED_READS in params \
             else "{l} {r}".format(
-                l=params[LEFT_SIMULATED_READS],
-                r=params[RIGHT_SIMULATED_READS])
+                l=cls._get_reads(params, LEFT_SIMULATED_READS),
+                r=cls._get_reads(params, RIGHT_SIMULATED_READS))
 
         stranded_spec = "--library-type " + \
             ("fr-unstranded" if SIMULATED_READS in params
              else "fr-secondstrand")
 
-        writer.add_line(cls.MAP_READS_TO_GENOME_WITH_TOPHAT.format(
-            bowtie_index=bowtie_index,
-            reads_spec=reads_spec,
-            stranded_spec=stranded_spec))
+        writer.add_line(run_log.measured_command(
+            cls.MAP_READS_TO_GENOME_WITH_TOPHAT.format(
+                bowtie_index=bowtie_index,
+                reads_spec=reads_spec,
+                stranded_spec=stranded_spec,
+                num_threads=params[NUM_THREADS])))
 
-        writer.add_line(cls.QUANTIFY_ISOFORM_EXPRESSION.format(
-            bowtie_index=bowtie_index,
-            transcript_gtf=params[TRANSCRIPT_GTF_FILE],
-            stranded_spec=stranded_spec))
+        writer.add_line(run_log.measured_command(
+            cls.QUANTIFY_ISOFORM_EXPRESSION.format(
+                bowtie_index=bowtie_index,
+                transcript_gtf=params[TRANSCRIPT_GTF_FILE],
+                stranded_spec=stranded_spec,
+                num_threads=params[NUM_THREADS])))
 
     @classmethod
     def write_post_quantification_cleanup(cls, writer):
@@ -173,17 +217,19 @@ class _TranscriptomeBasedQuantifierBase(_QuantifierBase):
             with writer.if_block(
                     cls.CHECK_TRANSCRIPT_REFERENCE_DIRECTORY_EXISTS):
                 writer.add_line(cls.MAKE_TRANSCRIPT_REFERENCE_DIRECTORY)
-                writer.add_line(cls.PREPARE_TRANSCRIPT_REFERENCE.format(
-                    transcript_gtf=params[TRANSCRIPT_GTF_FILE],
-                    genome_fasta_dir=params[GENOME_FASTA_DIR],
-                    ref_name=ref_name,
-                    bowtie_spec=bowtie_spec))
+                writer.add_line(run_log.measured_command(
+                    cls.PREPARE_TRANSCRIPT_REFERENCE.format(
+                        transcript_gtf=params[TRANSCRIPT_GTF_FILE],
+                        genome_fasta_dir=params[GENOME_FASTA_DIR],
+                        ref_name=ref_name,
+                        bowtie_spec=bowtie_spec)))
 
 
 @_Quantifier
 class _RSEM(_TranscriptomeBasedQuantifierBase):
     QUANTIFY_ISOFORM_EXPRESSION = \
-        "rsem-calculate-expression --time {qualities_spec} --p 32 " + \
+        "rsem-calculate-expression --time {qualities_spec} " + \
+        "--p {num_threads} {sampling_spec}" + \
         "{stranded_spec} {reads_spec} {ref_name} rsem_sample"
 
     REMOVE_RSEM_OUTPUT_EXCEPT_ISOFORM_ABUNDANCES = \
@@ -198,25 +244,43 @@ class _RSEM(_TranscriptomeBasedQuantifierBase):
     def _needs_bowtie_index(cls):
         return True
 
+    @classmethod
+    def get_read_alignments_file(cls):
+        return "rsem_sample.transcript.bam"
+
+    @classmethod
+    def get_sampled_alignment_tag(cls):
+        return "ZW"
+
     @classmethod
     def write_quantification_commands(cls, writer, params):
         qualities_spec = "" if params[FASTQ_READS] else "--no-qualities"
 
-        reads_spec = params[SIMULATED_READS] if SIMULATED_READS in params \
+        reads_spec = cls._get_reads(params, SIMULATED_READS) \
+            if SIMULATED_READS in params \
             else "--paired-end {l} {r}".format(
-                l=params[LEFT_SIMULATED_READS],
-                r=params[RIGHT_SIMULATED_READS])
+                l=cls._get_reads(params, LEFT_SIMULATED_READS),
+                r=cls._get_reads(params, RIGHT_SIMULATED_READS))
 
         stranded_spec = "" if SIMULATED_READS in params \
             else "--strand-specific"
 
+        # RSEM's BAM file of alignments to transcripts holds every
+        # alignment of each read; if assignments are to be assessed, one
+        # alignment of each read is sampled and given a weight of 1
+        sampling_spec = "--sampling-for-bam " \
+            if params.get(SAMPLED_ASSIGNMENTS) else ""
+
         ref_name = cls._get_ref_name(params[QUANTIFIER_DIRECTORY])
 
-        writer.add_line(cls.QUANTIFY_ISOFORM_EXPRESSION.format(
-            qualities_spec=qualities_spec,
-            reads_spec=reads_spec,
-            stranded_spec=stranded_spec,
-            ref_name=ref_name))
+        writer.add_line(run_log.measured_command(
+            cls.QUANTIFY_ISOFORM_EXPRESSION.format(
+                qualities_spec=qualities_spec,
+                reads_spec=reads_spec,
+                stranded_spec=stranded_spec,
+                sampling_spec=sampling_spec,
+                ref_name=ref_name,
+                num_threads=params[NUM_THREADS])))
 
     @classmethod
     def write_post_quantification_cleanup(cls, writer):
@@ -236,14 +300,17 @@ class _RSEM(_TranscriptomeBasedQuantifierBase):
 class _Express(_TranscriptomeBasedQuantifierBase):
     MAP_READS_TO_TRANSCRIPT_REFERENCE = \
         "bowtie {qualities_spec} -e 99999999 -l 25 -I 1 -X 1000 -a -S " + \
-        "-m 200 -p 32 {ref_name} {reads_spec}"
+        "-m 200 -p {num_threads} {ref_name} {reads_spec}"
     CONVERT_SAM_TO_BAM = \
         "samtools view -Sb - > hits.bam"
     QUANTIFY_ISOFORM_EXPRESSION = \
-        "express {stranded_spec} {ref_name}.transcripts.fa hits.bam"
+        "express {stranded_spec}{sampling_spec}" + \
+        "{ref_name}.transcripts.fa hits.bam"
 
     REMOVE_MAPPED_READS = \
         "rm hits.bam"
+    REMOVE_SAMPLED_ALIGNMENTS = \
+        "rm -f hits.1.samp.bam"
     REMOVE_EXPRESS_OUTPUT_EXCEPT_ISOFORM_ABUNDANCES = \
         "rm params.xprs"
 
@@ -255,34 +322,49 @@ class _Express(_TranscriptomeBasedQuantifierBase):
     def _needs_bowtie_index(cls):
         return True
 
+    @classmethod
+    def get_read_alignments_file(cls):
+        # With --output-align-samp, eXpress writes a single alignment of each
+        # fragment, sampled according to its posterior probabilities
+        return "hits.1.samp.bam"
+
     @classmethod
     def write_quantification_commands(cls, writer, params):
         ref_name = cls._get_ref_name(params[QUANTIFIER_DIRECTORY])
 
         qualities_spec = "-q" if params[FASTQ_READS] else "-f"
 
-        reads_spec = params[SIMULATED_READS] if SIMULATED_READS in params \
+        reads_spec = cls._get_reads(params, SIMULATED_READS) \
+            if SIMULATED_READS in params \
             else "-1 {l} -2 {r}".format(
-                l=params[LEFT_SIMULATED_READS],
-                r=params[RIGHT_SIMULATED_READS])
+                l=cls._get_reads(params, LEFT_SIMULATED_READS),
+                r=cls._get_reads(params, RIGHT_SIMULATED_READS))
 
         stranded_spec = "--fr-stranded " \
             if SIMULATED_READS not in params else ""
 
+        sampling_spec = "--output-align-samp " \
+            if params.get(SAMPLED_ASSIGNMENTS) else ""
+
         writer.add_pipe(
-            cls.MAP_READS_TO_TRANSCRIPT_REFERENCE.format(
-                qualities_spec=qualities_spec,
-                ref_name=ref_name,
-                reads_spec=reads_spec),
+            run_log.measured_command(
+                cls.MAP_READS_TO_TRANSCRIPT_REFERENCE.format(
+                    qualities_spec=qualities_spec,
+                    ref_name=ref_name,
+                    reads_spec=reads_spec,
+                    num_threads=params[NUM_THREADS])),
             cls.CONVERT_SAM_TO_BAM
         )
-        writer.add_line(cls.QUANTIFY_ISOFORM_EXPRESSION.format(
-            stranded_spec=stranded_spec,
-            ref_name=ref_name))
+        writer.add_line(run_log.measured_command(
+            cls.QUANTIFY_ISOFORM_EXPRESSION.format(
+                stranded_spec=stranded_spec,
+                sampling_spec=sampling_spec,
+                ref_name=ref_name)))
 
     @classmethod
     def write_post_quantification_cleanup(cls, writer):
         writer.add_line(cls.REMOVE_MAPPED_READS)
+        writer.add_line(cls.REMOVE_SAMPLED_ALIGNMENTS)
         writer.add_line(cls.REMOVE_EXPRESS_OUTPUT_EXCEPT_ISOFORM_ABUNDANCES)
 
     def get_transcript_abundance(self, transcript_id):
@@ -297,10 +379,12 @@ class _Express(_TranscriptomeBasedQuantifierBase):
 @_Quantifier
 class _Sailfish(_TranscriptomeBasedQuantifierBase):
     CREATE_SAILFISH_TRANSCRIPT_INDEX = \
-        "sailfish index -p 8 -t {ref_name}.transcripts.fa -k 20 -o {index_dir}"
+        "sailfish index -p {num_threads} -t {ref_name}.transcripts.fa " + \
+        "-k 20 -o {index_dir}"
 
     QUANTIFY_ISOFORM_EXPRESSION = \
-        "sailfish quant -p 8 -i {index_dir} -l {library_spec} " + \
+        "sailfish quant -p {num_threads} -i {index_dir} " + \
+        "-l {library_spec} " + \
         "{reads_spec} -o ."
     FILTER_COMMENT_LINES = [
         "grep -v '^# \[' quant_bias_corrected.sf",
@@ -337,8 +421,10 @@ class _Sailfish(_TranscriptomeBasedQuantifierBase):
             ref_name = cls._get_ref_name(params[QUANTIFIER_DIRECTORY])
             index_dir = cls._get_index_dir(params[QUANTIFIER_DIRECTORY])
 
-            writer.add_line(cls.CREATE_SAILFISH_TRANSCRIPT_INDEX.format(
-                ref_name=ref_name, index_dir=index_dir))
+            writer.add_line(run_log.measured_command(
+                cls.CREATE_SAILFISH_TRANSCRIPT_INDEX.format(
+                    ref_name=ref_name, index_dir=index_dir,
+                    num_threads=params[NUM_THREADS])))
 
     @classmethod
     def write_quantification_commands(cls, writer, params):
@@ -347,16 +433,19 @@ class _Sailfish(_TranscriptomeBasedQuantifierBase):
         library_spec = "\"T=SE:S=U\"" if SIMULATED_READS in params \
             else "\"T=PE:O=><:S=SA\""
 
-        reads_spec = "-r {r}".format(r=params[SIMULATED_READS]) \
+        reads_spec = "-r {r}".format(
+            r=cls._get_reads(params, SIMULATED_READS)) \
             if SIMULATED_READS in params \
             else "-1 {l} -2 {r}".format(
-                l=params[LEFT_SIMULATED_READS],
-                r=params[RIGHT_SIMULATED_READS])
-
-        writer.add_line(cls.QUANTIFY_ISOFORM_EXPRESSION.format(
-            index_dir=index_dir,
-            library_spec=library_spec,
-            reads_spec=reads_spec))
+                l=cls._get_reads(params, LEFT_SIMULATED_READS),
+                r=cls._get_reads(params, RIGHT_SIMULATED_READS))
+
+        writer.add_line(run_log.measured_command(
+            cls.QUANTIFY_ISOFORM_EXPRESSION.format(
+                index_dir=index_dir,
+                library_spec=library_spec,
+                reads_spec=reads_spec,
+                num_threads=params[NUM_THREADS])))
         writer.add_pipe(*cls.FILTER_COMMENT_LINES)
 
     @classmethod
@@ -376,10 +465,12 @@ class _Sailfish(_TranscriptomeBasedQuantifierBase):
 @_Quantifier
 class _Salmon(_TranscriptomeBasedQuantifierBase):
     CREATE_SALMON_TRANSCRIPT_INDEX = \
-        "salmon index -t {ref_name}.transcripts.fa -i {index_dir}"
+        "salmon index -p {num_threads} -t {ref_name}.transcripts.fa " + \
+        "-i {index_dir}"
 
     QUANTIFY_ISOFORM_EXPRESSION = \
-        "salmon quant -p 8 -i {index_dir} -l {library_spec} {reads_spec} -o ."
+        "salmon quant -p {num_threads} -i {index_dir} -l {library_spec} " + \
+        "{reads_spec} -o ."
     FILTER_COMMENT_LINES = [
         "grep -v '^# \[\|salmon' quant.sf",
         "sed -e 's/# //'i > quant_filtered.csv"
@@ -392,6 +483,10 @@ class _Salmon(_TranscriptomeBasedQuantifierBase):
     def get_name(cls):
         return "Salmon"
 
+    @classmethod
+    def _reads_compressed_natively(cls):
+        return True
+
     @classmethod
     def _needs_bowtie_index(cls):
         return False
@@ -414,8 +509,10 @@ class _Salmon(_TranscriptomeBasedQuantifierBase):
 
                 ref_name = cls._get_ref_name(params[QUANTIFIER_DIRECTORY])
 
-                writer.add_line(cls.CREATE_SALMON_TRANSCRIPT_INDEX.format(
-                    ref_name=ref_name, index_dir=index_dir))
+                writer.add_line(run_log.measured_command(
+                    cls.CREATE_SALMON_TRANSCRIPT_INDEX.format(
+                        ref_name=ref_name, index_dir=index_dir,
+                        num_threads=params[NUM_THREADS])))
 
     @classmethod
     def write_quantification_commands(cls, writer, params):
@@ -423,16 +520,19 @@ class _Salmon(_TranscriptomeBasedQuantifierBase):
 
         library_spec = "U" if SIMULATED_READS in params else "ISF"
 
-        reads_spec = "-r {r}".format(r=params[SIMULATED_READS]) \
+        reads_spec = "-r {r}".format(
+            r=cls._get_reads(params, SIMULATED_READS)) \
             if SIMULATED_READS in params \
             else "-1 {l} -2 {r}".format(
-                l=params[LEFT_SIMULATED_READS],
-                r=params[RIGHT_SIMULATED_READS])
-
-        writer.add_line(cls.QUANTIFY_ISOFORM_EXPRESSION.format(
-            index_dir=index_dir,
-            library_spec=library_spec,
-            reads_spec=reads_spec))
+                l=cls._get_reads(params, LEFT_SIMULATED_READS),
+                r=cls._get_reads(params, RIGHT_SIMULATED_READS))
+
+        writer.add_line(run_log.measured_command(
+            cls.QUANTIFY_ISOFORM_EXPRESSION.format(
+                index_dir=index_dir,
+                library_spec=library_spec,
+                reads_spec=reads_spec,
+                num_threads=params[NUM_THREADS])))
         writer.add_pipe(*cls.FILTER_COMMENT_LINES)
 
     @classmethod
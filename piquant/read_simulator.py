@@ -0,0 +1,406 @@
+"""
+Functions for simulating RNA-seq reads from a FluxSimulator expression
+profile using NumPy, as a fast alternative to FluxSimulator's library
+construction and sequencing steps. Exports:
+
+read_transcriptome: Return the sequences of transcripts in an expression
+profile.
+simulate_chunk: Return simulated reads and BED records for a chunk of
+fragments.
+get_chunk_sizes: Return the number of fragments to simulate in each chunk.
+
+Transcriptome: Sequences and structures of a set of expressed transcripts.
+"""
+
+import bias_models
+import collections
+import gtf
+import flux_simulator as fs
+import numpy as np
+import os.path
+import reads as rd
+
+_COMPLEMENT = np.arange(256, dtype=np.uint8)
+_COMPLEMENT[np.array(list("ACGTNacgtn"), dtype="S1").view(np.uint8)] = \
+    np.array(list("TGCANTGCAN"), dtype="S1").view(np.uint8)
+
+_GENOME_FASTA_SUFFIX = ".fa"
+
+# Limits on the number of candidate fragments drawn at a time, and on the
+# acceptance rate assumed, when fragments are selected by rejection sampling
+_MAX_CANDIDATES = 1000000
+_MIN_ACCEPTANCE = 0.001
+
+# Number of fragments whose GC content is calculated at a time
+_GC_BATCH_SIZE = 10000
+
+Transcriptome = collections.namedtuple(
+    "Transcriptome",
+    ["ids", "loci", "chromosomes", "strands", "weights", "bases", "offsets",
+     "lengths", "exon_offsets", "exon_starts", "exon_ends"])
+
+
+def _read_chromosome(genome_fasta_dir, chromosome):
+    # Per-chromosome genome sequences are held in FASTA files named after the
+    # chromosome, as expected by FluxSimulator
+    fasta_file = os.path.join(
+        genome_fasta_dir, chromosome + _GENOME_FASTA_SUFFIX)
+    with open(fasta_file) as f:
+        return "".join(
+            [line.strip() for line in f if not line.startswith(">")]).upper()
+
+
+def _read_transcript_exons(gtf_file, transcript_ids):
+    # Return, for each transcript, its chromosome, strand and exons (as
+    # 1-based, inclusive genomic coordinates) in transcript order
+    gtf_info = gtf.read_gtf_file(gtf_file)
+    exon_info = gtf_info[gtf_info[gtf.FEATURE_COL] == gtf.EXON_FEATURE]
+
+    exons = collections.defaultdict(list)
+    for chromosome, start, end, strand, attributes in zip(
+            exon_info[gtf.SEQUENCE_COL], exon_info[gtf.START_COL],
+            exon_info[gtf.END_COL], exon_info[gtf.STRAND_COL],
+            exon_info[gtf.ATTRIBUTES_COL]):
+        transcript_id = gtf.get_attributes_dict(attributes)[
+            gtf.TRANSCRIPT_ID_ATTRIBUTE].rstrip(";")
+        if transcript_id in transcript_ids:
+            exons[transcript_id].append(
+                (str(chromosome), int(start), int(end), str(strand)))
+
+    structures = {}
+    for transcript_id, transcript_exons in exons.items():
+        chromosome, strand = transcript_exons[0][0], transcript_exons[0][3]
+        transcript_exons = sorted([(s, e) for _, s, e, _ in transcript_exons],
+                                  reverse=(strand == "-"))
+        structures[transcript_id] = (chromosome, strand, transcript_exons)
+    return structures
+
+
+def _get_transcript_sequence(chromosome_seq, strand, exons):
+    sequence = "".join([chromosome_seq[s - 1:e] for s, e in sorted(exons)])
+    if strand == "-":
+        sequence = np.frombuffer(sequence, dtype=np.uint8)
+        sequence = _COMPLEMENT[sequence][::-1].tostring()
+    return sequence
+
+
+def read_transcriptome(pro_file, gtf_file, genome_fasta_dir):
+    """
+    Return the sequences and structures of transcripts in a profile.
+
+    Return a Transcriptome instance describing those transcripts with non-zero
+    expression in a FluxSimulator expression profile. Transcript sequences are
+    packed into a single array of bases; each transcript is weighted by its
+    number of molecules in the profile.
+    pro_file: Path to a FluxSimulator expression profile file.
+    gtf_file: Path to a GTF-formatted file describing the transcripts.
+    genome_fasta_dir: Path to a directory containing per-chromosome genome
+    sequences as FASTA files.
+    """
+    profiles = fs.read_expression_profiles(pro_file)
+    weight_col = fs.PRO_FILE_NUM_COL \
+        if profiles[fs.PRO_FILE_NUM_COL].sum() > 0 else fs.PRO_FILE_FRAC_COL
+    profiles = profiles[profiles[weight_col] > 0]
+
+    weights = dict(zip(profiles[fs.PRO_FILE_TRANSCRIPT_ID_COL],
+                       profiles[weight_col]))
+    loci = dict(zip(profiles[fs.PRO_FILE_TRANSCRIPT_ID_COL], profiles[0]))
+    structures = _read_transcript_exons(gtf_file, set(weights))
+
+    ids, sequences, exon_offsets, exon_starts, exon_ends = [], [], [], [], []
+    offset = 0
+    by_chromosome = collections.defaultdict(list)
+    for transcript_id, (chromosome, _, _) in sorted(structures.items()):
+        by_chromosome[chromosome].append(transcript_id)
+
+    for chromosome, transcript_ids in sorted(by_chromosome.items()):
+        chromosome_seq = _read_chromosome(genome_fasta_dir, chromosome)
+        for transcript_id in transcript_ids:
+            _, strand, exons = structures[transcript_id]
+            ids.append(transcript_id)
+            sequences.append(
+                _get_transcript_sequence(chromosome_seq, strand, exons))
+            for start, end in exons:
+                exon_offsets.append(offset)
+                exon_starts.append(start)
+                exon_ends.append(end)
+                offset += end - start + 1
+
+    lengths = np.array([len(s) for s in sequences], dtype=np.int64)
+    return Transcriptome(
+        ids=ids,
+        loci=[loci[t] for t in ids],
+        chromosomes=[structures[t][0] for t in ids],
+        strands=np.array([structures[t][1] == "-" for t in ids]),
+        weights=np.array([weights[t] for t in ids], dtype=np.float64),
+        bases=np.frombuffer("".join(sequences), dtype=np.uint8),
+        offsets=np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(
+            np.int64),
+        lengths=lengths,
+        exon_offsets=np.array(exon_offsets, dtype=np.int64),
+        exon_starts=np.array(exon_starts, dtype=np.int64),
+        exon_ends=np.array(exon_ends, dtype=np.int64))
+
+
+def get_chunk_sizes(num_fragments, chunk_size):
+    """
+    Return the number of fragments to simulate in each chunk.
+
+    num_fragments: The total number of fragments to simulate.
+    chunk_size: The maximum number of fragments in each chunk.
+    """
+    num_chunks, remainder = divmod(num_fragments, chunk_size)
+    return [chunk_size] * num_chunks + ([remainder] if remainder else [])
+
+
+def _get_fragment_probabilities(transcriptome, read_length):
+    # Fragments are drawn from transcripts in proportion to their number of
+    # molecules and the number of positions at which a read can start
+    positions = np.maximum(transcriptome.lengths - read_length + 1, 0)
+    weights = transcriptome.weights * positions
+    return weights / weights.sum()
+
+
+def _sample_fragments(transcriptome, num_fragments, read_length,
+                      fragment_length, fragment_sd, rng):
+    probabilities = _get_fragment_probabilities(transcriptome, read_length)
+    counts = rng.multinomial(num_fragments, probabilities)
+    transcripts = np.repeat(np.arange(len(counts)), counts)
+
+    transcript_lengths = transcriptome.lengths[transcripts]
+    lengths = np.round(rng.normal(
+        fragment_length, fragment_sd, num_fragments)).astype(np.int64)
+    lengths = np.minimum(np.maximum(lengths, read_length), transcript_lengths)
+    starts = (rng.random_sample(num_fragments) *
+              (transcript_lengths - lengths + 1)).astype(np.int64)
+
+    # Each fragment is sequenced from either end at random; for paired-end
+    # reads, the mate is sequenced from the opposite end
+    antisense = rng.random_sample(num_fragments) < 0.5
+    return transcripts, starts, lengths, antisense
+
+
+def _get_read_bases(transcriptome, starts, read_length, reverse):
+    positions = starts[:, np.newaxis] + np.arange(read_length)
+    bases = transcriptome.bases[positions]
+    return _COMPLEMENT[bases][:, ::-1] if reverse else bases
+
+
+def _get_first_read_bases(transcriptome, fragment_starts, fragment_ends,
+                          antisense, num_bases):
+    # Return the first bases of the first read of each fragment, without
+    # extracting the whole read
+    forward = _get_read_bases(
+        transcriptome, fragment_starts, num_bases, False)
+    reverse = _get_read_bases(
+        transcriptome, fragment_ends - num_bases, num_bases, True)
+    return np.where(antisense[:, np.newaxis], reverse, forward)
+
+
+def _get_gc_content(transcriptome, fragment_starts, lengths):
+    # The bases of fragments are extracted a batch at a time, masking those
+    # beyond the end of shorter fragments in the batch
+    gc_content = np.zeros(len(fragment_starts))
+    for start in xrange(0, len(fragment_starts), _GC_BATCH_SIZE):
+        batch_starts = fragment_starts[start:start + _GC_BATCH_SIZE]
+        batch_lengths = lengths[start:start + _GC_BATCH_SIZE]
+        offsets = np.arange(batch_lengths.max())
+        positions = np.minimum(batch_starts[:, np.newaxis] + offsets,
+                               len(transcriptome.bases) - 1)
+        bases = np.where(offsets < batch_lengths[:, np.newaxis],
+                         transcriptome.bases[positions], 0)
+        gc_content[start:start + _GC_BATCH_SIZE] = \
+            bias_models.count_gc(bases) / \
+            np.maximum(batch_lengths, 1).astype(np.float64)
+    return gc_content
+
+
+class _SimulatedFragments:
+    # A batch of candidate fragments, described for weighting by a bias model
+    def __init__(self, transcriptome, transcripts, starts, lengths, antisense,
+                 read_length):
+        self.transcriptome = transcriptome
+        self.transcripts = transcripts
+        self.starts = starts
+        self.lengths = lengths
+        self.antisense = antisense
+        self.read_length = read_length
+        self.fragment_starts = transcriptome.offsets[transcripts] + starts
+
+    def first_read_bases(self, num_bases):
+        return _get_first_read_bases(
+            self.transcriptome, self.fragment_starts,
+            self.fragment_starts + self.lengths, self.antisense,
+            min(num_bases, self.read_length))
+
+    def gc_content(self):
+        return _get_gc_content(
+            self.transcriptome, self.fragment_starts, self.lengths)
+
+    def positions(self):
+        return (self.starts + self.lengths / 2.0) / \
+            self.transcriptome.lengths[self.transcripts]
+
+
+def _sample_biased_fragments(transcriptome, num_fragments, read_length,
+                             fragment_length, fragment_sd, bias_model, rng):
+    # Bias is simulated by rejection sampling: candidate fragments are
+    # accepted with probability proportional to their weight under the bias
+    # model, until enough have been accepted. Candidates are drawn in batches
+    # sized by the acceptance rate so far.
+    max_weight = bias_model.max_weight()
+
+    accepted = []
+    num_accepted, num_candidates, acceptance = 0, 0, 1.0
+    while num_accepted < num_fragments:
+        batch_size = min(int((num_fragments - num_accepted) / acceptance) + 1,
+                         _MAX_CANDIDATES)
+        candidates = _sample_fragments(
+            transcriptome, batch_size, read_length,
+            fragment_length, fragment_sd, rng)
+
+        weights = bias_model.weigh(_SimulatedFragments(
+            transcriptome, *candidates, read_length=read_length))
+        keep = rng.random_sample(batch_size) * max_weight < weights
+
+        accepted.append([c[keep] for c in candidates])
+        num_accepted += keep.sum()
+        num_candidates += batch_size
+        acceptance = max(float(num_accepted) / num_candidates, _MIN_ACCEPTANCE)
+
+    return [np.concatenate(c)[:num_fragments] for c in zip(*accepted)]
+
+
+def _get_genomic_positions(transcriptome, positions):
+    # Map positions in the packed transcript sequences to 1-based genomic
+    # coordinates, via the exon containing each position
+    exons = np.searchsorted(
+        transcriptome.exon_offsets, positions, side="right") - 1
+    within_exon = positions - transcriptome.exon_offsets[exons]
+    return np.where(
+        _get_exon_reversed(transcriptome)[exons],
+        transcriptome.exon_ends[exons] - within_exon,
+        transcriptome.exon_starts[exons] + within_exon)
+
+
+def _get_exon_reversed(transcriptome):
+    exon_transcripts = np.searchsorted(
+        transcriptome.offsets, transcriptome.exon_offsets, side="right") - 1
+    return transcriptome.strands[exon_transcripts]
+
+
+def _format_records(names, reads, qualities):
+    if qualities is None:
+        return "".join([">{n}\n{s}\n".format(n=n, s=r.tostring())
+                        for n, r in zip(names, reads)])
+    return "".join(["@{n}\n{s}\n+\n{q}\n".format(n=n, s=r.tostring(),
+                                                   q=qualities)
+                    for n, r in zip(names, reads)])
+
+
+def _interleave(left, right):
+    return [x for pair in zip(left, right) for x in pair]
+
+
+def simulate_chunk(transcriptome, chunk_index, num_fragments, first_fragment,
+                   read_length, paired_end=False, errors=False,
+                   fragment_length=250, fragment_sd=50, seed=0,
+                   bias_model=None):
+    """
+    Return simulated reads and BED records for a chunk of fragments.
+
+    Return a tuple of two strings - FASTA (or, if 'errors' is True, FASTQ)
+    records for the reads simulated, and BED records giving the genomic
+    location of each read. Paired-end reads are written as consecutive
+    records with names ending "/1" and "/2", in the same layout as reads output
+    by FluxSimulator. Each chunk uses its own random number generator, seeded
+    by the overall seed and the index of the chunk, so that the reads simulated
+    do not depend on how chunks are distributed between processes. If a bias
+    model is given, bias is simulated as fragments are drawn, so that the
+    number of fragments requested are created directly, rather than selected
+    from a larger pool.
+    transcriptome: A Transcriptome instance.
+    chunk_index: Index of this chunk.
+    num_fragments: The number of fragments to simulate in this chunk.
+    first_fragment: The overall number of the first fragment in this chunk.
+    read_length: The length of simulated reads.
+    paired_end: Whether single- or paired-end reads should be simulated.
+    errors: Whether reads should be simulated with errors or not.
+    fragment_length: Mean length of fragments.
+    fragment_sd: Standard deviation of the length of fragments.
+    seed: Seed for the random number generator.
+    bias_model: If not None, a bias model (see the bias_models module) by
+    which each fragment is weighted to determine its chance of being
+    simulated.
+    """
+    rng = np.random.RandomState([seed, chunk_index])
+    if bias_model is None or num_fragments == 0:
+        transcripts, starts, lengths, antisense = _sample_fragments(
+            transcriptome, num_fragments, read_length,
+            fragment_length, fragment_sd, rng)
+    else:
+        transcripts, starts, lengths, antisense = _sample_biased_fragments(
+            transcriptome, num_fragments, read_length,
+            fragment_length, fragment_sd, bias_model, rng)
+
+    fragment_starts = transcriptome.offsets[transcripts] + starts
+    fragment_ends = fragment_starts + lengths
+
+    forward = _get_read_bases(
+        transcriptome, fragment_starts, read_length, False)
+    reverse = _get_read_bases(
+        transcriptome, fragment_ends - read_length, read_length, True)
+    first = np.where(antisense[:, np.newaxis], reverse, forward)
+    second = np.where(antisense[:, np.newaxis], forward, reverse)
+
+    qualities = None
+    if errors:
+        qualities = rd.add_substitution_errors(first, rng)
+        rd.add_substitution_errors(second, rng)
+
+    names = ["{locus}:{transcript}:{fragment}:{length}:{start}:{end}:{dir}".
+             format(locus=transcriptome.loci[t],
+                    transcript=transcriptome.ids[t],
+                    fragment=first_fragment + i,
+                    length=transcriptome.lengths[t],
+                    start=s + 1, end=s + l, dir="A" if a else "S")
+             for i, (t, s, l, a) in enumerate(
+                 zip(transcripts, starts, lengths, antisense))]
+
+    # The genomic span of each read is derived from the genomic coordinates
+    # of its first and last bases
+    read_starts = [np.where(antisense, fragment_ends - read_length,
+                            fragment_starts)]
+    read_orientations = [antisense]
+    if paired_end:
+        read_starts.append(np.where(antisense, fragment_starts,
+                                    fragment_ends - read_length))
+        read_orientations.append(~antisense)
+
+    bed_records = []
+    for mate, (read_start, reversed_read) in enumerate(
+            zip(read_starts, read_orientations)):
+        start_positions = _get_genomic_positions(transcriptome, read_start)
+        end_positions = _get_genomic_positions(
+            transcriptome, read_start + read_length - 1)
+        minus_strand = reversed_read != transcriptome.strands[transcripts]
+        suffix = "/{m}".format(m=mate + 1) if paired_end else ""
+        bed_records.append([
+            "{c}\t{s}\t{e}\t{n}{x}\t0\t{st}\n".format(
+                c=transcriptome.chromosomes[t], s=min(p, q) - 1,
+                e=max(p, q), n=name, x=suffix, st="-" if minus else "+")
+            for t, p, q, name, minus in zip(
+                transcripts, start_positions, end_positions, names,
+                minus_strand)])
+
+    if paired_end:
+        reads = _interleave(first, second)
+        read_names = _interleave([n + "/1" for n in names],
+                                 [n + "/2" for n in names])
+        bed = "".join(_interleave(*bed_records))
+    else:
+        reads = first
+        read_names = names
+        bed = "".join(bed_records[0])
+
+    return _format_records(read_names, reads, qualities), bed
@@ -0,0 +1,1416 @@
+"""
+Functions for processing FASTA/Q files of simulated reads as sequences of
+fragments, where a fragment is either a single read or, for paired-end reads,
+a consecutive pair of reads. Exports:
+
+get_lines_per_fragment: Return the number of lines describing each fragment.
+has_qualities: Return True if a reads file is in FASTQ format.
+read_fragments: Yield the fragments of a reads file.
+split_fragment: Return the left and right reads of a paired-end fragment.
+reading_reads_file: Context manager opening a reads file for reading.
+writing_reads_file: Context manager opening a reads file for writing.
+count_fragments: Return the number of fragments in a reads file.
+subsample_fragments: Write a random subsample of the fragments of reads files.
+merge_fragments: Merge the fragments of two sets of reads files in random order.
+FragmentShuffler: Shuffles fragments using a bounded amount of memory.
+shuffling_fragments: Context manager creating a FragmentShuffler.
+shuffle_fragments: Write the fragments of a reads file in random order.
+TopScoringFragments: Retains the highest scoring of a stream of fragments.
+get_error_rates: Return per-position substitution error rates for reads.
+add_substitution_errors: Add substitution errors to an array of reads.
+inject_errors: Write reads with substitution errors to a FASTQ file.
+index_fragments: Return the byte offset of each fragment in a reads file.
+get_fragment_index: Return a reads file's fragment index, via a sidecar file.
+copy_fragments: Write selected fragments of a reads file, via its index.
+score_fragments: Return the highest scoring fragments of a reads file, scoring
+chunks of it in parallel.
+scan_reads: Check the integrity of reads files, and gather their statistics.
+ReadOrigins: The transcript of origin of each read in a set of simulated reads.
+load_read_origins: Return read origins saved to a file.
+index_read_origins: Return the transcript of origin of each read in a reads
+file.
+count_read_assignments: Count the reads a quantifier assigned to each
+transcript, and correctly.
+"""
+
+import bias_models
+import contextlib
+import distutils.spawn
+import flux_simulator as fs
+import itertools
+import math
+import mmap
+import multiprocessing
+import numpy as np
+import os
+import os.path
+import random
+import shutil
+import subprocess
+import tempfile
+
+# The in-memory size of a list of fragments read from a file is estimated as
+# this multiple of their size on disk.
+_MEMORY_FACTOR = 2
+_MAX_BUCKETS = 512
+_BUCKET_FILE = "bucket{n}"
+_READ_BLOCK_SIZE = 1024 * 1024
+
+# pigz is used for multi-threaded compression, if available.
+_COMPRESSORS = ["pigz", "gzip"]
+
+# Substitution errors occur with a probability rising linearly along each
+# read, between these rates.
+_ERROR_RATE_START = 0.001
+_ERROR_RATE_END = 0.02
+_ERROR_BATCH_SIZE = 100000
+_BASES = np.frombuffer("ACGT", dtype=np.uint8)
+_BASE_CODES = np.zeros(256, dtype=np.uint8) + len(_BASES)
+_BASE_CODES[_BASES] = np.arange(len(_BASES), dtype=np.uint8)
+
+# Fragment indexes are written alongside reads files, in files with this
+# suffix; reads files are scanned, and fragments copied, in blocks of this
+# many bytes.
+_FRAGMENT_INDEX_SUFFIX = ".fidx"
+_INDEX_BLOCK_SIZE = 64 * 1024 * 1024
+_COPY_BLOCK_SIZE = 4 * 1024 * 1024
+
+# Fragments are scored in chunks of this many fragments, each of which may be
+# scored by a different process, and within a chunk in batches of this many
+# fragments.
+_SCORE_CHUNK_SIZE = 1000000
+_SCORE_BATCH_SIZE = 100000
+
+# Reads files are scanned for integrity checking in blocks of at least this
+# many bytes.
+_SCAN_BLOCK_SIZE = 8 * 1024 * 1024
+_NEWLINE = ord("\n")
+_MATE_SUFFIXES = np.frombuffer("12", dtype=np.uint8)
+_COMPOSITION_BASES = "ACGTN"
+
+# Strings of bytes are fingerprinted by summing their bytes, weighted by
+# these pseudo-random values for each position.
+_FINGERPRINT_WEIGHTS = np.random.RandomState(0).randint(
+    1, 2 ** 62, size=1024).astype(np.int64)
+
+# The names of simulated reads end with fields giving the transcript from which
+# each read originated, its fragment number, the transcript's length, the
+# start and end of the fragment within it and the fragment's orientation.
+_TRANSCRIPT_NAME_FIELD = -6
+
+# SAM alignment flags
+_SAM_UNMAPPED = 0x4
+_SAM_SECOND_READ = 0x80
+_SAM_SECONDARY = 0x100
+_SAM_SUPPLEMENTARY = 0x800
+
+
+def get_lines_per_fragment(errors, paired_end):
+    """
+    Return the number of lines describing each fragment in a reads file.
+
+    errors: True if the reads file is in FASTQ format (i.e. reads have quality
+    scores), or False if it is in FASTA format.
+    paired_end: True if the reads file contains paired-end reads.
+    """
+    lines_per_fragment = 2
+    if errors:
+        lines_per_fragment *= 2
+    if paired_end:
+        lines_per_fragment *= 2
+    return lines_per_fragment
+
+
+def has_qualities(reads_file):
+    """
+    Return True if a reads file is in FASTQ format, judged by its name.
+
+    reads_file: Path of a FASTA/Q file, which may be gzip-compressed.
+    """
+    if reads_file.endswith(fs.COMPRESSED_READS_SUFFIX):
+        reads_file = reads_file[:-len(fs.COMPRESSED_READS_SUFFIX)]
+    return reads_file.endswith(".fastq")
+
+
+def read_fragments(reads_file, lines_per_fragment):
+    """
+    Yield the fragments of a reads file.
+
+    Each fragment is yielded as a single string containing all of its lines.
+    If the reads file ends with an incomplete fragment, a ValueError is
+    raised.
+    reads_file: An open FASTA/Q file object.
+    lines_per_fragment: Number of lines describing each fragment.
+    """
+    while True:
+        lines = list(itertools.islice(reads_file, lines_per_fragment))
+        if not lines:
+            return
+        if len(lines) < lines_per_fragment:
+            raise ValueError(
+                "Reads file ends with an incomplete fragment of " +
+                "{n} lines".format(n=len(lines)))
+        yield "".join(lines)
+
+
+def split_fragment(fragment):
+    """
+    Return the left and right reads of a paired-end fragment.
+
+    The left read is that whose name ends with "/1", and the right read that
+    whose name ends with "/2"; if neither read is so named, they are returned
+    in the order in which they appear in the fragment.
+    fragment: A string containing the lines describing a read pair.
+    """
+    lines = fragment.splitlines(True)
+    half = len(lines) / 2
+    first, second = "".join(lines[:half]), "".join(lines[half:])
+    if lines[0].rstrip().endswith("/2") or \
+            lines[half].rstrip().endswith("/1"):
+        return second, first
+    return first, second
+
+
+def _get_compress_command(*args):
+    for compressor in _COMPRESSORS:
+        executable = distutils.spawn.find_executable(compressor)
+        if executable:
+            return [executable, "-c"] + list(args)
+    raise IOError("No gzip compressor found")
+
+
+@contextlib.contextmanager
+def reading_reads_file(reads_file):
+    """
+    Context manager returning a file object from which reads are read.
+
+    If the name of the reads file ends with the suffix
+    flux_simulator.COMPRESSED_READS_SUFFIX, reads are decompressed as they are
+    read.
+    reads_file: Path of the FASTA/Q file to read.
+    """
+    if not reads_file.endswith(fs.COMPRESSED_READS_SUFFIX):
+        with open(reads_file) as f:
+            yield f
+        return
+
+    decompressor = subprocess.Popen(
+        _get_compress_command("-d", reads_file), stdout=subprocess.PIPE)
+    try:
+        yield decompressor.stdout
+    finally:
+        decompressor.stdout.close()
+        return_code = decompressor.wait()
+
+    if return_code != 0:
+        raise IOError("Decompression of reads file {f} failed".format(
+            f=reads_file))
+
+
+@contextlib.contextmanager
+def writing_reads_file(reads_file):
+    """
+    Context manager returning a file object to which reads are written.
+
+    If the name of the reads file ends with the suffix
+    flux_simulator.COMPRESSED_READS_SUFFIX, reads are gzip-compressed as they
+    are written - using multiple threads, if pigz is available.
+    reads_file: Path of the FASTA/Q file to write.
+    """
+    if not reads_file.endswith(fs.COMPRESSED_READS_SUFFIX):
+        with open(reads_file, "w") as f:
+            yield f
+        return
+
+    with open(reads_file, "wb") as out_f:
+        compressor = subprocess.Popen(
+            _get_compress_command(), stdin=subprocess.PIPE, stdout=out_f)
+        try:
+            yield compressor.stdin
+        finally:
+            compressor.stdin.close()
+            return_code = compressor.wait()
+
+    if return_code != 0:
+        raise IOError("Compression of reads file {f} failed".format(
+            f=reads_file))
+
+
+def count_fragments(reads_file, lines_per_fragment):
+    """
+    Return the number of fragments in a reads file.
+
+    reads_file: Path of the FASTA/Q file, which may be gzip-compressed.
+    lines_per_fragment: Number of lines describing each fragment.
+    """
+    num_lines = 0
+    with reading_reads_file(reads_file) as f:
+        for block in iter(lambda: f.read(_READ_BLOCK_SIZE), ""):
+            num_lines += block.count("\n")
+    return num_lines / lines_per_fragment
+
+
+@contextlib.contextmanager
+def _entering_all(context_managers):
+    if not context_managers:
+        yield []
+        return
+    with context_managers[0] as first, \
+            _entering_all(context_managers[1:]) as rest:
+        yield [first] + rest
+
+
+def subsample_fragments(reads_files, out_files, num_selected, seed=None):
+    """
+    Write a random subsample of the fragments of one or two reads files.
+
+    A uniformly random subsample of the specified size is drawn in a single
+    pass through the reads, preserving the order of the selected fragments.
+    For paired-end reads, the left and right reads of each selected pair are
+    written to respective output files. If there are fewer fragments than the
+    number to be selected, a ValueError is raised.
+    reads_files: Paths of a single-end reads file, or of files of left and
+    right reads; files may be gzip-compressed.
+    out_files: Paths of the files to write the selected reads to,
+    corresponding to the reads files.
+    num_selected: Number of fragments to select.
+    seed: Seed for the random number generator; if None, a different
+    subsample is drawn each time.
+    """
+    lines_per_read = get_lines_per_fragment(
+        has_qualities(reads_files[0]), False)
+    num_fragments = count_fragments(reads_files[0], lines_per_read)
+    if num_selected > num_fragments:
+        raise ValueError(
+            "Reads file(s) did not contain enough fragments " +
+            "({ni} found, {no} required)".format(
+                ni=num_fragments, no=num_selected))
+
+    rng = random.Random(seed)
+    with _entering_all([reading_reads_file(f) for f in reads_files]) \
+            as in_fs, \
+            _entering_all([writing_reads_file(f) for f in out_files]) \
+            as out_fs:
+        # Each fragment is selected with probability equal to the number of
+        # fragments still to be selected divided by the number remaining
+        fragments = itertools.izip(
+            *[read_fragments(f, lines_per_read) for f in in_fs])
+        for num_seen, fragment_reads in enumerate(fragments):
+            if rng.random() * (num_fragments - num_seen) < num_selected:
+                num_selected -= 1
+                for out_f, read in zip(out_fs, fragment_reads):
+                    out_f.write(read)
+
+
+def merge_fragments(reads_files, extra_reads_files, out_files, seed=None):
+    """
+    Merge the fragments of two sets of reads files in random order.
+
+    The fragments of each set of reads are assumed to be shuffled already; in
+    a single pass through both, they are interleaved uniformly at random, so
+    that the merged fragments are also shuffled, without the reads being
+    shuffled afresh. For paired-end reads, the left and right reads of each
+    fragment are written to respective output files.
+    reads_files: Paths of a single-end reads file, or of files of left and
+    right reads; files may be gzip-compressed.
+    extra_reads_files: Paths of the reads files to merge with these,
+    corresponding to the reads files.
+    out_files: Paths of the files to write the merged reads to, corresponding
+    to the reads files.
+    seed: Seed for the random number generator; if None, fragments are
+    interleaved differently each time.
+    """
+    lines_per_read = get_lines_per_fragment(
+        has_qualities(reads_files[0]), False)
+    num_fragments = count_fragments(reads_files[0], lines_per_read)
+    num_extra_fragments = count_fragments(
+        extra_reads_files[0], lines_per_read)
+
+    rng = random.Random(seed)
+    with _entering_all([reading_reads_file(f) for f in reads_files]) \
+            as in_fs, \
+            _entering_all([reading_reads_file(f)
+                           for f in extra_reads_files]) as extra_fs, \
+            _entering_all([writing_reads_file(f) for f in out_files]) \
+            as out_fs:
+        # Each fragment is taken from the first set of reads with probability
+        # equal to the number of its fragments remaining divided by the total
+        # number remaining
+        fragments = itertools.izip(
+            *[read_fragments(f, lines_per_read) for f in in_fs])
+        extra_fragments = itertools.izip(
+            *[read_fragments(f, lines_per_read) for f in extra_fs])
+        while num_fragments + num_extra_fragments > 0:
+            if rng.random() * (num_fragments + num_extra_fragments) < \
+                    num_fragments:
+                num_fragments -= 1
+                fragment_reads = next(fragments)
+            else:
+                num_extra_fragments -= 1
+                fragment_reads = next(extra_fragments)
+            for out_f, read in zip(out_fs, fragment_reads):
+                out_f.write(read)
+
+
+def _get_num_buckets(size, buffer_size):
+    required_memory = size * _MEMORY_FACTOR
+    num_buckets = int(math.ceil(required_memory / float(buffer_size)))
+    return min(max(num_buckets, 1), _MAX_BUCKETS)
+
+
+class _MemoryBucket:
+    def __init__(self):
+        self.fragments = []
+
+    def add(self, fragment):
+        self.fragments.append(fragment)
+
+    def close(self):
+        pass
+
+    def read(self, lines_per_fragment):
+        fragments = self.fragments
+        self.fragments = []
+        return fragments
+
+
+class _FileBucket:
+    def __init__(self, bucket_file):
+        self.bucket_file = bucket_file
+        self.f = open(bucket_file, "w")
+
+    def add(self, fragment):
+        self.f.write(fragment)
+
+    def close(self):
+        self.f.close()
+
+    def read(self, lines_per_fragment):
+        with open(self.bucket_file) as f:
+            fragments = list(read_fragments(f, lines_per_fragment))
+        os.remove(self.bucket_file)
+        return fragments
+
+
+class FragmentShuffler:
+    """
+    Shuffles fragments using a bounded amount of memory.
+
+    Fragments added to the shuffler are distributed uniformly at random
+    between a number of buckets; if there is more than one bucket, each is
+    held in a temporary file. Each bucket is then small enough to be shuffled
+    in memory, and the concatenation of the shuffled buckets is a uniformly
+    random permutation of the added fragments. No state is held for each
+    fragment beyond the fragment itself, in its bucket. (To shuffle only the
+    highest scoring of a stream of fragments, they may first be selected with
+    a TopScoringFragments instance.)
+    """
+    def __init__(self, lines_per_fragment, num_buckets=1, seed=None,
+                 temp_dir=None):
+        self.lines_per_fragment = lines_per_fragment
+        self.rng = random.Random(seed)
+        self.num_fragments = 0
+
+        self.bucket_dir = None
+        if num_buckets == 1:
+            self.buckets = [_MemoryBucket()]
+        else:
+            self.bucket_dir = tempfile.mkdtemp(dir=temp_dir)
+            self.buckets = [_FileBucket(os.path.join(
+                self.bucket_dir, _BUCKET_FILE.format(n=i)))
+                for i in range(num_buckets)]
+
+    def add(self, fragment):
+        """
+        Add a fragment to be shuffled.
+
+        fragment: A string containing the lines describing the fragment.
+        """
+        self.num_fragments += 1
+        self.rng.choice(self.buckets).add(fragment)
+
+    def shuffled(self):
+        """
+        Yield the added fragments in random order.
+        """
+        for bucket in self.buckets:
+            bucket.close()
+
+        for bucket in self.buckets:
+            fragments = bucket.read(self.lines_per_fragment)
+            self.rng.shuffle(fragments)
+            for fragment in fragments:
+                yield fragment
+
+    def close(self):
+        """
+        Remove any temporary files written by the shuffler.
+        """
+        for bucket in self.buckets:
+            bucket.close()
+        if self.bucket_dir is not None:
+            shutil.rmtree(self.bucket_dir, ignore_errors=True)
+
+
+class TopScoringFragments:
+    """
+    Retains the numbers of the highest scoring of a stream of fragments.
+
+    Fragment numbers and scores are added in batches; only the candidates
+    which may still be among the highest scoring are retained, in arrays,
+    so that memory use is proportional to the number of fragments to be
+    selected rather than to the number of fragments added.
+    """
+    def __init__(self, num_selected):
+        self.num_selected = num_selected
+        self.num_fragments = 0
+        self.numbers = np.zeros(0, dtype=np.int64)
+        self.scores = np.zeros(0, dtype=np.float64)
+
+    def _prune(self):
+        # Retain only the highest scoring candidates
+        num_pruned = len(self.scores) - self.num_selected
+        if num_pruned > 0:
+            highest = np.argpartition(
+                self.scores, num_pruned - 1)[num_pruned:]
+            self.numbers = self.numbers[highest]
+            self.scores = self.scores[highest]
+
+    def add(self, numbers, scores):
+        """
+        Add a batch of scored fragments.
+
+        numbers: Array of the numbers of the fragments in the reads file.
+        scores: Array of the corresponding fragment scores.
+        """
+        self.num_fragments += len(numbers)
+        self.numbers = np.concatenate(
+            [self.numbers, np.asarray(numbers, dtype=np.int64)])
+        self.scores = np.concatenate(
+            [self.scores, np.asarray(scores, dtype=np.float64)])
+
+        # Candidates are pruned only once they are twice as many as the
+        # fragments to be selected, so that pruning costs amortised linear
+        # time
+        if len(self.scores) > 2 * self.num_selected:
+            self._prune()
+
+    def merge(self, other):
+        """
+        Add the candidates retained by another instance.
+
+        other: A TopScoringFragments instance, to which distinct fragments
+        were added.
+        """
+        self.add(other.numbers, other.scores)
+        self.num_fragments += other.num_fragments - len(other.numbers)
+
+    def selected(self):
+        """
+        Return the numbers of the highest scoring fragments, in order.
+        """
+        self._prune()
+        return np.sort(self.numbers)
+
+
+@contextlib.contextmanager
+def shuffling_fragments(reads_file, lines_per_fragment, seed=None,
+                        buffer_size=1024 ** 3, temp_dir=None, size=None):
+    """
+    Context manager creating a FragmentShuffler suitable for a reads file.
+
+    The shuffler uses enough buckets that the fragments of the reads file (or
+    those of them which are to be shuffled) can be shuffled within the
+    specified amount of memory. Any temporary files written by the shuffler
+    are removed on exit from the context.
+    reads_file: Path of the FASTA/Q file whose fragments will be shuffled.
+    lines_per_fragment: Number of lines describing each fragment.
+    seed: Seed for the random number generator; if None, fragments are
+    shuffled differently each time.
+    buffer_size: Approximate maximum memory, in bytes, to use for holding
+    fragments.
+    temp_dir: Directory in which to write temporary files; defaults to the
+    directory containing the reads file.
+    size: Approximate total size, in bytes, of the fragments to be shuffled;
+    defaults to the size of the reads file.
+    """
+    if temp_dir is None:
+        temp_dir = os.path.dirname(os.path.abspath(reads_file))
+    if size is None:
+        size = os.path.getsize(reads_file)
+
+    shuffler = FragmentShuffler(
+        lines_per_fragment, _get_num_buckets(size, buffer_size),
+        seed, temp_dir)
+    try:
+        yield shuffler
+    finally:
+        shuffler.close()
+
+
+def shuffle_fragments(reads_file, out_file, lines_per_fragment,
+                      seed=None, buffer_size=1024 ** 3, temp_dir=None):
+    """
+    Write the fragments of a reads file in random order.
+
+    Fragments are shuffled as units, so that the lines describing each read,
+    and the two reads of a read pair, remain together. If the reads file is
+    too large to be shuffled within the specified amount of memory, fragments
+    are first distributed at random between temporary files, each of which is
+    then shuffled in memory. The reads file is read completely before the
+    output file is opened, so the output file may be the reads file itself.
+    reads_file: Path of the FASTA/Q file to shuffle.
+    out_file: Path of the FASTA/Q file to write.
+    lines_per_fragment: Number of lines describing each fragment.
+    seed: Seed for the random number generator; if None, fragments are
+    shuffled differently each time.
+    buffer_size: Approximate maximum memory, in bytes, to use for holding
+    fragments.
+    temp_dir: Directory in which to write temporary files; defaults to the
+    directory containing the output file.
+    """
+    if temp_dir is None:
+        temp_dir = os.path.dirname(os.path.abspath(out_file))
+
+    with shuffling_fragments(reads_file, lines_per_fragment, seed,
+                             buffer_size, temp_dir) as shuffler:
+        with open(reads_file) as in_f:
+            for fragment in read_fragments(in_f, lines_per_fragment):
+                shuffler.add(fragment)
+        with open(out_file, "w") as out_f:
+            for fragment in shuffler.shuffled():
+                out_f.write(fragment)
+
+
+def get_error_rates(read_length):
+    """
+    Return per-position substitution error rates for reads.
+
+    Return an array giving, for each position in a read, the probability of
+    a substitution error at that position; error rates rise linearly along
+    the read.
+    read_length: The length of reads.
+    """
+    return np.linspace(_ERROR_RATE_START, _ERROR_RATE_END, read_length)
+
+
+def add_substitution_errors(reads, rng):
+    """
+    Add substitution errors to an array of reads of equal length.
+
+    Errors are added in place, with per-position rates given by
+    get_error_rates(); an erroneous base is replaced by one of the three other
+    bases, chosen uniformly, while ambiguous bases are left unchanged. Return
+    the Phred+33 quality string corresponding to the error rates.
+    reads: A two-dimensional array of bases (as ASCII codes), one row per
+    read.
+    rng: A numpy.random.RandomState instance.
+    """
+    error_rates = get_error_rates(reads.shape[1])
+    errors = rng.random_sample(reads.shape) < error_rates
+    codes = _BASE_CODES[reads[errors]]
+    substituted = (codes + rng.randint(1, len(_BASES), len(codes))) % \
+        len(_BASES)
+    reads[errors] = np.where(
+        codes < len(_BASES), _BASES[substituted], reads[errors])
+
+    qualities = np.round(-10 * np.log10(error_rates)).astype(np.uint8) + 33
+    return qualities.tostring()
+
+
+def _inject_batch_errors(records, rng):
+    names, sequences = zip(*[r[1:].split("\n", 2)[:2] for r in records])
+    lengths = np.array([len(s) for s in sequences])
+
+    # Reads of each length are given errors together, as a single array
+    fastq_records = [None] * len(records)
+    for length in np.unique(lengths):
+        indices = np.flatnonzero(lengths == length)
+        bases = np.frombuffer(
+            "".join([sequences[i] for i in indices]),
+            dtype=np.uint8).reshape(len(indices), length).copy()
+        qualities = add_substitution_errors(bases, rng)
+        for i, read in zip(indices, bases):
+            fastq_records[i] = "@{n}\n{s}\n+\n{q}\n".format(
+                n=names[i], s=read.tostring(), q=qualities)
+    return "".join(fastq_records)
+
+
+def inject_errors(reads_file, out_file, seed=None,
+                  batch_size=_ERROR_BATCH_SIZE):
+    """
+    Write reads from a FASTA file, with substitution errors, as FASTQ.
+
+    Reads are processed in a single streaming pass, in batches; each read is
+    given substitution errors by add_substitution_errors(), and written with
+    the corresponding quality string, preserving read names and order.
+    reads_file: Path of the FASTA file to read, which may be gzip-compressed.
+    out_file: Path of the FASTQ file to write; if the file name ends with
+    ".gz", reads are gzip-compressed.
+    seed: Seed for the random number generator; if None, different errors
+    are added each time.
+    batch_size: Number of reads given errors at a time.
+    """
+    if has_qualities(reads_file):
+        raise ValueError(
+            "Reads file {f} already has quality scores".format(f=reads_file))
+
+    rng = np.random.RandomState(seed)
+    with reading_reads_file(reads_file) as in_f, \
+            writing_reads_file(out_file) as out_f:
+        records = read_fragments(in_f, get_lines_per_fragment(False, False))
+        for batch in iter(
+                lambda: list(itertools.islice(records, batch_size)), []):
+            out_f.write(_inject_batch_errors(batch, rng))
+
+
+def index_fragments(reads_file, lines_per_fragment):
+    """
+    Return the byte offset of each fragment in a reads file.
+
+    The reads file is memory-mapped and scanned for newlines in large blocks,
+    recording only the positions at which fragments end. Return an array of
+    length one greater than the number of fragments, giving the offset at
+    which each fragment starts, followed by the size of the file, so that
+    fragment i occupies bytes index[i] to index[i + 1]. If the reads file
+    ends with an incomplete fragment, a ValueError is raised.
+    reads_file: Path of the uncompressed FASTA/Q file to index.
+    lines_per_fragment: Number of lines describing each fragment.
+    """
+    if reads_file.endswith(fs.COMPRESSED_READS_SUFFIX):
+        raise ValueError(
+            "Compressed reads file {f} cannot be indexed".format(f=reads_file))
+
+    fragment_ends = []
+    num_lines = 0
+    with open(reads_file, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) \
+            if size > 0 else None
+        try:
+            for start in xrange(0, size, _INDEX_BLOCK_SIZE):
+                block = np.frombuffer(
+                    mapped, dtype=np.uint8,
+                    count=min(_INDEX_BLOCK_SIZE, size - start), offset=start)
+                newlines = np.flatnonzero(block == ord("\n"))
+
+                # Keep the newlines ending every lines_per_fragment'th line,
+                # counting from the start of the file
+                first_end = (lines_per_fragment - 1 - num_lines) % \
+                    lines_per_fragment
+                fragment_ends.append(
+                    newlines[first_end::lines_per_fragment] + start + 1)
+                num_lines += len(newlines)
+        finally:
+            if mapped is not None:
+                mapped.close()
+
+    index = np.concatenate(
+        [np.zeros(1, dtype=np.int64)] + fragment_ends).astype(np.int64)
+    if index[-1] != size:
+        raise ValueError(
+            "Reads file ends with an incomplete fragment of " +
+            "{n} lines".format(n=num_lines % lines_per_fragment or 1))
+    return index
+
+
+def get_fragment_index(reads_file, lines_per_fragment):
+    """
+    Return the fragment index of a reads file, via a sidecar file.
+
+    The index is read from a sidecar file alongside the reads file if one
+    exists, was written for the same number of lines per fragment, and is up
+    to date; otherwise the reads file is indexed by index_fragments(), and the
+    sidecar file (re)written.
+    reads_file: Path of the uncompressed FASTA/Q file to index.
+    lines_per_fragment: Number of lines describing each fragment.
+    """
+    index_file = reads_file + _FRAGMENT_INDEX_SUFFIX
+    if os.path.exists(index_file) and \
+            os.path.getmtime(index_file) >= os.path.getmtime(reads_file):
+        with open(index_file, "rb") as f:
+            sidecar = np.load(f)
+            index = sidecar["offsets"]
+            if sidecar["lines_per_fragment"] == lines_per_fragment and \
+                    index[-1] == os.path.getsize(reads_file):
+                return index
+
+    index = index_fragments(reads_file, lines_per_fragment)
+    with open(index_file, "wb") as f:
+        np.savez(f, offsets=index, lines_per_fragment=lines_per_fragment)
+    return index
+
+
+def copy_fragments(reads_file, index, fragment_numbers, out_f):
+    """
+    Write selected fragments of a reads file, using its fragment index.
+
+    Runs of consecutive selected fragments are copied as single blocks of
+    bytes, read into a reusable buffer, rather than line by line.
+    reads_file: Path of the uncompressed FASTA/Q file.
+    index: The fragment index of the reads file, as returned by
+    index_fragments() or get_fragment_index().
+    fragment_numbers: Numbers of the fragments to write, in the order in
+    which they should be written.
+    out_f: File object to write fragments to.
+    """
+    fragment_numbers = np.asarray(fragment_numbers, dtype=np.int64)
+    if len(fragment_numbers) == 0:
+        return
+
+    # Find the runs of consecutive fragments, and their byte ranges
+    breaks = np.flatnonzero(np.diff(fragment_numbers) != 1) + 1
+    run_starts = index[fragment_numbers[np.r_[0, breaks]]]
+    run_ends = index[fragment_numbers[np.r_[breaks - 1,
+                                            len(fragment_numbers) - 1]] + 1]
+
+    buf = bytearray(_COPY_BLOCK_SIZE)
+    view = memoryview(buf)
+    with open(reads_file, "rb") as in_f:
+        for start, end in zip(run_starts, run_ends):
+            in_f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                num_read = in_f.readinto(
+                    view[:min(remaining, _COPY_BLOCK_SIZE)])
+                if num_read == 0:
+                    raise IOError(
+                        "Reads file {f} is shorter than its index".format(
+                            f=reads_file))
+                out_f.write(view[:num_read].tobytes())
+                remaining -= num_read
+
+
+def _get_selection_keys(weights, rng, weighted_sampling):
+    # By default, fragments are selected by their weight under the bias model
+    # scaled by a uniform random number. For weighted sampling without
+    # replacement, each fragment is instead keyed by log(u) / w (Efraimidis
+    # and Spirakis); the fragments with the highest keys are then an exact
+    # weighted sample.
+    uniform = rng.random_sample(len(weights))
+    if not weighted_sampling:
+        return weights * uniform
+    with np.errstate(divide="ignore"):
+        return np.log(uniform) / weights
+
+
+def _score_chunk(args):
+    (reads_file, start_offset, end_offset, first_fragment, lines_per_fragment,
+     reads_per_fragment, bias_model, num_selected, seed,
+     weighted_sampling) = args
+
+    # The fragments in the chunk are weighted by the bias model (if any), in
+    # batches; only the highest scoring fragments in the chunk are retained
+    with open(reads_file, 'r') as f:
+        f.seek(start_offset)
+        lines = f.read(end_offset - start_offset).splitlines()
+
+    rng = np.random.RandomState(seed)
+    top_scoring = TopScoringFragments(num_selected)
+    batch_lines = _SCORE_BATCH_SIZE * lines_per_fragment
+    for start in xrange(0, len(lines), batch_lines):
+        batch = lines[start:start + batch_lines]
+        weights = np.ones(len(batch) / lines_per_fragment) \
+            if bias_model is None else \
+            bias_model.weigh(bias_models.ReadFragments(
+                batch, lines_per_fragment, reads_per_fragment))
+        keys = _get_selection_keys(weights, rng, weighted_sampling)
+        first = first_fragment + start / lines_per_fragment
+        top_scoring.add(np.arange(first, first + len(keys)), keys)
+    return top_scoring
+
+
+def score_fragments(reads_file, index, num_selected, lines_per_fragment,
+                    reads_per_fragment, bias_model=None, seed=None,
+                    weighted_sampling=False, processes=1):
+    """
+    Return the highest scoring fragments of a reads file.
+
+    Each fragment is scored by its weight under a bias model scaled by a
+    uniform random number, or by a key for exact weighted sampling without
+    replacement. The reads file is split, via its fragment index, into
+    chunks of whole fragments, which are scored by a pool of processes; each
+    chunk is scored with its own seed, so that for a given seed the selection
+    does not depend on the number of processes. Return a TopScoringFragments
+    instance holding the highest scoring fragments of every chunk.
+    reads_file: Path of the uncompressed FASTA/Q file.
+    index: The fragment index of the reads file, as returned by
+    index_fragments() or get_fragment_index().
+    num_selected: Number of highest scoring fragments to be selected.
+    lines_per_fragment: Number of lines describing each fragment.
+    reads_per_fragment: Number of reads in each fragment.
+    bias_model: Bias model weighting fragments; if None, fragments are
+    selected uniformly at random.
+    seed: Seed for the random number generator; if None, a different
+    selection is made each time.
+    weighted_sampling: If True, select fragments by weighted random sampling
+    without replacement.
+    processes: Number of processes among which chunks are distributed.
+    """
+    num_fragments = len(index) - 1
+    chunk_args = [(reads_file, index[start],
+                   index[min(start + _SCORE_CHUNK_SIZE, num_fragments)],
+                   start, lines_per_fragment, reads_per_fragment, bias_model,
+                   num_selected, None if seed is None else [seed, chunk],
+                   weighted_sampling)
+                  for chunk, start in enumerate(
+                      xrange(0, num_fragments, _SCORE_CHUNK_SIZE))]
+
+    top_scoring = TopScoringFragments(num_selected)
+    pool = multiprocessing.Pool(processes) \
+        if processes > 1 and len(chunk_args) > 1 else None
+    try:
+        chunks = pool.imap(_score_chunk, chunk_args) if pool \
+            else (_score_chunk(args) for args in chunk_args)
+        for chunk_top_scoring in chunks:
+            top_scoring.merge(chunk_top_scoring)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    return top_scoring
+
+
+def _split_block(block, lines_per_unit):
+    # Return the positions of the newlines in a block, the number of lines
+    # in whole units of lines_per_unit lines, and the end of the last unit
+    newlines = np.flatnonzero(block == _NEWLINE)
+    num_lines = len(newlines) - len(newlines) % lines_per_unit
+    end = newlines[num_lines - 1] + 1 if num_lines > 0 else 0
+    return newlines, num_lines, end
+
+
+def _reading_stream_blocks(f, lines_per_unit):
+    # As _reading_record_blocks(), for a file object read as a stream
+    leftover = np.zeros(0, dtype=np.uint8)
+    while True:
+        data = f.read(_SCAN_BLOCK_SIZE)
+        block = np.concatenate(
+            [leftover, np.frombuffer(data, dtype=np.uint8)])
+        newlines, num_lines, end = _split_block(block, lines_per_unit)
+        if not data:
+            if len(block) > 0:
+                yield block, newlines, False
+            return
+        if end > 0:
+            yield block[:end], newlines[:num_lines], True
+        leftover = block[end:]
+
+
+def _reading_record_blocks(reads_file, lines_per_unit):
+    # Yield blocks of the bytes of a reads file, as arrays, each holding a
+    # whole number of units of lines_per_unit lines, together with the
+    # positions of the newlines within them; any trailing incomplete unit is
+    # yielded last, flagged as incomplete. Uncompressed files are
+    # memory-mapped, while compressed files are read as a stream.
+    if reads_file.endswith(fs.COMPRESSED_READS_SUFFIX):
+        with reading_reads_file(reads_file) as f:
+            for block in _reading_stream_blocks(f, lines_per_unit):
+                yield block
+        return
+
+    with open(reads_file, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            block_size = _SCAN_BLOCK_SIZE
+            while start < size:
+                count = min(block_size, size - start)
+                block = np.frombuffer(
+                    mapped, dtype=np.uint8, count=count, offset=start)
+                newlines, num_lines, end = _split_block(
+                    block, lines_per_unit)
+                at_end = start + count == size
+                if end == 0 and not at_end:
+                    # The block does not hold a whole unit, so is enlarged
+                    block_size *= 2
+                    continue
+                if end > 0:
+                    yield block[:end], newlines[:num_lines], True
+                if at_end:
+                    if end < count:
+                        yield block[end:], newlines[num_lines:] - end, False
+                    return
+                start += end
+        finally:
+            mapped.close()
+
+
+def _get_fingerprints(data, starts, ends):
+    # Strings of bytes within an array are reduced to integer fingerprints
+    # (in arithmetic modulo 2^64), so that they can be compared, or looked
+    # up, without being extracted as strings
+    lengths = np.maximum(ends - starts, 0)
+    offsets = np.cumsum(lengths) - lengths
+    positions = np.arange(lengths.sum()) - np.repeat(offsets, lengths)
+    values = data[np.repeat(starts, lengths) + positions].astype(np.int64) * \
+        _FINGERPRINT_WEIGHTS[positions % len(_FINGERPRINT_WEIGHTS)]
+    cumulative = np.concatenate([[0], np.cumsum(values)])
+    return cumulative[offsets + lengths] - cumulative[offsets] + lengths
+
+
+def _get_name_fingerprints(block, starts, ends):
+    # Read names are fingerprinted less any "/1" or "/2" mate suffix, so that
+    # the names of mates can be compared
+    ends = ends.copy()
+    has_suffix = (ends - starts >= 2)
+    has_suffix[has_suffix] = \
+        (block[ends[has_suffix] - 2] == ord("/")) & \
+        np.in1d(block[ends[has_suffix] - 1], _MATE_SUFFIXES)
+    ends[has_suffix] -= 2
+    return _get_fingerprints(block, starts, ends)
+
+
+class _ReadsFileScan:
+    # Statistics gathered while scanning a single reads file
+    def __init__(self, reads_file, interleaved):
+        self.reads_file = reads_file
+        self.qualities = has_qualities(reads_file)
+        self.lines_per_read = 4 if self.qualities else 2
+        self.interleaved = interleaved
+        self.num_reads = 0
+        self.num_malformed = 0
+        self.num_unpaired = 0
+        self.incomplete = False
+        self.read_lengths = np.zeros(0, dtype=np.int64)
+        self.base_counts = np.zeros(256, dtype=np.int64)
+
+    def blocks(self):
+        """
+        Yield the fingerprints of the read names of each block of the file.
+        """
+        lines_per_unit = self.lines_per_read * (2 if self.interleaved else 1)
+        for block, newlines, complete in _reading_record_blocks(
+                self.reads_file, lines_per_unit):
+            if not complete:
+                self.incomplete = True
+                return
+            yield self._scan_block(block, newlines)
+
+    def _scan_block(self, block, newlines):
+        line_starts = np.concatenate([[0], newlines[:-1] + 1])
+        header_starts = line_starts[0::self.lines_per_read]
+        sequence_starts = line_starts[1::self.lines_per_read]
+        sequence_ends = newlines[1::self.lines_per_read]
+        lengths = sequence_ends - sequence_starts
+
+        malformed = block[header_starts] != \
+            ord("@" if self.qualities else ">")
+        if self.qualities:
+            malformed |= block[line_starts[2::4]] != ord("+")
+            malformed |= newlines[3::4] - line_starts[3::4] != lengths
+        self.num_malformed += np.count_nonzero(malformed)
+        self.num_reads += len(header_starts)
+
+        read_lengths = np.bincount(lengths)
+        if len(read_lengths) > len(self.read_lengths):
+            read_lengths[:len(self.read_lengths)] += self.read_lengths
+            self.read_lengths = read_lengths
+        else:
+            self.read_lengths[:len(read_lengths)] += read_lengths
+
+        # Bases are counted over a mask of the bytes of sequence lines
+        boundaries = np.zeros(len(block) + 1, dtype=np.int8)
+        boundaries[sequence_starts] = 1
+        boundaries[sequence_ends] = -1
+        in_sequence = np.cumsum(boundaries[:-1], dtype=np.int8).view(bool)
+        self.base_counts += np.bincount(block[in_sequence], minlength=256)
+
+        fingerprints = _get_name_fingerprints(
+            block, header_starts + 1, newlines[0::self.lines_per_read])
+        if self.interleaved:
+            self.num_unpaired += np.count_nonzero(
+                fingerprints[0::2] != fingerprints[1::2])
+        return fingerprints
+
+    def errors(self):
+        """
+        Return descriptions of the problems found in the reads file.
+        """
+        name = os.path.basename(self.reads_file)
+        errors = []
+        if self.incomplete:
+            errors.append(
+                "{f} ends with an incomplete {u}".format(
+                    f=name, u="fragment" if self.interleaved else "record"))
+        if self.num_malformed > 0:
+            errors.append("{f} contains {n} malformed records".format(
+                f=name, n=self.num_malformed))
+        if self.num_unpaired > 0:
+            errors.append(
+                "{f} contains {n} fragments whose mates are misnamed".format(
+                    f=name, n=self.num_unpaired))
+        return errors
+
+
+def _compare_mates(left_scan, right_scan):
+    # Scan left and right reads files in lockstep, comparing the fingerprints
+    # of the names of their reads, and return the number of mismatched pairs
+    pending = [np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)]
+    num_mismatched = 0
+    for blocks in itertools.izip_longest(
+            left_scan.blocks(), right_scan.blocks()):
+        for end, fingerprints in enumerate(blocks):
+            if fingerprints is not None:
+                pending[end] = np.concatenate([pending[end], fingerprints])
+        num_compared = min(len(pending[0]), len(pending[1]))
+        num_mismatched += np.count_nonzero(
+            pending[0][:num_compared] != pending[1][:num_compared])
+        pending = [p[num_compared:] for p in pending]
+    return num_mismatched
+
+
+def scan_reads(reads_files, paired_end=False):
+    """
+    Check the integrity of reads files, and gather their statistics.
+
+    Reads files are scanned in large blocks, memory-mapped if uncompressed,
+    with newlines located and each record's lines checked at once across a
+    block. Records must be complete and well-formed, and the names of the
+    mates of paired-end reads must match. Return a dictionary, suitable for
+    serialising as JSON, recording whether the reads are valid, a description
+    of any problems found, the number of reads and fragments, the distribution
+    of read lengths and the base composition of the reads.
+    reads_files: Paths of FASTA/Q files; either one file of single-end or
+    interleaved paired-end reads, or files of left and right reads.
+    paired_end: True if a single reads file contains interleaved paired-end
+    reads.
+    """
+    scans = [_ReadsFileScan(f, paired_end and len(reads_files) == 1)
+             for f in reads_files]
+    errors = []
+    if len(scans) == 2:
+        num_mismatched = _compare_mates(*scans)
+        if num_mismatched > 0:
+            errors.append(
+                "{n} pairs of left and right reads are misnamed".format(
+                    n=num_mismatched))
+        if scans[0].num_reads != scans[1].num_reads:
+            errors.append(
+                "Left and right reads files contain {l} and {r} reads".format(
+                    l=scans[0].num_reads, r=scans[1].num_reads))
+    else:
+        for scan in scans:
+            for _ in scan.blocks():
+                pass
+
+    for scan in scans:
+        errors += scan.errors()
+
+    num_reads = sum([scan.num_reads for scan in scans])
+    read_lengths = np.zeros(max([len(scan.read_lengths) for scan in scans]),
+                            dtype=np.int64)
+    base_counts = np.zeros(256, dtype=np.int64)
+    for scan in scans:
+        read_lengths[:len(scan.read_lengths)] += scan.read_lengths
+        base_counts += scan.base_counts
+
+    num_bases = max(base_counts.sum(), 1)
+    composition = {b: base_counts[ord(b)] + base_counts[ord(b.lower())]
+                   for b in _COMPOSITION_BASES}
+    composition["other"] = base_counts.sum() - sum(composition.values())
+
+    return {
+        "valid": len(errors) == 0,
+        "errors": errors,
+        "paired_end": paired_end or len(scans) == 2,
+        "num_reads": int(num_reads),
+        "num_fragments": int(num_reads / 2 if paired_end or len(scans) == 2
+                             else num_reads),
+        "files": {os.path.basename(scan.reads_file): int(scan.num_reads)
+                  for scan in scans},
+        "read_lengths": {str(length): int(count)
+                         for length, count in enumerate(read_lengths)
+                         if count > 0},
+        "mean_read_length": float(
+            np.dot(np.arange(len(read_lengths)), read_lengths)) /
+        max(num_reads, 1),
+        "base_composition": {b: float(count) / num_bases
+                             for b, count in composition.items()},
+        "gc_content": float(composition["G"] + composition["C"]) / num_bases
+    }
+
+
+class _TranscriptIndex:
+    # An index from the fingerprints of transcript IDs to the positions of
+    # the IDs in a sequence of transcript IDs
+    def __init__(self, transcript_ids):
+        lengths = np.array([len(t) for t in transcript_ids], dtype=np.int64)
+        ends = np.cumsum(lengths)
+        fingerprints = _get_fingerprints(
+            np.frombuffer("".join(transcript_ids), dtype=np.uint8),
+            ends - lengths, ends)
+        self.positions = np.argsort(fingerprints)
+        self.fingerprints = fingerprints[self.positions]
+        if np.any(self.fingerprints[1:] == self.fingerprints[:-1]):
+            raise ValueError("Transcript IDs are not distinct")
+
+    def lookup(self, fingerprints, description):
+        """
+        Return the positions of the transcripts with given fingerprints.
+
+        If a fingerprint is not that of a known transcript, a ValueError is
+        raised, referring to the fingerprinted strings by the description.
+        """
+        return self.positions[_search_fingerprints(
+            self.fingerprints, fingerprints, description)]
+
+
+def _search_fingerprints(sorted_fingerprints, fingerprints, description):
+    # Return the positions of fingerprints in a sorted array of them, raising
+    # a ValueError if any are absent
+    positions = np.minimum(
+        np.searchsorted(sorted_fingerprints, fingerprints),
+        max(len(sorted_fingerprints) - 1, 0))
+    if len(fingerprints) > 0 and (
+            len(sorted_fingerprints) == 0 or
+            np.any(sorted_fingerprints[positions] != fingerprints)):
+        raise ValueError("Unknown " + description)
+    return positions
+
+
+def _get_transcript_name_fingerprints(block, name_starts, name_ends):
+    # Fingerprint the transcript name within each of a set of read names,
+    # located via the positions of the colons in the block
+    colons = np.flatnonzero(block == ord(":"))
+    field_end = np.searchsorted(colons, name_ends) + \
+        _TRANSCRIPT_NAME_FIELD + 1
+    if np.any(field_end - 1 < np.searchsorted(colons, name_starts)):
+        raise ValueError(
+            "Read names do not identify the transcripts of reads")
+    return _get_fingerprints(
+        block, colons[field_end - 1] + 1, colons[field_end])
+
+
+def _get_fields(block, line_starts, line_ends, num_fields):
+    # Return the start and end positions of the first fields of each
+    # tab-separated line of a block
+    tabs = np.flatnonzero(block == ord("\t"))
+    first_tabs = np.searchsorted(tabs, line_starts)
+    last_tabs = first_tabs + num_fields - 1
+    if np.any(last_tabs >= len(tabs)) or np.any(tabs[last_tabs] > line_ends):
+        raise ValueError("Lines contain too few fields")
+    return [(line_starts if field == 0 else tabs[first_tabs + field - 1] + 1,
+             tabs[first_tabs + field]) for field in range(num_fields)]
+
+
+class ReadOrigins:
+    """
+    The transcript of origin of each read in a set of simulated reads.
+
+    The transcripts from which reads originated are held in an array of
+    32-bit integers, indexed by the ordinal position of each read (or, for
+    paired-end reads, each fragment) in the reads file, giving the position
+    of its transcript in a sequence of transcript IDs. Reads are identified
+    by the fingerprints of their names, held in sorted order alongside the
+    corresponding read ordinals.
+    """
+    def __init__(self, origins, sorted_fingerprints, ordinals):
+        self.origins = origins
+        self.sorted_fingerprints = sorted_fingerprints
+        self.ordinals = ordinals
+
+    def get_ordinals(self, fingerprints):
+        """
+        Return the ordinals of the reads with given name fingerprints.
+        """
+        return self.ordinals[_search_fingerprints(
+            self.sorted_fingerprints, fingerprints, "read names")]
+
+    def count_transcripts(self, num_transcripts):
+        """
+        Return the number of reads (or fragments) from each transcript.
+
+        num_transcripts: The number of transcript IDs into which read origins
+        index.
+        """
+        return np.bincount(self.origins, minlength=num_transcripts)
+
+    def save(self, out_file):
+        """
+        Write the read origins to a file, in NumPy .npz format.
+        """
+        with open(out_file, "wb") as f:
+            np.savez(f, origins=self.origins,
+                     sorted_fingerprints=self.sorted_fingerprints,
+                     ordinals=self.ordinals)
+
+
+def load_read_origins(origins_file):
+    """
+    Return the read origins saved to a file by ReadOrigins.save().
+
+    origins_file: Path of the read origins file.
+    """
+    with open(origins_file, "rb") as f:
+        saved = np.load(f)
+        return ReadOrigins(saved["origins"], saved["sorted_fingerprints"],
+                           saved["ordinals"])
+
+
+def index_read_origins(reads_file, transcript_ids):
+    """
+    Return the transcript of origin of each read in a reads file.
+
+    The reads file is scanned in large blocks; the name of each read, and the
+    transcript name embedded within it, are fingerprinted at once across a
+    block, without extracting names as strings. Return a ReadOrigins object.
+    If a read is from a transcript not among those given, a ValueError is
+    raised.
+    reads_file: Path of a FASTA/Q file of simulated reads, or of the left
+    reads of paired-end reads.
+    transcript_ids: Sequence of transcript ID strings.
+    """
+    index = _TranscriptIndex(transcript_ids)
+    lines_per_read = 4 if has_qualities(reads_file) else 2
+    origins = [np.zeros(0, dtype=np.int32)]
+    fingerprints = [np.zeros(0, dtype=np.int64)]
+    for block, newlines, complete in _reading_record_blocks(
+            reads_file, lines_per_read):
+        if not complete:
+            raise ValueError("Reads file ends with an incomplete record")
+        name_starts = np.concatenate(
+            [[0], newlines[:-1] + 1])[0::lines_per_read] + 1
+        name_ends = newlines[0::lines_per_read]
+        origins.append(index.lookup(
+            _get_transcript_name_fingerprints(block, name_starts, name_ends),
+            "transcripts of reads").astype(np.int32))
+        fingerprints.append(
+            _get_name_fingerprints(block, name_starts, name_ends))
+
+    fingerprints = np.concatenate(fingerprints)
+    ordinals = np.argsort(fingerprints).astype(np.int32)
+    return ReadOrigins(np.concatenate(origins), fingerprints[ordinals],
+                       ordinals)
+
+
+@contextlib.contextmanager
+def _reading_alignments_file(alignments_file):
+    # BAM files are read as SAM, decoded by samtools as they are read
+    if not alignments_file.endswith(".bam"):
+        with open(alignments_file) as f:
+            yield f
+        return
+
+    decoder = subprocess.Popen(["samtools", "view", alignments_file],
+                               stdout=subprocess.PIPE)
+    try:
+        yield decoder.stdout
+    finally:
+        decoder.stdout.close()
+        return_code = decoder.wait()
+
+    if return_code != 0:
+        raise IOError("Reading alignments file {f} failed".format(
+            f=alignments_file))
+
+
+def _parse_integers(block, starts, ends):
+    # Return the values of the decimal integers held at positions in a block
+    lengths = ends - starts
+    offsets = np.cumsum(lengths) - lengths
+    positions = np.arange(lengths.sum()) - np.repeat(offsets, lengths)
+    digits = block[np.repeat(starts, lengths) + positions].astype(np.int64) - \
+        ord("0")
+    values = digits * 10 ** (np.repeat(lengths, lengths) - 1 - positions)
+    cumulative = np.concatenate([[0], np.cumsum(values)])
+    return cumulative[offsets + lengths] - cumulative[offsets]
+
+
+def _find_tag_value(block, line_ends, tag_value):
+    # Return whether each line of a block contains a SAM tag with the given
+    # value (as a string such as "ZW:f:1"), terminated by a tab or newline
+    pattern = np.frombuffer("\t" + tag_value, dtype=np.uint8)
+    positions = np.flatnonzero(
+        block[:len(block) - len(pattern)] == pattern[0])
+    for offset in range(1, len(pattern)):
+        positions = positions[block[positions + offset] == pattern[offset]]
+    terminators = block[positions + len(pattern)]
+    positions = positions[(terminators == ord("\t")) |
+                          (terminators == ord("\n"))]
+
+    has_tag_value = np.zeros(len(line_ends), dtype=bool)
+    has_tag_value[np.searchsorted(line_ends, positions)] = True
+    return has_tag_value
+
+
+def count_read_assignments(alignments_file, read_origins, transcript_ids,
+                           sampled_tag=None):
+    """
+    Count the reads a quantifier assigned to each transcript, and correctly.
+
+    Alignments of reads to transcripts, in SAM (or BAM) format, are streamed
+    in large blocks, within which the read name, flags and transcript of
+    every alignment are located, and names fingerprinted, at once. The
+    alignments file should hold a single alignment of each read, sampled by
+    the quantifier according to the posterior probabilities of the read's
+    alignments, or else mark the alignment sampled with a tag. The sampled
+    alignment of each read (or, for paired-end reads, of the first read of
+    each pair) is taken as its assignment to a transcript, and compared with
+    the transcript of origin of the read. Return arrays of the number of
+    reads assigned to each transcript, and of those assigned correctly. If
+    alignments are of unknown reads or to unknown transcripts, a ValueError
+    is raised.
+    alignments_file: Path of a SAM or BAM file of alignments to transcripts.
+    read_origins: A ReadOrigins object, for the reads which were aligned.
+    transcript_ids: Sequence of transcript ID strings, as used when read
+    origins were indexed.
+    sampled_tag: If not None, the name of a floating-point alignment tag
+    (such as RSEM's "ZW") whose value is 1 for the sampled alignment of each
+    read, and 0 for its other alignments; reads none of whose alignments
+    were sampled are not assigned.
+    """
+    index = _TranscriptIndex(transcript_ids)
+    assigned = np.zeros(len(transcript_ids), dtype=np.int64)
+    correct = np.zeros(len(transcript_ids), dtype=np.int64)
+    last_name = None
+
+    with _reading_alignments_file(alignments_file) as f:
+        for block, newlines, complete in _reading_stream_blocks(f, 1):
+            if not complete:
+                raise ValueError(
+                    "Alignments file ends with an incomplete line")
+            line_starts = np.concatenate([[0], newlines[:-1] + 1])
+            is_alignment = block[line_starts] != ord("@")
+            if not np.any(is_alignment):
+                continue
+            fields = _get_fields(block, line_starts[is_alignment],
+                                 newlines[is_alignment], 3)
+
+            # Unmapped reads, supplementary alignments and the second reads
+            # of pairs are disregarded, as are alignments other than that
+            # sampled - either those marked as secondary or, if the sampled
+            # alignment is tagged, those not tagged
+            flags = _parse_integers(block, *fields[1])
+            if sampled_tag is None:
+                sampled = flags & (_SAM_UNMAPPED | _SAM_SECOND_READ |
+                                   _SAM_SECONDARY | _SAM_SUPPLEMENTARY) == 0
+            else:
+                sampled = (flags & (_SAM_UNMAPPED | _SAM_SECOND_READ |
+                                    _SAM_SUPPLEMENTARY) == 0) & \
+                    _find_tag_value(block, newlines,
+                                    sampled_tag + ":f:1")[is_alignment]
+            (name_starts, name_ends), _, (target_starts, target_ends) = \
+                [(starts[sampled], ends[sampled]) for starts, ends in fields]
+
+            names = _get_name_fingerprints(block, name_starts, name_ends)
+            first = np.ones(len(names), dtype=bool)
+            first[1:] = names[1:] != names[:-1]
+            if len(names) > 0:
+                first[0] = names[0] != last_name
+                last_name = names[-1]
+
+            targets = index.lookup(_get_fingerprints(
+                block, target_starts[first], target_ends[first]),
+                "transcripts in alignments file")
+            origins = read_origins.origins[
+                read_origins.get_ordinals(names[first])]
+            assigned += np.bincount(targets, minlength=len(assigned))
+            correct += np.bincount(targets[targets == origins],
+                                   minlength=len(correct))
+
+    return assigned, correct
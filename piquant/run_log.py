@@ -0,0 +1,320 @@
+"""
+Functions for recording and reading the progress of the run scripts executed
+in read simulation and quantification directories. Exports:
+
+write_run_log_header: Record the type and parameters of a run directory.
+add_run_logging: Write commands to log the start and end of a run script.
+logged_step: Context manager writing commands to log a run script step.
+measured_command: Prefix a command so that its peak memory use is logged.
+add_record_file_sizes: Write commands to log the total size of files.
+add_wait_for_run: Write commands waiting for another run script to succeed.
+recording_step: Context manager logging a step of a Python support script.
+read_run_log: Return the records logged for a run directory.
+get_step_duration: Return the time taken by a step of a run script.
+
+RUN_LOG_FILE: Name of the log file written in each run directory.
+SIMULATION_RUN: Run type of read simulation directories.
+QUANTIFICATION_RUN: Run type of quantification directories.
+LIBRARY_RUN: Run type of shared fragment library directories.
+QUEUED, RUNNING, SUCCEEDED, FAILED: Run script job states.
+"""
+
+import collections
+import contextlib
+import os.path
+import time
+
+RUN_LOG_FILE = "piquant_run.log"
+
+SIMULATION_RUN = "simulation"
+QUANTIFICATION_RUN = "quantification"
+LIBRARY_RUN = "library"
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+JOB_STATES = [QUEUED, RUNNING, SUCCEEDED, FAILED]
+
+_TYPE_RECORD = "type"
+_PARAM_RECORD = "param"
+_JOB_RECORD = "job"
+_START_RECORD = "start"
+_END_RECORD = "end"
+_PEAK_RSS_RECORD = "rss"
+_BYTES_RECORD = "bytes"
+
+_LOG_FUNCTION = "log_run"
+_MEASURE_FUNCTION = "log_peak_rss"
+_EXIT_FUNCTION = "log_run_exit"
+_GNU_TIME = "/usr/bin/time"
+_METRICS_SCRIPT = "write_sweep_metrics.py"
+
+StepSpan = collections.namedtuple("StepSpan", ["step", "start", "end"])
+
+JobSpan = collections.namedtuple("JobSpan", ["start", "end", "state"])
+
+RunLog = collections.namedtuple(
+    "RunLog", ["run_dir", "run_type", "params", "job_state", "jobs",
+               "steps", "peak_rss", "bytes"])
+
+
+def _get_run_log_file(run_dir):
+    return os.path.join(os.path.abspath(run_dir), RUN_LOG_FILE)
+
+
+def _write_records(run_dir, *records):
+    with open(_get_run_log_file(run_dir), "a") as f:
+        for record in records:
+            f.write(" ".join(["{t:.6f}".format(t=time.time())] +
+                             [str(r) for r in record]) + "\n")
+
+
+def write_run_log_header(run_dir, run_type, **params):
+    """
+    Record the type and parameters of a run directory in its log.
+
+    Write records describing the type of run (read simulation,
+    quantification or shared fragment library) and the run parameters for a
+    newly prepared run directory. A run directory whose log contains only
+    these records is considered to be queued.
+    run_dir: The read simulation or quantification directory.
+    run_type: One of SIMULATION_RUN, QUANTIFICATION_RUN or LIBRARY_RUN.
+    params: A dictionary mapping from parameters._Parameter names to parameter
+    values.
+    """
+    records = [(_TYPE_RECORD, run_type)]
+    records += [(_PARAM_RECORD, name, str(value).replace(" ", "_"))
+                for name, value in sorted(params.items())]
+    _write_records(run_dir, *records)
+
+
+def _get_metrics_command(run_dir, metrics_file):
+    metrics_script = os.path.join(
+        os.path.abspath(os.path.dirname(__file__)), _METRICS_SCRIPT)
+    return "{command} --log-level=warning {out_dir} {metrics_file}".format(
+        command=metrics_script,
+        out_dir=os.path.dirname(os.path.abspath(run_dir)),
+        metrics_file=metrics_file)
+
+
+def add_run_logging(writer, run_dir, metrics_file=None):
+    """
+    Write commands to log the start and end of a run script.
+
+    Write Bash functions used by the other commands of this module, and
+    commands which record when the script starts, and whether it exits
+    successfully or not, in the run directory's log.
+    writer: A BashScriptWriter instance.
+    run_dir: The directory in which the script will be run.
+    metrics_file: If not None, each time the script starts or exits, metrics
+    for all runs in the parent directory of 'run_dir' will be written to this
+    file in Prometheus text format.
+    """
+    log_file = _get_run_log_file(run_dir)
+
+    with writer.section():
+        writer.add_comment(
+            "Record the progress of this script in the run log.")
+        with writer.function_block(_LOG_FUNCTION):
+            writer.add_line(
+                "echo \"$(date +%s.%N) $*\" >> " + log_file)
+            # Metrics are rewritten only when the job state changes, since
+            # each rewrite reads the logs of every run directory
+            if metrics_file:
+                with writer.if_block("\"$1\" == " + _JOB_RECORD):
+                    writer.add_line(
+                        _get_metrics_command(run_dir, metrics_file) +
+                        " || true")
+
+    with writer.section():
+        writer.add_comment(
+            "Record the peak memory use of an external tool, if GNU time " +
+            "is available.")
+        with writer.function_block(_MEASURE_FUNCTION):
+            with writer.if_block("! -x " + _GNU_TIME):
+                writer.add_line("\"$@\"")
+                writer.add_line("return")
+            writer.add_line(
+                _GNU_TIME + " -a -o " + log_file +
+                " -f \"$(date +%s.%N) " + _PEAK_RSS_RECORD +
+                " $(basename $1) %M\" \"$@\"")
+
+    with writer.section():
+        with writer.function_block(_EXIT_FUNCTION):
+            writer.set_variable("local STATUS", "$?")
+            writer.set_variable("local STATE", FAILED)
+            with writer.if_block("$STATUS -eq 0"):
+                writer.set_variable("STATE", SUCCEEDED)
+            writer.add_line(" ".join([_LOG_FUNCTION, _JOB_RECORD, "$STATE"]))
+
+    with writer.section():
+        writer.add_line("trap " + _EXIT_FUNCTION + " EXIT")
+        writer.add_line(" ".join([_LOG_FUNCTION, _JOB_RECORD, RUNNING]))
+
+
+@contextlib.contextmanager
+def logged_step(writer, step):
+    """
+    Write commands logging the start and end of a step of a run script.
+
+    Commands written within the context will be bracketed by commands
+    recording the start and end times of the named step in the run log.
+    writer: A BashScriptWriter instance, to which add_run_logging() has
+    already been applied.
+    step: Name of the step.
+    """
+    writer.add_line(" ".join([_LOG_FUNCTION, _START_RECORD, step]))
+    try:
+        yield
+    finally:
+        writer.add_line(" ".join([_LOG_FUNCTION, _END_RECORD, step]))
+
+
+def measured_command(command):
+    """
+    Prefix a command so that the peak memory use of the tool is logged.
+
+    command: A simple command (i.e. not a compound command or function)
+    running an external tool; the tool may be part of a pipeline.
+    """
+    return _MEASURE_FUNCTION + " " + command
+
+
+def add_record_file_sizes(writer, name, files):
+    """
+    Write a command logging the total size in bytes of a set of files.
+
+    writer: A BashScriptWriter instance, to which add_run_logging() has
+    already been applied.
+    name: Name under which the total size is recorded.
+    files: Paths of the files, relative to the run directory.
+    """
+    writer.add_line(
+        "{log} {record} {name} $(stat -c %s {files} | ".format(
+            log=_LOG_FUNCTION, record=_BYTES_RECORD, name=name,
+            files=" ".join(files)) +
+        "awk '{s += $1} END {print s}')")
+
+
+def add_wait_for_run(writer, run_dir, poll_interval=60):
+    """
+    Write commands waiting for the run script of another directory to succeed.
+
+    The commands written poll the log of the other run directory until it
+    records that the run script has succeeded; if the run script is instead
+    recorded as having failed, the script exits with an error.
+    writer: A BashScriptWriter instance.
+    run_dir: The run directory whose run script should be waited for.
+    poll_interval: Time in seconds between successive checks of the log.
+    """
+    log_file = _get_run_log_file(run_dir)
+    with writer.while_block("true"):
+        writer.set_variable(
+            "RUN_STATE",
+            "$(awk '$2 == \"{record}\" {{s = $3}} END {{print s}}' {log})".
+            format(record=_JOB_RECORD, log=log_file))
+        with writer.if_block("\"$RUN_STATE\" == " + SUCCEEDED):
+            writer.add_line("break")
+        with writer.if_block("\"$RUN_STATE\" == " + FAILED):
+            writer.add_echo("\"Exiting: run in " + run_dir + " failed.\"")
+            writer.add_line("exit 1")
+        writer.add_line("sleep " + str(poll_interval))
+
+
+@contextlib.contextmanager
+def recording_step(run_dir, step):
+    """
+    Log the start and end of a step executed by a Python support script.
+
+    run_dir: The run directory in which the support script is executing.
+    step: Name of the step.
+    """
+    _write_records(run_dir, (_START_RECORD, step))
+    try:
+        yield
+    finally:
+        _write_records(run_dir, (_END_RECORD, step))
+
+
+def _read_records(log_file):
+    with open(log_file) as f:
+        for line in f:
+            elements = line.split()
+            if len(elements) < 2:
+                continue
+            try:
+                timestamp = float(elements[0])
+            except ValueError:
+                # Lines written by GNU time on tool failure are ignored.
+                continue
+            yield timestamp, elements[1], elements[2:]
+
+
+def read_run_log(run_dir):
+    """
+    Return the records logged for a run directory.
+
+    Return a RunLog instance describing the type, parameters and job state of
+    a run directory, the spans of time during which the run script was
+    executing (a run script may be executed more than once) and during which
+    each script step ran (with end None for a job or step still running), the
+    maximum peak memory use in kilobytes of each external tool, and any
+    recorded file sizes. If the directory has no log, None is returned.
+    run_dir: A read simulation or quantification directory.
+    """
+    log_file = _get_run_log_file(run_dir)
+    if not os.path.exists(log_file):
+        return None
+
+    run_type = None
+    params = {}
+    job_state = QUEUED
+    jobs = []
+    steps = []
+    open_steps = {}
+    peak_rss = {}
+    file_bytes = {}
+
+    for timestamp, record, values in _read_records(log_file):
+        if record == _TYPE_RECORD:
+            run_type = values[0]
+        elif record == _PARAM_RECORD:
+            params[values[0]] = values[1]
+        elif record == _JOB_RECORD:
+            job_state = values[0]
+            if job_state == RUNNING:
+                jobs.append(JobSpan(timestamp, None, job_state))
+            elif jobs and jobs[-1].end is None:
+                jobs[-1] = jobs[-1]._replace(end=timestamp, state=job_state)
+        elif record == _START_RECORD:
+            open_steps[values[0]] = len(steps)
+            steps.append(StepSpan(values[0], timestamp, None))
+        elif record == _END_RECORD and values[0] in open_steps:
+            index = open_steps.pop(values[0])
+            steps[index] = steps[index]._replace(end=timestamp)
+        elif record == _PEAK_RSS_RECORD and values[1].isdigit():
+            peak_rss[values[0]] = max(
+                peak_rss.get(values[0], 0), int(values[1]))
+        elif record == _BYTES_RECORD and values[1:] and values[1].isdigit():
+            file_bytes[values[0]] = int(values[1])
+
+    return RunLog(run_dir, run_type, params, job_state, jobs,
+                  steps, peak_rss, file_bytes)
+
+
+def get_step_duration(run_dir, step):
+    """
+    Return the time taken by a step of a run script.
+
+    Return the wall clock time in seconds taken by the most recently completed
+    execution of the named step, or None if the step has not completed.
+    run_dir: A read simulation or quantification directory.
+    step: Name of the step.
+    """
+    log = read_run_log(run_dir)
+    if log is None:
+        return None
+
+    spans = [s for s in log.steps if s.step == step and s.end is not None]
+    return spans[-1].end - spans[-1].start if spans else None
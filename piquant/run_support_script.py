@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+
+"""Usage:
+    run_support_script <script> [<arg>...]
+
+Run a piquant support script in the worker process started by
+support_worker.py, if it is running, or else directly. The worker's socket is
+given by the PIQUANT_WORKER_SOCKET environment variable, or otherwise is a
+per-user path in the temporary directory.
+
+This script deliberately avoids importing anything but the standard library,
+as it is executed in place of every support script run by read simulation and
+quantification run scripts.
+"""
+
+import sys
+import worker
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        exit(__doc__)
+
+    sys.exit(worker.run_script(
+        worker.get_socket_path(), sys.argv[1], sys.argv[2:]))
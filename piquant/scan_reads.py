@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""Usage:
+    scan_reads [{log_option_spec} --paired-end --stats-file=<stats-file>] <reads-file> [<right-reads-file>]
+
+{help_option_spec}                   {help_option_description}
+{ver_option_spec}                {ver_option_description}
+{log_option_spec}     {log_option_description}
+--paired-end                Indicates a single reads file contains interleaved paired-end reads.
+--stats-file=<stats-file>   JSON file to write the statistics of the reads to.
+<reads-file>                FASTA/Q file containing single-end or interleaved paired-end reads, or left reads of paired-end reads.
+<right-reads-file>          For paired-end reads, FASTA/Q file containing right reads.
+"""
+
+import docopt
+import json
+import options as opt
+import reads
+import schema
+import sys
+
+from __init__ import __version__
+
+PAIRED_END = "--paired-end"
+STATS_FILE = "--stats-file"
+READS_FILE = "<reads-file>"
+RIGHT_READS_FILE = "<right-reads-file>"
+
+
+def _validate_command_line_options(options):
+    try:
+        opt.validate_log_level(options)
+
+        opt.validate_file_option(
+            options[READS_FILE], "Reads file should exist")
+        opt.validate_file_option(
+            options[RIGHT_READS_FILE], "Right reads file should exist",
+            nullable=True)
+    except schema.SchemaError as exc:
+        exit(exc.code)
+
+
+def _scan_reads(logger, options):
+    reads_files = [options[READS_FILE]]
+    if options[RIGHT_READS_FILE] is not None:
+        reads_files.append(options[RIGHT_READS_FILE])
+
+    logger.info("Scanning reads in " + ", ".join(reads_files))
+    stats = reads.scan_reads(reads_files, paired_end=options[PAIRED_END])
+
+    if options[STATS_FILE] is not None:
+        with open(options[STATS_FILE], "w") as f:
+            json.dump(stats, f, indent=2, sort_keys=True)
+
+    # The number of reads is printed even if problems were found, so that
+    # callers may count the complete reads of a partially written file
+    print(stats["num_reads"])
+    for error in stats["errors"]:
+        logger.error(error)
+    return stats["valid"]
+
+
+if __name__ == "__main__":
+    # Read in command-line options
+    __doc__ = opt.substitute_common_options_into_usage(__doc__)
+    options = docopt.docopt(__doc__, version="scan_reads v" + __version__)
+
+    # Validate command-line options
+    _validate_command_line_options(options)
+
+    # Set up logger
+    logger = opt.get_logger_for_options(options)
+
+    # Check the integrity of the reads, and record their statistics
+    if not _scan_reads(logger, options):
+        sys.exit(1)
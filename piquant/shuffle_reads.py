@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""Usage:
+    shuffle_reads [{log_option_spec} --paired-end --seed=<seed> --buffer-size=<buffer-size> --out-file=<out-file>] <reads-file>
+
+{help_option_spec}                      {help_option_description}
+{ver_option_spec}                   {ver_option_description}
+{log_option_spec}        {log_option_description}
+--paired-end                   Indicates the reads file contains paired-end reads.
+--seed=<seed>                  Seed for the random number generator; if not specified, reads are shuffled differently each time.
+--buffer-size=<buffer-size>    Approximate maximum memory, in megabytes, to use for holding reads; larger reads files are shuffled via temporary files [default: 1024].
+--out-file=<out-file>          File to write shuffled reads to; if not specified, the reads file is overwritten.
+<reads-file>                   FASTA/Q file containing single or paired end reads.
+"""
+
+import docopt
+import options as opt
+import reads
+import schema
+
+from __init__ import __version__
+
+PAIRED_END = "--paired-end"
+SEED = "--seed"
+BUFFER_SIZE = "--buffer-size"
+OUT_FILE = "--out-file"
+READS_FILE = "<reads-file>"
+
+
+def _validate_command_line_options(options):
+    try:
+        opt.validate_log_level(options)
+
+        options[SEED] = opt.validate_int_option(
+            options[SEED], "Seed must be non-negative",
+            nonneg=True, nullable=True)
+        options[BUFFER_SIZE] = opt.validate_int_option(
+            options[BUFFER_SIZE], "Buffer size must be non-negative",
+            nonneg=True)
+        opt.validate_file_option(
+            options[READS_FILE], "Reads file should exist")
+    except schema.SchemaError as exc:
+        exit(exc.code)
+
+
+def _shuffle_reads(logger, options):
+    reads_file = options[READS_FILE]
+    out_file = options[OUT_FILE] or reads_file
+    lines_per_fragment = reads.get_lines_per_fragment(
+        reads_file.endswith("fastq"), options[PAIRED_END])
+
+    logger.info("Shuffling reads from " + reads_file + " to " + out_file)
+    try:
+        reads.shuffle_fragments(
+            reads_file, out_file, lines_per_fragment, seed=options[SEED],
+            buffer_size=max(options[BUFFER_SIZE], 1) * 1024 * 1024)
+    except ValueError as exc:
+        exit(str(exc))
+
+
+if __name__ == "__main__":
+    # Read in command-line options
+    __doc__ = opt.substitute_common_options_into_usage(__doc__)
+    options = docopt.docopt(__doc__, version="shuffle_reads v" + __version__)
+
+    # Validate command-line options
+    _validate_command_line_options(options)
+
+    # Set up logger
+    logger = opt.get_logger_for_options(options)
+
+    # Shuffle reads, keeping the reads of each fragment together
+    _shuffle_reads(logger, options)
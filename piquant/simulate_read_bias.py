@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 
 """Usage:
-    simulate_read_bias [{log_option_spec} --out-prefix=<out-prefix> --paired-end] --num-reads=<num-reads> <pwm-file> <reads_file>
+    simulate_read_bias [{log_option_spec} --out-prefix=<out-prefix> --paired-end --seed=<seed> --weighted-sampling --processes=<processes>] --num-reads=<num-reads> <pwm-file> <reads_file>
+    simulate_read_bias [{log_option_spec} --out-prefix=<out-prefix> --paired-end --seed=<seed> --weighted-sampling --processes=<processes>] --num-reads=<num-reads> --bias-model=<bias-model> <reads_file>
 
 {help_option_spec}                   {help_option_description}
 {ver_option_spec}                {ver_option_description}
@@ -9,16 +10,19 @@
 -n --num-reads=<num-reads>  Number of reads to output.
 --out-prefix=<out-prefix>   String to be prepended to input file names for output [default: bias]
 --paired-end                Indicates the reads file contains paired-end reads.
+--seed=<seed>               Seed for the random number generator; if not specified, a different selection is made each time.
+--weighted-sampling         Select reads by weighted random sampling without replacement, with probabilities proportional to their weights under the bias model.
+--processes=<processes>     Number of processes among which chunks of the reads file are distributed for scoring [default: 1].
+--bias-model=<bias-model>   Model used to bias reads, instead of a PWM: either "gc" or "positional".
 <pwm-file>                  PWM file with positional base weights used to bias reads.
 <reads_file>                FASTA/Q file containing single or paired end reads.
 """
 
-import collections
+import bias_models
 import docopt
 import options as opt
 import os.path
-import pwm
-import random
+import reads
 import schema
 import sys
 
@@ -27,40 +31,14 @@ from __init__ import __version__
 NUM_READS = "--num-reads"
 OUT_PREFIX = "--out-prefix"
 PAIRED_END = "--paired-end"
+SEED = "--seed"
+WEIGHTED_SAMPLING = "--weighted-sampling"
+PROCESSES = "--processes"
+BIAS_MODEL = "--bias-model"
 PWM_FILE = "<pwm-file>"
 READS_FILE = "<reads_file>"
 
 
-ReadScore = collections.namedtuple("ReadScore", ["read_number", "score"])
-
-
-class SequenceLinePicker:
-    def __init__(self, lines_per_fragment):
-        self.lines_per_fragment = lines_per_fragment
-
-    def __call__(self, line_no, line):
-        return (line_no - 1) % self.lines_per_fragment == 0
-
-
-class OutputPicker:
-    def __init__(self, scores, lines_per_fragment):
-        self.scores = scores
-        self.lines_per_fragment = lines_per_fragment
-        self.index = 0
-
-    def __call__(self, line_no, line):
-        if self.index >= len(self.scores):
-            return False
-
-        read_number = line_no / self.lines_per_fragment
-        if self.scores[self.index].read_number < read_number:
-            self.index += 1
-            if self.index >= len(self.scores):
-                return False
-
-        return self.scores[self.index].read_number == read_number
-
-
 def _validate_command_line_options(options):
     try:
         opt.validate_log_level(options)
@@ -68,8 +46,19 @@ def _validate_command_line_options(options):
         options[NUM_READS] = opt.validate_int_option(
             options[NUM_READS],
             "Number of reads must be non-negative", nonneg=True)
+        options[SEED] = opt.validate_int_option(
+            options[SEED], "Seed must be non-negative",
+            nonneg=True, nullable=True)
+        options[PROCESSES] = max(opt.validate_int_option(
+            options[PROCESSES], "Number of processes must be non-negative",
+            nonneg=True), 1)
+        if options[BIAS_MODEL] is not None:
+            opt.validate_list_option(
+                options[BIAS_MODEL],
+                [bias_models.GC_BIAS, bias_models.POSITIONAL_BIAS],
+                "Invalid bias model")
         opt.validate_file_option(
-            options[PWM_FILE], "PWM file should exist")
+            options[PWM_FILE], "PWM file should exist", nullable=True)
         opt.validate_file_option(
             options[READS_FILE], "Reads file should exist")
     except schema.SchemaError as exc:
@@ -90,70 +79,63 @@ def _get_fragment_counts(reads_file, num_reads, paired_end):
     return num_fragments, lines_per_fragment
 
 
-def _yield_elements(enumerable, element_picker):
-    return (elem for elem_no, elem in enumerate(enumerable)
-            if element_picker(elem_no, elem))
-
-
-def _score_fragments(reads_file, bias_pwm, num_fragments, lines_per_fragment):
-    scores = []
-    with open(reads_file, 'r') as f:
-        for i, line in enumerate(
-                _yield_elements(f, SequenceLinePicker(lines_per_fragment))):
-            score = ReadScore(
-                i, random.random() * bias_pwm.score(line.strip()))
-            scores.append(score)
+def _score_fragments(reads_file, bias_model, num_fragments,
+                     lines_per_fragment, reads_per_fragment, seed=None,
+                     weighted_sampling=False, processes=1):
+    # Chunks of the reads file are scored via its fragment index, which is
+    # then reused to copy the selected fragments
+    index = reads.get_fragment_index(reads_file, lines_per_fragment)
+    top_scoring = reads.score_fragments(
+        reads_file, index, num_fragments, lines_per_fragment,
+        reads_per_fragment, bias_model=bias_model, seed=seed,
+        weighted_sampling=weighted_sampling, processes=processes)
 
-    if num_fragments > len(scores):
+    if num_fragments > top_scoring.num_fragments:
         sys.exit("Input file(s) did not contain enough fragments " +
                  "({ni} found, {no} required)".
-                 format(ni=len(scores), no=num_fragments))
+                 format(ni=top_scoring.num_fragments, no=num_fragments))
 
-    return scores
+    return top_scoring
 
 
-def _select_scores(scores, num_fragments):
-    selected_scores = scores[:]
-    selected_scores.sort(key=lambda x: x.score, reverse=True)
-    selected_scores = selected_scores[1: num_fragments]
-    selected_scores.sort(key=lambda x: x.read_number)
-    return selected_scores
-
-
-def _write_output_file(input_file, scores, lines_per_fragment):
+def _write_output_file(input_file, selected, lines_per_fragment):
     dirname = os.path.dirname(os.path.abspath(input_file))
     basename = os.path.basename(input_file)
     output_file = os.path.join(dirname, options[OUT_PREFIX] + "." + basename)
 
-    with open(input_file, 'r') as in_f, open(output_file, 'w') as out_f:
-        for i, line in enumerate(_yield_elements(
-                in_f, OutputPicker(scores, lines_per_fragment))):
-            out_f.write(line)
+    # Selected fragments are located via the fragment index of the input
+    # file, and copied in blocks, rather than re-reading the file line by line
+    index = reads.get_fragment_index(input_file, lines_per_fragment)
+    with open(output_file, 'w') as out_f:
+        reads.copy_fragments(input_file, index, selected, out_f)
 
 
 def _simulate_bias(logger, options):
-    # Read PWM file
-    logger.info("Reading PWM file " + options[PWM_FILE])
-    bias_pwm = pwm.PWM(options[PWM_FILE])
+    # Read PWM file, if bias is simulated by a PWM
+    bias_model = bias_models.get_bias_model(
+        options[BIAS_MODEL], options[PWM_FILE])
 
-    # Iterate through fragments, storing positions and scores
-    logger.info("Scoring fragments according to PWM")
+    # Iterate through fragments, retaining the positions and scores of the
+    # highest scoring
+    logger.info("Scoring fragments according to bias model")
     num_fragments, lines_per_fragment = _get_fragment_counts(
         options[READS_FILE], options[NUM_READS], options[PAIRED_END])
-    scores = _score_fragments(
-        options[READS_FILE], bias_pwm, num_fragments, lines_per_fragment)
-    logger.info("...scored {n} fragments.".format(n=len(scores)))
-
-    # Sort fragments by score and select the required number of highest-scoring
-    # fragments
-    logger.info("Sorting and selecting {n} highest scoring fragments ".
+    top_scoring = _score_fragments(
+        options[READS_FILE], bias_model, num_fragments, lines_per_fragment,
+        2 if options[PAIRED_END] else 1,
+        seed=options[SEED], weighted_sampling=options[WEIGHTED_SAMPLING],
+        processes=options[PROCESSES])
+    logger.info("...scored {n} fragments.".format(
+        n=top_scoring.num_fragments))
+
+    # Select the required number of highest-scoring fragments
+    logger.info("Selecting {n} highest scoring fragments ".
                 format(n=num_fragments))
-    selected_scores = _select_scores(scores, num_fragments)
+    selected = top_scoring.selected()
 
     # Write selected fragments to output file(s)
     logger.info("Writing selected fragments to output files")
-    _write_output_file(options[READS_FILE], selected_scores,
-                       lines_per_fragment)
+    _write_output_file(options[READS_FILE], selected, lines_per_fragment)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+"""Usage:
+    simulate_reads [{log_option_spec} --paired-end --errors --seed=<seed> --fragment-length=<fragment-length> --fragment-sd=<fragment-sd> --chunk-size=<chunk-size> --processes=<processes> --bias-model=<bias-model> --bias-pwm=<pwm-file>] --read-length=<read-length> --num-reads=<num-reads> <pro-file> <transcript-gtf> <genome-fasta-dir> <out-prefix>
+
+{help_option_spec}                               {help_option_description}
+{ver_option_spec}                            {ver_option_description}
+{log_option_spec}                 {log_option_description}
+--paired-end                            Simulate paired-end reads.
+--errors                                Simulate reads with substitution errors, written in FASTQ format.
+--seed=<seed>                           Seed for the random number generator [default: 0].
+--fragment-length=<fragment-length>     Mean length of fragments [default: 250].
+--fragment-sd=<fragment-sd>             Standard deviation of the length of fragments [default: 50].
+--chunk-size=<chunk-size>               Number of fragments simulated at a time by each process [default: 100000].
+--processes=<processes>                 Number of processes among which chunks of fragments are distributed [default: 1].
+--bias-model=<bias-model>               Model used to bias the fragments simulated: one of "pwm", "gc" or "positional" (if not specified, but a PWM file is, "pwm").
+--bias-pwm=<pwm-file>                   PWM file with positional base weights used to bias the fragments simulated.
+-l --read-length=<read-length>          The length of simulated reads.
+-n --num-reads=<num-reads>              The number of reads to simulate.
+<pro-file>                              FluxSimulator expression profile file giving the number of molecules of each transcript.
+<transcript-gtf>                        GTF formatted file describing the transcripts to be simulated.
+<genome-fasta-dir>                      Directory containing per-chromosome sequences as FASTA files.
+<out-prefix>                            Prefix of the FASTA (or, if errors are simulated, FASTQ) file and BED file to which simulated reads and their locations are written.
+"""
+
+import bias_models
+import docopt
+import multiprocessing
+import options as opt
+import read_simulator as rs
+import schema
+
+from __init__ import __version__
+
+PAIRED_END = "--paired-end"
+ERRORS = "--errors"
+SEED = "--seed"
+FRAGMENT_LENGTH = "--fragment-length"
+FRAGMENT_SD = "--fragment-sd"
+CHUNK_SIZE = "--chunk-size"
+PROCESSES = "--processes"
+BIAS_MODEL = "--bias-model"
+BIAS_PWM_FILE = "--bias-pwm"
+READ_LENGTH = "--read-length"
+NUM_READS = "--num-reads"
+PRO_FILE = "<pro-file>"
+TRANSCRIPT_GTF = "<transcript-gtf>"
+GENOME_FASTA_DIR = "<genome-fasta-dir>"
+OUT_PREFIX = "<out-prefix>"
+
+# Worker processes are forked after the transcriptome has been read, and so
+# share it without it being copied to each
+_TRANSCRIPTOME = None
+
+
+def _validate_command_line_options(options):
+    try:
+        opt.validate_log_level(options)
+
+        options[SEED] = opt.validate_int_option(
+            options[SEED], "Seed must be non-negative", nonneg=True)
+        options[FRAGMENT_LENGTH] = opt.validate_int_option(
+            options[FRAGMENT_LENGTH], "Fragment length must be non-negative",
+            nonneg=True)
+        options[FRAGMENT_SD] = opt.validate_int_option(
+            options[FRAGMENT_SD],
+            "Fragment length standard deviation must be non-negative",
+            nonneg=True)
+        options[CHUNK_SIZE] = max(opt.validate_int_option(
+            options[CHUNK_SIZE], "Chunk size must be non-negative",
+            nonneg=True), 1)
+        options[PROCESSES] = max(opt.validate_int_option(
+            options[PROCESSES], "Number of processes must be non-negative",
+            nonneg=True), 1)
+        options[READ_LENGTH] = opt.validate_int_option(
+            options[READ_LENGTH], "Read length must be non-negative",
+            nonneg=True)
+        options[NUM_READS] = opt.validate_int_option(
+            options[NUM_READS], "Number of reads must be non-negative",
+            nonneg=True)
+        if options[BIAS_MODEL] is not None:
+            opt.validate_list_option(
+                options[BIAS_MODEL], bias_models.BIAS_MODELS,
+                "Invalid bias model")
+        opt.validate_file_option(
+            options[BIAS_PWM_FILE], "PWM file should exist", nullable=True)
+        opt.validate_file_option(
+            options[PRO_FILE], "Expression profile file should exist")
+        opt.validate_file_option(
+            options[TRANSCRIPT_GTF], "Transcript GTF file should exist")
+        opt.validate_dir_option(
+            options[GENOME_FASTA_DIR], "Genome FASTA directory should exist")
+    except schema.SchemaError as exc:
+        exit(exc.code)
+
+    if options[BIAS_MODEL] == bias_models.PWM_BIAS and \
+            options[BIAS_PWM_FILE] is None:
+        exit("A PWM file must be specified for PWM bias")
+
+
+def _simulate_chunk(args):
+    return rs.simulate_chunk(_TRANSCRIPTOME, *args)
+
+
+def _simulate_reads(logger, options):
+    global _TRANSCRIPTOME
+
+    logger.info("Reading transcript sequences")
+    _TRANSCRIPTOME = rs.read_transcriptome(
+        options[PRO_FILE], options[TRANSCRIPT_GTF], options[GENOME_FASTA_DIR])
+    if len(_TRANSCRIPTOME.ids) == 0:
+        raise ValueError("No expressed transcripts found in " +
+                         options[PRO_FILE])
+    logger.info("...read {n} transcripts.".format(
+        n=len(_TRANSCRIPTOME.ids)))
+
+    bias_model = bias_models.get_bias_model(
+        options[BIAS_MODEL], options[BIAS_PWM_FILE])
+
+    reads_per_fragment = 2 if options[PAIRED_END] else 1
+    chunk_sizes = rs.get_chunk_sizes(
+        options[NUM_READS] / reads_per_fragment, options[CHUNK_SIZE])
+    chunk_args = [(index, size, sum(chunk_sizes[:index]) + 1,
+                   options[READ_LENGTH], options[PAIRED_END],
+                   options[ERRORS], options[FRAGMENT_LENGTH],
+                   options[FRAGMENT_SD], options[SEED], bias_model)
+                  for index, size in enumerate(chunk_sizes)]
+
+    # Chunks are simulated concurrently, but written in order, so that the
+    # output does not depend on the number of processes used
+    reads_file = options[OUT_PREFIX] + (".fastq" if options[ERRORS]
+                                        else ".fasta")
+    bed_file = options[OUT_PREFIX] + ".bed"
+    logger.info("Simulating {n} fragments in {c} chunks".format(
+        n=sum(chunk_sizes), c=len(chunk_sizes)))
+
+    pool = multiprocessing.Pool(options[PROCESSES]) \
+        if options[PROCESSES] > 1 else None
+    try:
+        chunks = pool.imap(_simulate_chunk, chunk_args) if pool \
+            else (_simulate_chunk(args) for args in chunk_args)
+        with open(reads_file, "w") as reads_f, open(bed_file, "w") as bed_f:
+            for reads, bed in chunks:
+                reads_f.write(reads)
+                bed_f.write(bed)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+
+if __name__ == "__main__":
+    # Read in command-line options
+    __doc__ = opt.substitute_common_options_into_usage(__doc__)
+    options = docopt.docopt(__doc__, version="simulate_reads v" + __version__)
+
+    # Validate command-line options
+    _validate_command_line_options(options)
+
+    # Set up logger
+    logger = opt.get_logger_for_options(options)
+
+    # Simulate reads from the transcripts in the expression profile
+    try:
+        _simulate_reads(logger, options)
+    except (IOError, ValueError) as exc:
+        exit(str(exc))
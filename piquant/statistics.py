@@ -4,6 +4,8 @@ transcript quantification run. Exports:
 
 get_statistics: Return all statistic instances.
 get_graphable_statistics: Return statistic instances suitable for graphing.
+get_timing_statistics: Return statistic instances describing running time.
+add_scaling_statistics: Calculate speedup and efficiency for a set of runs.
 """
 
 import classifiers
@@ -14,12 +16,16 @@ import tpms as t
 
 TP_NUM_TPMS = "tp-num-tpms"
 OVERALL_STATS_PREFIX = "overall"
+QUANT_TIME = "quant-time"
+SPEEDUP = "speedup"
+EFFICIENCY = "efficiency"
 
 _SUMMARY_COUNT = "count"
 _SUMMARY_MEDIAN = "50%"
 _ZERO_TO_ONE_STAT_RANGE = (-0.025, 1.025)
 
 _STATISTICS = []
+_TIMING_STATISTICS = []
 
 
 def get_statistics():
@@ -43,6 +49,50 @@ def get_graphable_statistics():
     return set([s for s in get_statistics() if s.graphable])
 
 
+def get_timing_statistics():
+    """Return a set of statistic instances describing running time.
+
+    Return a set of objects describing the time taken by a transcript
+    quantification run, and how that time scales with the number of threads
+    used. Unlike other statistics, these are not calculated from TPMs, but
+    from the wall clock time recorded for each run (see
+    add_scaling_statistics()).
+    """
+    return set(_TIMING_STATISTICS)
+
+
+def add_scaling_statistics(overall_stats, threads_column, group_columns):
+    """Calculate speedup and efficiency for a set of quantification runs.
+
+    Return a copy of a data frame of overall statistics for a set of
+    quantification runs, to which columns have been added containing the
+    speedup and parallel efficiency of each run. Runs are compared against
+    the run with the fewest threads which has the same values for all other
+    parameters.
+    overall_stats: A pandas DataFrame containing a QUANT_TIME column giving
+    the wall clock time taken by each run.
+    threads_column: Name of the column giving the number of threads used.
+    group_columns: Names of the columns giving the values of other parameters.
+    """
+    stats = overall_stats.reset_index(drop=True)
+    if QUANT_TIME not in stats:
+        return stats
+
+    stats[SPEEDUP] = float("nan")
+    stats[EFFICIENCY] = float("nan")
+
+    for _, group in stats.groupby(group_columns):
+        min_threads = group[threads_column].min()
+        base_time = group[group[threads_column] == min_threads][
+            QUANT_TIME].mean()
+        speedup = base_time / group[QUANT_TIME]
+        stats.loc[group.index, SPEEDUP] = speedup
+        stats.loc[group.index, EFFICIENCY] = \
+            speedup * min_threads / group[threads_column]
+
+    return stats
+
+
 def get_stratified_stats_types():
     clsfrs = classifiers.get_classifiers()
     grp_clsfrs = [c for c in clsfrs if c.produces_grouped_stats()]
@@ -72,6 +122,12 @@ def _Statistic(cls):
     return cls
 
 
+def _TimingStatistic(cls):
+    # Mark a class as describing the running time of a quantification run.
+    _TIMING_STATISTICS.append(cls())
+    return cls
+
+
 class _BaseStatistic():
     # Base for classes capable of calculating a statistic
     def __init__(self, name, title, graphable=True):
@@ -301,3 +357,36 @@ class _Specificity(_BaseStatistic):
     def stat_range(self, vals_range):
         min_val = math.floor(vals_range[0] * 5) / 5.0
         return (min_val - 0.01, 1.01)
+
+
+@_TimingStatistic
+class _QuantificationTime(_BaseStatistic):
+    # The wall clock time, in seconds, taken by the quantification tool.
+    def __init__(self):
+        _BaseStatistic.__init__(
+            self, QUANT_TIME, "Quantification time (s)")
+
+    def stat_range(self, vals_range):
+        return (0, None)
+
+
+@_TimingStatistic
+class _Speedup(_BaseStatistic):
+    # The ratio of the time taken by the run with the fewest threads to the
+    # time taken by this run, for otherwise identical runs.
+    def __init__(self):
+        _BaseStatistic.__init__(self, SPEEDUP, "Speedup")
+
+    def stat_range(self, vals_range):
+        return (0, None)
+
+
+@_TimingStatistic
+class _Efficiency(_BaseStatistic):
+    # The speedup of this run divided by the proportional increase in the
+    # number of threads used.
+    def __init__(self):
+        _BaseStatistic.__init__(self, EFFICIENCY, "Parallel efficiency")
+
+    def stat_range(self, vals_range):
+        return (0, None)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""Usage:
+    subsample_reads [{log_option_spec} --seed=<seed>] --num-reads=<num-reads> <reads-file> <out-file> [<right-reads-file> <right-out-file>]
+
+{help_option_spec}                      {help_option_description}
+{ver_option_spec}                   {ver_option_description}
+{log_option_spec}        {log_option_description}
+-n --num-reads=<num-reads>     Number of reads to output.
+--seed=<seed>                  Seed for the random number generator; if not specified, a different subsample is drawn each time.
+<reads-file>                   FASTA/Q file containing single-end reads, or left reads of paired-end reads.
+<out-file>                     File to write subsampled (left) reads to.
+<right-reads-file>             For paired-end reads, FASTA/Q file containing right reads.
+<right-out-file>               For paired-end reads, file to write subsampled right reads to.
+"""
+
+import docopt
+import options as opt
+import reads
+import schema
+
+from __init__ import __version__
+
+NUM_READS = "--num-reads"
+SEED = "--seed"
+READS_FILE = "<reads-file>"
+OUT_FILE = "<out-file>"
+RIGHT_READS_FILE = "<right-reads-file>"
+RIGHT_OUT_FILE = "<right-out-file>"
+
+
+def _validate_command_line_options(options):
+    try:
+        opt.validate_log_level(options)
+
+        options[NUM_READS] = opt.validate_int_option(
+            options[NUM_READS], "Number of reads must be non-negative",
+            nonneg=True)
+        options[SEED] = opt.validate_int_option(
+            options[SEED], "Seed must be non-negative",
+            nonneg=True, nullable=True)
+        opt.validate_file_option(
+            options[READS_FILE], "Reads file should exist")
+        opt.validate_file_option(
+            options[RIGHT_READS_FILE], "Right reads file should exist",
+            nullable=True)
+    except schema.SchemaError as exc:
+        exit(exc.code)
+
+
+def _subsample_reads(logger, options):
+    reads_files = [options[READS_FILE]]
+    out_files = [options[OUT_FILE]]
+    if options[RIGHT_READS_FILE] is not None:
+        reads_files.append(options[RIGHT_READS_FILE])
+        out_files.append(options[RIGHT_OUT_FILE])
+
+    num_fragments = options[NUM_READS] / len(reads_files)
+    logger.info("Subsampling {n} fragments from {f}".format(
+        n=num_fragments, f=", ".join(reads_files)))
+    reads.subsample_fragments(
+        reads_files, out_files, num_fragments, seed=options[SEED])
+
+
+if __name__ == "__main__":
+    # Read in command-line options
+    __doc__ = opt.substitute_common_options_into_usage(__doc__)
+    options = docopt.docopt(__doc__, version="subsample_reads v" + __version__)
+
+    # Validate command-line options
+    _validate_command_line_options(options)
+
+    # Set up logger
+    logger = opt.get_logger_for_options(options)
+
+    # Select a random subsample of fragments, keeping paired-end reads in step
+    try:
+        _subsample_reads(logger, options)
+    except (IOError, ValueError) as exc:
+        exit(str(exc))
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""Usage:
+    support_worker [{log_option_spec} --socket=<socket>]
+
+{help_option_spec}                 {help_option_description}
+{ver_option_spec}              {ver_option_description}
+{log_option_spec}   {log_option_description}
+--socket=<socket>         Unix socket on which to listen for requests to run support scripts (by default, the value of the {socket_variable} environment variable, or a per-user path in the temporary directory).
+"""
+
+import docopt
+import importlib
+import options as opt
+import schema
+import worker
+
+from __init__ import __version__
+
+SOCKET = "--socket"
+
+# Modules imported by support scripts which are expensive to import, or which
+# are otherwise worth keeping loaded in the worker
+_PRELOADED_MODULES = [
+    "numpy", "pandas", "scipy.stats", "matplotlib", "seaborn",
+    "classifiers", "flux_simulator", "gtf", "parameters", "plot", "pwm",
+    "read_simulator", "reads", "run_log", "statistics", "tpms"
+]
+
+
+def _validate_command_line_options(options):
+    try:
+        opt.validate_log_level(options)
+        if options[SOCKET] is None:
+            options[SOCKET] = worker.get_socket_path()
+    except schema.SchemaError as exc:
+        exit(exc.code)
+
+
+def _preload_modules(logger):
+    logger.info("Importing modules...")
+    for module in _PRELOADED_MODULES:
+        importlib.import_module(module)
+
+
+if __name__ == "__main__":
+    # Read in command-line options
+    __doc__ = opt.substitute_common_options_into_usage(
+        __doc__, socket_variable=worker.SOCKET_VARIABLE)
+    options = docopt.docopt(__doc__, version="support_worker v" + __version__)
+
+    # Validate command-line options
+    _validate_command_line_options(options)
+
+    # Set up logger
+    logger = opt.get_logger_for_options(options)
+
+    # Import modules used by support scripts, then serve requests to run them
+    _preload_modules(logger)
+    worker.serve(options[SOCKET], logger)
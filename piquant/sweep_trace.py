@@ -0,0 +1,144 @@
+"""
+Functions for describing the execution of a sweep of read simulation and
+quantification runs as a timeline in Chrome trace event format, suitable for
+viewing in chrome://tracing or other trace viewers. Exports:
+
+get_trace_events: Return trace events for the jobs and steps of a set of runs.
+write_trace: Write a trace file for a set of runs.
+"""
+
+import heapq
+import json
+import os.path
+import time
+
+_PROCESS_ID = 1
+_PROCESS_NAME = "piquant sweep"
+_JOB_CATEGORY = "job"
+_MICROSECONDS = 1000000
+
+
+def _get_jobs(run_logs, now):
+    # Jobs still running (or whose run script was killed) are treated as
+    # ending now.
+    jobs = []
+    for log in run_logs:
+        for job in log.jobs:
+            end = now if job.end is None else job.end
+            jobs.append((job.start, end, job.state, log))
+    return sorted(jobs, key=lambda job: job[0])
+
+
+def _assign_worker_slots(jobs):
+    # Greedily pack jobs into as few worker slots as possible: each job is
+    # assigned the lowest numbered slot which has become free by the time the
+    # job starts.
+    slots = []
+    num_slots = 0
+    free_slots = []
+    busy_slots = []
+    for start, end, state, log in jobs:
+        while busy_slots and busy_slots[0][0] <= start:
+            heapq.heappush(free_slots, heapq.heappop(busy_slots)[1])
+        if free_slots:
+            slot = heapq.heappop(free_slots)
+        else:
+            slot = num_slots
+            num_slots += 1
+        slots.append(slot)
+        heapq.heappush(busy_slots, (end, slot))
+    return slots
+
+
+def _get_time(timestamp, origin):
+    return int(round((timestamp - origin) * _MICROSECONDS))
+
+
+def _get_span_event(name, category, start, end, slot, origin, args=None):
+    event = {
+        "name": name,
+        "cat": category,
+        "ph": "X",
+        "pid": _PROCESS_ID,
+        "tid": slot,
+        "ts": _get_time(start, origin),
+        "dur": _get_time(end, start)
+    }
+    if args:
+        event["args"] = args
+    return event
+
+
+def _get_metadata_event(name, slot, value):
+    return {
+        "name": name,
+        "ph": "M",
+        "pid": _PROCESS_ID,
+        "tid": slot,
+        "args": {"name": value}
+    }
+
+
+def get_trace_events(run_logs, now=None):
+    """
+    Return trace events for the jobs and steps of a set of runs.
+
+    Each execution of a run script is assigned to a worker slot, such that
+    executions which overlap in time are assigned to different slots, and
+    the number of slots used is minimised. A complete event is returned
+    spanning each execution, along with a complete event in the same slot for
+    each step of the run script executed. Timestamps are given in
+    microseconds relative to the start of the earliest execution.
+    run_logs: A list of run_log.RunLog instances.
+    now: Time (in seconds since the epoch) at which executions and steps
+    which have not finished are considered to end; defaults to the current
+    time.
+    """
+    if now is None:
+        now = time.time()
+
+    jobs = _get_jobs(run_logs, now)
+    if not jobs:
+        return []
+
+    slots = _assign_worker_slots(jobs)
+    origin = jobs[0][0]
+
+    events = [_get_metadata_event("process_name", 0, _PROCESS_NAME)]
+    events += [_get_metadata_event(
+        "thread_name", slot, "worker slot {s}".format(s=slot))
+        for slot in sorted(set(slots))]
+
+    for (start, end, state, log), slot in zip(jobs, slots):
+        run_name = os.path.basename(os.path.normpath(log.run_dir))
+        args = dict(log.params)
+        args["state"] = state
+        events.append(_get_span_event(
+            run_name, _JOB_CATEGORY, start, end, slot, origin, args))
+
+        for step in log.steps:
+            if start <= step.start <= end:
+                step_end = min(end, now if step.end is None else step.end)
+                events.append(_get_span_event(
+                    step.step, log.run_type, step.start, step_end,
+                    slot, origin, {"run": run_name}))
+
+    return events
+
+
+def write_trace(trace_file, run_logs, now=None):
+    """
+    Write a trace file for a set of runs.
+
+    trace_file: Path of the JSON file to write.
+    run_logs: A list of run_log.RunLog instances.
+    now: Time (in seconds since the epoch) at which executions and steps
+    which have not finished are considered to end; defaults to the current
+    time.
+    """
+    trace = {
+        "traceEvents": get_trace_events(run_logs, now),
+        "displayTimeUnit": "ms"
+    }
+    with open(trace_file, "w") as f:
+        json.dump(trace, f, indent=1, sort_keys=True)
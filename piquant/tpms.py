@@ -5,6 +5,11 @@ TRANSCRIPT_COUNT = "num-transcripts"
 LENGTH = "length"
 UNIQUE_SEQ_LENGTH = "unique-length"
 REAL_TPM = "real-tpm"
+REAL_FRAGMENTS = "real-fragments"
+REAL_READ_TPM = "real-read-tpm"
+ASSIGNED_READS = "assigned-reads"
+CORRECT_READS = "correct-reads"
+ASSIGNMENT_PRECISION = "assignment-precision"
 CALCULATED_TPM = "calc-tpm"
 PERCENT_ERROR = "percent-error"
 LOG10_REAL_TPM = "log10-real-tpm"
@@ -78,6 +83,18 @@ def get_grouped_stats(tpms, tp_tpms, column_name, statistics):
     return pd.DataFrame.from_dict(stats_dict)
 
 
+def get_assignment_precision(tpms, column_name=None):
+    # The precision of read assignment is the fraction of the reads assigned
+    # to a group of transcripts which originated from the transcript they
+    # were assigned to
+    counts = tpms[[ASSIGNED_READS, CORRECT_READS]]
+    precision = counts.groupby(tpms[column_name]).sum() \
+        if column_name else pd.DataFrame([counts.sum()])
+    precision[ASSIGNMENT_PRECISION] = \
+        precision[CORRECT_READS] / precision[ASSIGNED_READS].astype(float)
+    return precision
+
+
 def get_distribution(tpms, classifier, ascending):
     values = tpms.apply(classifier.get_value, axis=1)
     values.sort(ascending=ascending)
@@ -0,0 +1,304 @@
+"""
+Functions for executing piquant support scripts in a persistent worker
+process, avoiding the cost of importing modules such as pandas, numpy and
+matplotlib every time a support script is run. Exports:
+
+get_socket_path: Return the path of the worker's Unix socket.
+get_script_command: Return a command running a support script via the worker.
+serve: Serve requests to run support scripts.
+run_script: Run a support script via the worker, or directly if there is none.
+
+SOCKET_VARIABLE: Environment variable optionally specifying the socket path.
+"""
+
+import json
+import os
+import os.path
+import runpy
+import select
+import signal
+import socket
+import stat
+import struct
+import sys
+import tempfile
+import traceback
+
+SOCKET_VARIABLE = "PIQUANT_WORKER_SOCKET"
+
+_CLIENT_SCRIPT = "run_support_script.py"
+
+_STDOUT = "o"
+_STDERR = "e"
+_EXIT = "x"
+_FRAME_HEADER = struct.Struct("!cI")
+_READ_SIZE = 65536
+
+
+def get_socket_path():
+    """
+    Return the path of the worker's Unix socket.
+
+    The path is taken from the environment variable SOCKET_VARIABLE if it is
+    set; otherwise a per-user path in the system temporary directory is used.
+    """
+    return os.environ.get(SOCKET_VARIABLE) or os.path.join(
+        tempfile.gettempdir(),
+        "piquant-worker-{uid}.sock".format(uid=os.getuid()))
+
+
+def get_script_command(script_path):
+    """
+    Return a command which runs a support script via the worker.
+
+    The returned command runs the support script in the worker process if it
+    is running, or else executes the script directly.
+    script_path: Absolute path of the support script.
+    """
+    client_script = os.path.join(
+        os.path.abspath(os.path.dirname(__file__)), _CLIENT_SCRIPT)
+    return client_script + " " + script_path
+
+
+def _send_frame(conn, channel, data):
+    conn.sendall(_FRAME_HEADER.pack(channel, len(data)) + data)
+
+
+def _receive_exactly(conn, size):
+    data = ""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _receive_frame(conn):
+    header = _receive_exactly(conn, _FRAME_HEADER.size)
+    if header is None:
+        return None, None
+    channel, size = _FRAME_HEADER.unpack(header)
+    return channel, _receive_exactly(conn, size)
+
+
+def _receive_request(conn):
+    request = ""
+    while not request.endswith("\n"):
+        chunk = conn.recv(_READ_SIZE)
+        if not chunk:
+            break
+        request += chunk
+    return json.loads(request)
+
+
+def _write_fully(fd, data):
+    while data:
+        data = data[os.write(fd, data):]
+
+
+def _run_script(request):
+    # Executed in a freshly forked process, whose standard output and error
+    # have been redirected to pipes read by the parent. The script is run with
+    # the environment, working directory and umask of the client, so that it
+    # behaves as if it had been executed directly.
+    script = request["script"].encode("utf-8")
+    os.chdir(request["cwd"].encode("utf-8"))
+    os.environ.clear()
+    os.environ.update({name.encode("utf-8"): value.encode("utf-8")
+                       for name, value in request["environ"].items()})
+    os.umask(request["umask"])
+    sys.argv = [script] + [arg.encode("utf-8") for arg in request["args"]]
+
+    exit_code = 0
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as exc:
+        if exc.code is None or isinstance(exc.code, int):
+            exit_code = exc.code or 0
+        else:
+            sys.stderr.write(str(exc.code) + "\n")
+            exit_code = 1
+    except:
+        traceback.print_exc()
+        exit_code = 1
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return exit_code
+
+
+def _relay_output(conn, channels):
+    while channels:
+        readable, _, _ = select.select(list(channels), [], [])
+        for fd in readable:
+            data = os.read(fd, _READ_SIZE)
+            if data:
+                _send_frame(conn, channels[fd], data)
+            else:
+                os.close(fd)
+                del channels[fd]
+
+
+def _handle_request(conn, logger):
+    request = _receive_request(conn)
+    logger.debug("Running {s} {a} in {d}".format(
+        s=request["script"], a=" ".join(request["args"]), d=request["cwd"]))
+
+    stdout_read, stdout_write = os.pipe()
+    stderr_read, stderr_write = os.pipe()
+
+    pid = os.fork()
+    if pid == 0:
+        conn.close()
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        os.close(stdout_read)
+        os.close(stderr_read)
+        os.dup2(stdout_write, sys.stdout.fileno())
+        os.dup2(stderr_write, sys.stderr.fileno())
+        null_fd = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(null_fd, sys.stdin.fileno())
+        os._exit(_run_script(request))
+
+    os.close(stdout_write)
+    os.close(stderr_write)
+    _relay_output(conn, {stdout_read: _STDOUT, stderr_read: _STDERR})
+
+    _, status = os.waitpid(pid, 0)
+    exit_code = os.WEXITSTATUS(status) if os.WIFEXITED(status) \
+        else 128 + os.WTERMSIG(status)
+    _send_frame(conn, _EXIT, str(exit_code))
+
+
+def _is_serving(socket_path):
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        conn.close()
+
+
+def serve(socket_path, logger):
+    """
+    Serve requests to run support scripts.
+
+    Listen on a Unix socket for requests to run support scripts, running each
+    in a process forked from the current one, so that modules already
+    imported by the current process need not be imported again. Standard
+    output, standard error and the exit code of each support script are
+    relayed back to the requesting client. This function does not return.
+    socket_path: Path of the Unix socket to listen on.
+    logger: Logs messages to standard error.
+    """
+    if _is_serving(socket_path):
+        sys.exit("A worker is already listening on " + socket_path)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    # Only the user running the worker may connect to it
+    os.chmod(socket_path, 0600)
+    server.listen(128)
+
+    # Processes handling requests are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    logger.info("Listening on " + socket_path)
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            if os.fork() == 0:
+                server.close()
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                try:
+                    _handle_request(conn, logger)
+                finally:
+                    os._exit(0)
+            conn.close()
+    finally:
+        server.close()
+        os.remove(socket_path)
+
+
+def _has_interactive_or_null_stdin():
+    # Standard input cannot be passed to the worker; a script run by the
+    # worker reads from the null device instead, which is only equivalent to
+    # direct execution if the client's standard input is a terminal (from
+    # which support scripts, run by run scripts, never read) or is itself the
+    # null device
+    try:
+        stdin_stat = os.fstat(sys.stdin.fileno())
+    except OSError:
+        return True
+    if os.isatty(sys.stdin.fileno()):
+        return True
+    null_stat = os.stat(os.devnull)
+    return stat.S_ISCHR(stdin_stat.st_mode) and \
+        stdin_stat.st_rdev == null_stat.st_rdev
+
+
+def _is_own_socket(socket_path):
+    # Scripts are only requested of a worker listening on a socket owned by
+    # the current user, so that the client's environment is never sent to,
+    # nor output relayed from, a process run by another user
+    try:
+        socket_stat = os.lstat(socket_path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(socket_stat.st_mode) and \
+        socket_stat.st_uid == os.getuid()
+
+
+def _get_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def run_script(socket_path, script, args):
+    """
+    Run a support script via the worker, or directly if there is none.
+
+    If a worker is listening on the specified socket, request that it run the
+    support script, with the environment, working directory and umask of the
+    current process, relaying its standard output and error, and return its
+    exit code. Otherwise, or if the socket is not owned by the current user,
+    or if standard input is neither a terminal nor the null device (as it
+    cannot be passed to the worker), replace the current process with the
+    support script.
+    socket_path: Path of the worker's Unix socket.
+    script: Absolute path of the support script.
+    args: List of command line arguments for the support script.
+    """
+    if not _has_interactive_or_null_stdin() or \
+            not _is_own_socket(socket_path):
+        os.execv(script, [script] + args)
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except socket.error:
+        os.execv(script, [script] + args)
+
+    conn.sendall(json.dumps(
+        {"script": script, "args": args, "cwd": os.getcwd(),
+         "environ": dict(os.environ), "umask": _get_umask()}) + "\n")
+
+    outputs = {_STDOUT: sys.stdout.fileno(), _STDERR: sys.stderr.fileno()}
+    while True:
+        channel, data = _receive_frame(conn)
+        if channel is None:
+            sys.stderr.write("Lost connection to worker running " +
+                             script + "\n")
+            return 1
+        elif channel == _EXIT:
+            return int(data)
+        _write_fully(outputs[channel], data)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+"""Usage:
+    write_sweep_metrics [{log_option_spec}] <out-dir> <metrics-file>
+
+{help_option_spec}                 {help_option_description}
+{ver_option_spec}              {ver_option_description}
+{log_option_spec}   {log_option_description}
+<out-dir>                 Parent directory of read simulation and quantification directories.
+<metrics-file>            File to which metrics will be written in Prometheus text format.
+"""
+
+import collections
+import docopt
+import options as opt
+import os
+import os.path
+import run_log
+import schema
+import time
+
+from __init__ import __version__
+
+OUT_DIR = "<out-dir>"
+METRICS_FILE = "<metrics-file>"
+
+QUANT_METHOD_PARAM = "quant_method"
+QUANT_STEP = "quant"
+ANALYSIS_STEPS = ["assemble", "analyse", "plots"]
+READS_BYTES = "reads"
+
+_DURATION_BUCKETS = [
+    60, 300, 900, 1800, 3600, 7200, 14400, 28800, 86400, float("inf")]
+
+Metric = collections.namedtuple(
+    "Metric", ["name", "metric_type", "help", "samples"])
+
+
+def _validate_command_line_options(options):
+    try:
+        opt.validate_log_level(options)
+        opt.validate_dir_option(
+            options[OUT_DIR], "Output parent directory does not exist")
+    except schema.SchemaError as exc:
+        exit(exc.code)
+
+
+def _read_run_logs(out_dir):
+    run_logs = []
+    for name in sorted(os.listdir(out_dir)):
+        run_dir = os.path.join(out_dir, name)
+        if os.path.isdir(run_dir):
+            log = run_log.read_run_log(run_dir)
+            if log is not None:
+                run_logs.append(log)
+    return run_logs
+
+
+def _get_completed_step_durations(run_logs, step_name, label_param=None):
+    durations = collections.defaultdict(list)
+    for log in run_logs:
+        label = log.params.get(label_param) if label_param else step_name
+        for step in log.steps:
+            if step.step == step_name and step.end is not None:
+                durations[label].append(step.end - step.start)
+    return durations
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        "{k}=\"{v}\"".format(k=k, v=v) for k, v in sorted(labels.items())) + \
+        "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else str(bound)
+
+
+def _get_histogram_samples(name, durations, label_name):
+    samples = []
+    for label, values in sorted(durations.items()):
+        for bound in _DURATION_BUCKETS:
+            labels = {label_name: label, "le": _format_bound(bound)}
+            samples.append((name + "_bucket", labels,
+                            len([v for v in values if v <= bound])))
+        samples.append((name + "_sum", {label_name: label}, sum(values)))
+        samples.append((name + "_count", {label_name: label}, len(values)))
+    return samples
+
+
+def _get_job_state_metric(run_logs):
+    counts = collections.Counter(
+        (log.run_type, log.job_state) for log in run_logs)
+    run_types = [run_log.SIMULATION_RUN, run_log.QUANTIFICATION_RUN]
+    samples = [("piquant_jobs", {"type": rt, "state": state},
+                counts[(rt, state)])
+               for rt in run_types for state in run_log.JOB_STATES]
+    return Metric("piquant_jobs", "gauge",
+                  "Number of piquant run scripts in each job state.", samples)
+
+
+def _get_quantification_duration_metric(run_logs):
+    name = "piquant_quantification_duration_seconds"
+    durations = _get_completed_step_durations(
+        run_logs, QUANT_STEP, label_param=QUANT_METHOD_PARAM)
+    return Metric(name, "histogram",
+                  "Wall clock time taken to quantify transcripts.",
+                  _get_histogram_samples(name, durations, QUANT_METHOD_PARAM))
+
+
+def _get_analysis_duration_metric(run_logs):
+    name = "piquant_analysis_stage_duration_seconds"
+    durations = {}
+    for stage in ANALYSIS_STEPS:
+        durations.update(_get_completed_step_durations(run_logs, stage))
+    return Metric(name, "histogram",
+                  "Wall clock time taken by each stage of analysis.",
+                  _get_histogram_samples(name, durations, "stage"))
+
+
+def _get_reads_bytes_metric(run_logs):
+    name = "piquant_simulated_reads_bytes"
+    total = sum(log.bytes.get(READS_BYTES, 0) for log in run_logs)
+    return Metric(name, "gauge",
+                  "Total size of simulated reads files.",
+                  [(name, {}, total)])
+
+
+def _get_peak_rss_metric(run_logs):
+    name = "piquant_tool_peak_rss_bytes"
+    peak_rss = collections.Counter()
+    for log in run_logs:
+        for tool, kilobytes in log.peak_rss.items():
+            peak_rss[tool] = max(peak_rss[tool], kilobytes * 1024)
+    return Metric(name, "gauge",
+                  "Maximum resident set size of each external tool.",
+                  [(name, {"tool": tool}, rss)
+                   for tool, rss in sorted(peak_rss.items())])
+
+
+def _get_last_update_metric():
+    name = "piquant_metrics_last_update_timestamp_seconds"
+    return Metric(name, "gauge",
+                  "Time at which piquant metrics were last written.",
+                  [(name, {}, time.time())])
+
+
+def _write_metrics(metrics_file, metrics):
+    # Metrics are written to a temporary file which is then renamed, so that
+    # the textfile collector never reads a partially written file.
+    tmp_file = "{f}.{pid}.tmp".format(f=metrics_file, pid=os.getpid())
+    with open(tmp_file, "w") as f:
+        for metric in metrics:
+            f.write("# HELP {n} {h}\n".format(n=metric.name, h=metric.help))
+            f.write("# TYPE {n} {t}\n".format(
+                n=metric.name, t=metric.metric_type))
+            for sample_name, labels, value in metric.samples:
+                f.write("{n}{l} {v}\n".format(
+                    n=sample_name, l=_format_labels(labels), v=value))
+    os.rename(tmp_file, metrics_file)
+
+
+def _write_sweep_metrics(logger, options):
+    logger.info("Reading run logs in {d}...".format(d=options[OUT_DIR]))
+    run_logs = _read_run_logs(options[OUT_DIR])
+
+    logger.info("Writing metrics for {n} runs to {f}".format(
+        n=len(run_logs), f=options[METRICS_FILE]))
+    _write_metrics(options[METRICS_FILE], [
+        _get_job_state_metric(run_logs),
+        _get_quantification_duration_metric(run_logs),
+        _get_analysis_duration_metric(run_logs),
+        _get_reads_bytes_metric(run_logs),
+        _get_peak_rss_metric(run_logs),
+        _get_last_update_metric()
+    ])
+
+
+if __name__ == "__main__":
+    # Read in command-line options
+    __doc__ = opt.substitute_common_options_into_usage(__doc__)
+    options = docopt.docopt(
+        __doc__, version="write_sweep_metrics v" + __version__)
+
+    # Validate command-line options
+    _validate_command_line_options(options)
+
+    # Set up logger
+    logger = opt.get_logger_for_options(options)
+
+    # Summarise the progress of all runs in Prometheus text format
+    _write_sweep_metrics(logger, options)
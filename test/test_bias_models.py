@@ -0,0 +1,56 @@
+import numpy as np
+import piquant.bias_models as bm
+import pytest
+
+READ_LINES = [
+    ">1:1-100W:T1:1:100:1:40:S/1", "GGCC",
+    ">1:1-100W:T1:1:100:1:40:S/2", "ATAT",
+    ">1:1-100W:T2:2:200:151:200:A/1", "GCGA",
+    ">1:1-100W:T2:2:200:151:200:A/2", "CCCC"
+]
+
+
+def _get_fragments(reads_per_fragment=2):
+    return bm.ReadFragments(
+        READ_LINES, 2 * reads_per_fragment, reads_per_fragment)
+
+
+def test_read_fragments_return_correct_gc_content():
+    assert list(_get_fragments().gc_content()) == [0.5, 0.875]
+    assert list(_get_fragments(1).gc_content()) == [1, 0, 0.75, 1]
+
+
+def test_read_fragments_return_correct_positions():
+    assert list(_get_fragments().positions()) == \
+        pytest.approx([0.205, 0.8775])
+
+
+def test_read_fragments_raise_error_for_names_without_positions():
+    fragments = bm.ReadFragments([">read1", "ACGT"], 2, 1)
+    with pytest.raises(ValueError):
+        fragments.positions()
+
+
+def test_gc_bias_favours_optimal_gc_content():
+    weights = bm.GCBias(optimum=0.5).weigh(_get_fragments())
+    assert weights[0] == pytest.approx(1)
+    assert weights[1] < weights[0]
+
+
+def test_positional_bias_favours_three_prime_end():
+    weights = bm.PositionalBias().weigh(_get_fragments())
+    assert weights[1] > weights[0]
+    weights = bm.PositionalBias(three_prime=False).weigh(_get_fragments())
+    assert weights[0] > weights[1]
+
+
+def test_count_gc_returns_counts_per_row():
+    bases = np.frombuffer("GCATcgNN", dtype=np.uint8).reshape(2, 4)
+    assert list(bm.count_gc(bases)) == [2, 2]
+
+
+def test_get_bias_model_requires_pwm_file_for_pwm_bias():
+    assert bm.get_bias_model() is None
+    assert isinstance(bm.get_bias_model(bm.GC_BIAS), bm.GCBias)
+    with pytest.raises(ValueError):
+        bm.get_bias_model(bm.PWM_BIAS)
@@ -0,0 +1,51 @@
+import os.path
+import piquant.file_writer as fw
+import subprocess
+import utils
+
+SCRIPT_NAME = "script.sh"
+
+
+def _write_and_run_parallel_script(dirname, job_commands):
+    with fw.writing_to_file(fw.BashScriptWriter, dirname, SCRIPT_NAME) \
+            as writer:
+        writer.add_line("cd " + dirname)
+        with writer.parallel_section():
+            for command in job_commands:
+                with writer.background_job():
+                    writer.add_line(command)
+        writer.add_line("touch finished")
+
+    return subprocess.call([os.path.join(dirname, SCRIPT_NAME)])
+
+
+def test_parallel_section_executes_all_background_jobs():
+    with utils.temp_dir_created() as dirname:
+        _write_and_run_parallel_script(dirname, ["touch a", "touch b"])
+        assert os.path.exists(os.path.join(dirname, "a"))
+        assert os.path.exists(os.path.join(dirname, "b"))
+
+
+def test_parallel_section_waits_for_background_jobs():
+    with utils.temp_dir_created() as dirname:
+        _write_and_run_parallel_script(
+            dirname, ["sleep 0.5; touch a", "true"])
+        assert os.path.exists(os.path.join(dirname, "a"))
+
+
+def test_parallel_section_continues_if_all_background_jobs_succeed():
+    with utils.temp_dir_created() as dirname:
+        assert _write_and_run_parallel_script(dirname, ["true", "true"]) == 0
+        assert os.path.exists(os.path.join(dirname, "finished"))
+
+
+def test_parallel_section_exits_if_any_background_job_fails():
+    with utils.temp_dir_created() as dirname:
+        assert _write_and_run_parallel_script(dirname, ["true", "false"]) != 0
+        assert not os.path.exists(os.path.join(dirname, "finished"))
+
+
+def test_background_job_exits_on_first_failing_command():
+    with utils.temp_dir_created() as dirname:
+        _write_and_run_parallel_script(dirname, ["false; touch a"])
+        assert not os.path.exists(os.path.join(dirname, "a"))
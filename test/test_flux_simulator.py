@@ -72,6 +72,42 @@ def test_write_flux_simulator_params_files_writes_correct_common_params():
             assert d["POLYA_SHAPE"] == "NaN"
 
 
+def test_write_flux_simulator_params_files_uses_shared_library():
+    with temp_dir_created() as dirname:
+        fs.write_flux_simulator_params_files(
+            TRANSCRIPT_GTF_FILE, GENOME_FASTA_DIR, NUM_MOLECULES, READ_LENGTH,
+            False, False, dirname, library_file="library.lib")
+
+        assert not os.path.exists(_get_expression_params_file(dirname))
+        d = _get_simulation_params_dict(dirname)
+        assert d["LIB_FILE_NAME"] == "library.lib"
+
+
+def test_write_flux_simulator_library_params_files_writes_library_params():
+    with temp_dir_created() as dirname:
+        fs.write_flux_simulator_library_params_files(
+            TRANSCRIPT_GTF_FILE, GENOME_FASTA_DIR, NUM_MOLECULES, dirname)
+
+        assert os.path.exists(_get_expression_params_file(dirname))
+        d = _get_params_dict(
+            os.path.join(dirname, fs.LIBRARY_PARAMS_FILE))
+        assert d["LIB_FILE_NAME"] == fs.LIBRARY_FILE
+        assert d["PRO_FILE_NAME"] == fs.EXPRESSION_PROFILE_FILE
+        assert "READ_LENGTH" not in d
+
+
+def test_write_flux_simulator_shard_params_file_sets_seed():
+    with temp_dir_created() as dirname:
+        fs.write_flux_simulator_shard_params_file(
+            TRANSCRIPT_GTF_FILE, GENOME_FASTA_DIR, NUM_MOLECULES, READ_LENGTH,
+            True, False, dirname, 23)
+
+        assert not os.path.exists(_get_expression_params_file(dirname))
+        d = _get_simulation_params_dict(dirname)
+        assert d["SEED"] == "23"
+        assert d["READ_NUMBER"] == fs.READ_NUMBER_PLACEHOLDER
+
+
 def test_write_flux_simulator_params_files_writes_simulation_params_file():
     with temp_dir_created() as dirname:
         _write_flux_simulator_params_files(dirname)
@@ -101,3 +137,9 @@ def test_write_flux_simulator_params_files_writes_correct_params_when_paired_end
         d = _get_simulation_params_dict(dirname)
         assert d["PAIRED_END"] == "YES"
         assert d["UNIQUE_IDS"] == "YES"
+
+
+def test_get_molecules_per_read_halves_molecules_for_paired_end_reads():
+    single_end = fs.get_molecules_per_read(False)
+    assert single_end > 0
+    assert fs.get_molecules_per_read(True) == single_end / 2
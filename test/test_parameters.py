@@ -263,3 +263,60 @@ def test_execute_for_param_sets_executes_for_correct_sets_of_parameters():
     assert set([params1[0], params2[1]]) in execute_record
     assert set([params1[1], params2[0]]) in execute_record
     assert set([params1[1], params2[1]]) in execute_record
+
+
+def test_validate_command_line_parameter_sets_omits_defaulted_param_if_param_values_not_supplied():
+    options = {
+        "--read-length": "10,20",
+    }
+
+    ignore_params = _get_ignore_params()
+    ignore_params.append(parameters.QUANT_METHOD)
+
+    param_vals = parameters.validate_command_line_parameter_sets(
+        None, options, ignore_params)
+    assert parameters.THREADS.name not in param_vals
+
+
+def test_get_file_name_omits_default_number_of_threads():
+    assert parameters.get_file_name(
+        read_depth=30, read_length=50, paired_end=True, bias=False,
+        threads=parameters.THREADS.default) == "30x_50b_pe_no_bias"
+    assert parameters.get_file_name(
+        read_depth=30, read_length=50, paired_end=True, bias=False,
+        threads=4) == "30x_50b_pe_no_bias_4t"
+
+
+def test_validate_command_line_parameter_sets_raises_exception_for_zero_threads():
+    options = {
+        "--read-length": "10,20",
+        "--threads": "0"
+    }
+
+    ignore_params = _get_ignore_params()
+    ignore_params.append(parameters.QUANT_METHOD)
+
+    with pytest.raises(schema.SchemaError):
+        parameters.validate_command_line_parameter_sets(
+            None, options, ignore_params)
+
+
+def test_validate_command_line_parameter_sets_accepts_bias_models():
+    options = {
+        "--bias": "False,True,gc,Positional"
+    }
+
+    ignore_params = _get_ignore_params()
+    ignore_params.remove(parameters.BIAS)
+    ignore_params += [parameters.QUANT_METHOD, parameters.READ_LENGTH]
+
+    param_vals = parameters.validate_command_line_parameter_sets(
+        None, options, ignore_params)
+    assert param_vals[parameters.BIAS.name] == \
+        set([False, True, "gc", "positional"])
+
+
+def test_bias_file_name_parts_are_distinct():
+    names = [parameters.BIAS.get_file_name_part(value)
+             for value in [False, True, "gc", "positional", "True"]]
+    assert names == ["no_bias", "bias", "gc_bias", "positional_bias", "bias"]
@@ -1,9 +1,15 @@
+import json
 import os
 import os.path
+import piquant.flux_simulator as fs
 import piquant.piquant as piq
 import piquant.piquant_options as po
 import piquant.quantifiers as quant
+import piquant.worker as worker
 import pytest
+import re
+import stat
+import subprocess
 import time
 import utils
 
@@ -12,8 +18,19 @@ def _get_test_options(output_dir):
     return {
         po.OUTPUT_DIRECTORY: output_dir,
         po.NO_CLEANUP: True,
+        po.METRICS_FILE: None,
+        po.SEED: None,
+        po.COMPRESS_READS: False,
+        po.NESTED_DEPTHS: False,
+        po.DERIVED_READS: False,
+        po.EXTEND_DEPTH: None,
+        po.SHARED_LIBRARY: False,
+        po.SIMULATION_SHARDS: 1,
+        po.AUTO_MOLECULES: False,
+        po.READ_SIMULATOR: "flux",
         po.PLOT_FORMAT: "pdf",
-        po.GROUPED_THRESHOLD: 3000
+        po.GROUPED_THRESHOLD: 3000,
+        po.ASSIGNMENT_PRECISION: False
     }
 
 
@@ -94,6 +111,326 @@ def test_prepare_read_simulation_creates_correct_files():
         _check_file_exists(reads_dir, "flux_simulator_simulation.par")
 
 
+def test_prepare_read_simulation_scans_and_counts_final_reads():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        params = _get_test_params()
+        piq._prepare_read_simulation(None, options, **params)
+
+        reads_dir = piq._get_parameters_dir(options, **params)
+        with open(os.path.join(reads_dir, "run_simulation.sh")) as f:
+            script = f.read()
+            assert "scan_reads.py --stats-file=reads_stats.json" in script
+            assert "count_transcript_reads.py" in script
+            assert "index_read_origins.py" in script
+            assert "wc -l" not in script
+
+
+class _ErrorRecorder:
+    def __init__(self):
+        self.errors = []
+
+    def error(self, message):
+        self.errors.append(message)
+
+
+def test_check_reads_created_reports_invalid_reads():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        params = _get_test_params()
+        params.update(errors=False)
+        reads_dir = piq._get_parameters_dir(options, **params)
+        os.mkdir(reads_dir)
+        reads_file = fs.get_reads_file(
+            False, paired_end=fs.LEFT_READS if params["paired_end"] else None,
+            compressed=options[po.COMPRESS_READS])
+        open(os.path.join(reads_dir, reads_file), "w").close()
+        with open(os.path.join(reads_dir, "reads_stats.json"), "w") as f:
+            json.dump({"valid": False, "errors": ["truncated"]}, f)
+
+        logger = _ErrorRecorder()
+        piq._check_reads_created(logger, options, **params)
+
+    assert len(logger.errors) == 1
+    assert logger.errors[0].endswith("has invalid reads: truncated")
+
+
+def test_prepare_read_simulation_subsamples_lower_nested_depths():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.NESTED_DEPTHS] = 100
+        params = _get_test_params()
+        piq._prepare_read_simulation(None, options, **params)
+
+        reads_dir = piq._get_parameters_dir(options, **params)
+        _check_file_exists(reads_dir, "run_simulation.sh")
+        assert not os.path.exists(
+            os.path.join(reads_dir, "flux_simulator_simulation.par"))
+
+        source_params = dict(params, read_depth=100)
+        with open(os.path.join(reads_dir, "run_simulation.sh")) as f:
+            script = f.read()
+            assert piq._get_parameters_dir(options, **source_params) \
+                in script
+            assert "count_transcript_reads.py" in script
+            assert "cp " + os.path.join(
+                piq._get_parameters_dir(options, **source_params),
+                "true_read_counts.csv") not in script
+
+
+def _get_script_seeds(reads_dir):
+    with open(os.path.join(reads_dir, "run_simulation.sh")) as f:
+        return re.findall(r"--seed=(\d+)", f.read())
+
+
+def test_prepare_read_simulation_subsamples_depths_with_distinct_seeds():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.NESTED_DEPTHS] = 100
+        options[po.SEED] = 1
+        seeds = []
+        for depth in [10, 30]:
+            params = dict(_get_test_params(), read_depth=depth)
+            piq._prepare_read_simulation(None, options, **params)
+            seeds += _get_script_seeds(
+                piq._get_parameters_dir(options, **params))
+
+        assert len(seeds) == 2
+        assert len(set(seeds + ["1"])) == 3
+
+
+def test_prepare_read_simulation_extends_reads_for_higher_depths():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.EXTEND_DEPTH] = 10
+        params = _get_test_params()
+        piq._prepare_read_simulation(None, options, **params)
+
+        reads_dir = piq._get_parameters_dir(options, **params)
+        source_dir = piq._get_parameters_dir(
+            options, **dict(params, read_depth=10))
+        with open(os.path.join(reads_dir, "run_simulation.sh")) as f:
+            script = f.read()
+            assert "scan_reads.py " + source_dir in script
+            assert "READS=$((READS - SOURCE_READS))" in script
+            assert "merge_reads.py --seed=" in script
+            assert "count_transcript_reads.py" in script
+            assert "--add-counts" not in script
+        with open(os.path.join(
+                reads_dir, "flux_simulator_simulation.par")) as f:
+            assert "SEED" in f.read()
+
+
+def test_prepare_read_simulation_does_not_extend_reads_for_lower_depths():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.EXTEND_DEPTH] = 100
+        params = _get_test_params()
+        piq._prepare_read_simulation(None, options, **params)
+
+        reads_dir = piq._get_parameters_dir(options, **params)
+        with open(os.path.join(reads_dir, "run_simulation.sh")) as f:
+            assert "merge_reads.py" not in f.read()
+
+
+def test_prepare_read_simulation_derives_single_end_biased_reads():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.DERIVED_READS] = {
+            "paired_end": set([False, True]), "errors": set([False]),
+            "bias": set([False, True])}
+        params = _get_test_params()
+        params.update(paired_end=False, errors=False, bias=True)
+        piq._prepare_read_simulation(None, options, **params)
+
+        reads_dir = piq._get_parameters_dir(options, **params)
+        assert not os.path.exists(
+            os.path.join(reads_dir, "flux_simulator_simulation.par"))
+
+        source_params = dict(params, paired_end=True, bias=False)
+        with open(os.path.join(reads_dir, "run_simulation.sh")) as f:
+            script = f.read()
+            assert piq._get_parameters_dir(options, **source_params) \
+                in script
+            assert "--left-mates" in script
+            assert "count_transcript_reads.py" in script
+
+
+def test_prepare_read_simulation_derives_reads_with_distinct_seeds():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.SEED] = 1
+        options[po.DERIVED_READS] = {
+            "paired_end": set([False, True]), "errors": set([False]),
+            "bias": set([False, True])}
+        seeds = []
+        for paired_end, bias in [(True, False), (False, False),
+                                 (True, True), (False, True)]:
+            params = dict(_get_test_params(), errors=False,
+                          paired_end=paired_end, bias=bias)
+            piq._prepare_read_simulation(None, options, **params)
+            seeds.append(_get_script_seeds(
+                piq._get_parameters_dir(options, **params))[0])
+
+        assert seeds[0] == "1"
+        assert len(set(seeds)) == 4
+
+
+def test_prepare_read_simulation_derives_gc_biased_reads():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.DERIVED_READS] = {
+            "paired_end": set([True]), "errors": set([False]),
+            "bias": set([False, True, "gc"])}
+        params = _get_test_params()
+        params.update(errors=False, bias="gc")
+        piq._prepare_read_simulation(None, options, **params)
+
+        reads_dir = piq._get_parameters_dir(options, **params)
+        assert reads_dir.endswith("gc_bias")
+
+        source_params = dict(params, bias=False)
+        with open(os.path.join(reads_dir, "run_simulation.sh")) as f:
+            script = f.read()
+            assert piq._get_parameters_dir(options, **source_params) \
+                in script
+            assert "--bias-model=gc" in script
+
+
+def test_prepare_read_simulation_derives_reads_with_errors():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.DERIVED_READS] = {
+            "paired_end": set([True]), "errors": set([False, True]),
+            "bias": set([False])}
+        params = _get_test_params()
+        params.update(errors=True)
+        piq._prepare_read_simulation(None, options, **params)
+
+        reads_dir = piq._get_parameters_dir(options, **params)
+        assert not os.path.exists(
+            os.path.join(reads_dir, "flux_simulator_simulation.par"))
+
+        source_params = dict(params, errors=False)
+        with open(os.path.join(reads_dir, "run_simulation.sh")) as f:
+            script = f.read()
+            assert piq._get_parameters_dir(options, **source_params) \
+                in script
+            assert "inject_read_errors.py" in script
+
+
+def test_prepare_read_simulation_simulates_pool_for_derived_reads():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.DERIVED_READS] = {
+            "paired_end": set([False, True]), "errors": set([False]),
+            "bias": set([False, True])}
+        params = _get_test_params()
+        params.update(errors=False)
+        piq._prepare_read_simulation(None, options, **params)
+
+        reads_dir = piq._get_parameters_dir(options, **params)
+        _check_file_exists(reads_dir, "flux_simulator_simulation.par")
+        with open(os.path.join(reads_dir, "run_simulation.sh")) as f:
+            assert "4*$READS" in f.read()
+
+
+def test_prepare_read_simulation_shares_fragment_library():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.SHARED_LIBRARY] = True
+        params = _get_test_params()
+        params.update(transcript_gtf="transcripts.gtf", genome_fasta="genome",
+                      num_molecules=1000)
+        piq._prepare_read_simulation(None, options, **params)
+        single_end_params = dict(params, paired_end=False)
+        piq._prepare_read_simulation(None, options, **single_end_params)
+
+        library_dirs = [d for d in os.listdir(dir_path)
+                        if d.startswith("flux_library")]
+        assert len(library_dirs) == 1
+        _check_file_exists(
+            os.path.join(dir_path, library_dirs[0]), "run_library.sh")
+
+        for p in [params, single_end_params]:
+            reads_dir = piq._get_parameters_dir(options, **p)
+            with open(os.path.join(reads_dir, "run_simulation.sh")) as f:
+                assert library_dirs[0] in f.read()
+
+
+def test_prepare_read_simulation_writes_params_for_simulation_shards():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.SIMULATION_SHARDS] = 3
+        params = _get_test_params()
+        piq._prepare_read_simulation(None, options, **params)
+
+        reads_dir = piq._get_parameters_dir(options, **params)
+        for shard in ["shard1", "shard2", "shard3"]:
+            _check_file_exists(
+                os.path.join(reads_dir, shard), "flux_simulator_simulation.par")
+        with open(os.path.join(reads_dir, "run_simulation.sh")) as f:
+            assert "SHARD_READS" in f.read()
+
+
+def test_prepare_read_simulation_scores_biased_reads_with_shard_processes():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.SIMULATION_SHARDS] = 3
+        params = dict(_get_test_params(), bias=True)
+        piq._prepare_read_simulation(None, options, **params)
+
+        reads_dir = piq._get_parameters_dir(options, **params)
+        with open(os.path.join(reads_dir, "run_simulation.sh")) as f:
+            assert "--processes=3 " in f.read()
+
+
+def test_prepare_read_simulation_sizes_molecules_from_reads():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.AUTO_MOLECULES] = True
+        params = _get_test_params()
+        piq._prepare_read_simulation(None, options, **params)
+
+        reads_dir = piq._get_parameters_dir(options, **params)
+        with open(os.path.join(reads_dir, "run_simulation.sh")) as f:
+            script = f.read()
+            assert "MOLECULES=$(echo \"($READS * " in script
+            assert "CREATED_READS=${CREATED_READS:-0}" in script
+
+
+def test_prepare_read_simulation_uses_numpy_read_simulator():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.READ_SIMULATOR] = "numpy"
+        params = _get_test_params()
+        params.update(transcript_gtf="transcripts.gtf", genome_fasta="genome")
+        piq._prepare_read_simulation(None, options, **params)
+
+        reads_dir = piq._get_parameters_dir(options, **params)
+        with open(os.path.join(reads_dir, "run_simulation.sh")) as f:
+            script = f.read()
+            assert "simulate_reads.py" in script
+            assert "-t simulator -l -s" not in script
+
+
+def test_prepare_read_simulation_simulates_bias_with_numpy_read_simulator():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.READ_SIMULATOR] = "numpy"
+        params = _get_test_params()
+        params.update(transcript_gtf="transcripts.gtf", genome_fasta="genome",
+                      bias=True)
+        piq._prepare_read_simulation(None, options, **params)
+
+        reads_dir = piq._get_parameters_dir(options, **params)
+        with open(os.path.join(reads_dir, "run_simulation.sh")) as f:
+            script = f.read()
+            assert "simulate_reads.py" in script
+            assert script.count("--bias-pwm") == 1
+            assert "2*$READS" not in script
+
+
 def test_create_reads_executes_run_simulation_script():
     with utils.temp_dir_created() as dir_path:
         options = _get_test_options(dir_path)
@@ -120,3 +457,84 @@ def test_prepare_quantification_creates_correct_file():
 
         quant_dir = piq._get_parameters_dir(options, **params)
         _check_file_exists(quant_dir, "run_quantification.sh")
+
+
+def test_prepare_quantification_prequantifies_in_fresh_output_directory():
+    with utils.temp_dir_created() as dir_path:
+        transcript_gtf = os.path.join(dir_path, "transcripts.gtf")
+        with open(transcript_gtf, "w") as f:
+            f.write("1\tsrc\texon\t1\t100\t.\t+\t.\t" +
+                    "gene_id \"G1\"; transcript_id \"T1\";\n")
+
+        # The transcript reference is not actually prepared
+        bin_dir = os.path.join(dir_path, "bin")
+        os.mkdir(bin_dir)
+        prepare_reference = os.path.join(bin_dir, "rsem-prepare-reference")
+        with open(prepare_reference, "w") as f:
+            f.write("#!/bin/sh\n")
+        os.chmod(prepare_reference, stat.S_IRWXU)
+
+        options = _get_test_options(dir_path)
+        params = _get_test_params(quant_method=quant._RSEM())
+        params.update(transcript_gtf=transcript_gtf, genome_fasta=dir_path)
+        piq._prepare_quantification(None, options, **params)
+
+        # Unique sequence lengths are calculated with an API of the pinned
+        # version of pandas; the output of the transcript counts script is
+        # redirected in its place, to the same directory
+        quant_dir = piq._get_parameters_dir(options, **params)
+        script_file = os.path.join(quant_dir, "run_quantification.sh")
+        with open(script_file) as f:
+            script = f.read()
+        with open(script_file, "w") as f:
+            f.write(script.replace("calculate_unique_transcript_sequence.py",
+                                   "count_transcripts_for_genes.py"))
+
+        env = dict(os.environ)
+        env["PATH"] = bin_dir + os.pathsep + env["PATH"]
+        env.pop(worker.SOCKET_VARIABLE, None)
+        with open(os.devnull, "w") as null:
+            assert subprocess.call(
+                ["bash", "run_quantification.sh", "-p"], cwd=quant_dir,
+                env=env, stdout=null, stderr=null) == 0
+
+        quantifier_dir = os.path.join(dir_path, "quantifier_scratch")
+        _check_file_exists(quantifier_dir, "transcript_counts.csv")
+        _check_file_exists(quantifier_dir, "unique_sequence.csv")
+
+
+def _get_quantification_script(options, quant_method):
+    params = _get_test_params(quant_method=quant_method)
+    piq._prepare_quantification(None, options, **params)
+
+    quant_dir = piq._get_parameters_dir(options, **params)
+    with open(os.path.join(quant_dir, "run_quantification.sh")) as f:
+        return f.read()
+
+
+def test_prepare_quantification_counts_sampled_read_assignments():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.ASSIGNMENT_PRECISION] = True
+        script = _get_quantification_script(options, quant._RSEM())
+        assert "--sampling-for-bam" in script
+        assert "count_read_assignments.py --sampled-tag=ZW" in script
+        assert "Count the reads RSEM assigned" in script
+        assert "--read-assignments=read_assignments.csv" in script
+
+
+def test_prepare_quantification_counts_read_assignments_only_if_requested():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        script = _get_quantification_script(options, quant._Express())
+        assert "--output-align-samp" not in script
+        assert "count_read_assignments.py" not in script
+
+
+def test_prepare_quantification_does_not_count_salmon_read_assignments():
+    with utils.temp_dir_created() as dir_path:
+        options = _get_test_options(dir_path)
+        options[po.ASSIGNMENT_PRECISION] = True
+        script = _get_quantification_script(options, quant._Salmon())
+        assert "--writeMappings" not in script
+        assert "count_read_assignments.py" not in script
@@ -0,0 +1,42 @@
+import numpy as np
+import os.path
+import piquant.pwm as pwm
+import pytest
+import utils
+
+WEIGHTS = ["0.1,0.4,0.0", "0.2,0.3,0.5", "0.3,0.2,0.25", "0.4,0.1,0.25"]
+
+
+def _get_pwm():
+    with utils.temp_dir_created() as dirname:
+        pwm_file = os.path.join(dirname, "test.pwm")
+        with open(pwm_file, "w") as f:
+            f.write("\n".join(WEIGHTS) + "\n")
+        return pwm.PWM(pwm_file)
+
+
+def test_score_batch_matches_score():
+    bias_pwm = _get_pwm()
+    sequences = ["ACG", "tgca", "NNN", "cg", "", "GTacgt", "aAc"]
+    batch_scores = bias_pwm.score_batch(sequences)
+    for sequence, batch_score in zip(sequences, batch_scores):
+        assert batch_score == pytest.approx(bias_pwm.score(sequence))
+
+
+def test_score_batch_raises_error_for_invalid_characters():
+    with pytest.raises(ValueError):
+        _get_pwm().score_batch(["ACX"])
+
+
+def test_score_bases_pads_short_sequences():
+    bias_pwm = _get_pwm()
+    bases = np.frombuffer("TGCGT", dtype=np.uint8).reshape(1, 5)
+    assert bias_pwm.score_bases(bases[:, :2])[0] == \
+        pytest.approx(bias_pwm.score("TG"))
+    assert bias_pwm.score_bases(bases)[0] == \
+        pytest.approx(bias_pwm.score("TGC"))
+
+
+def test_max_score_is_highest_score():
+    bias_pwm = _get_pwm()
+    assert bias_pwm.max_score() == pytest.approx(bias_pwm.score("TAC"))
@@ -0,0 +1,142 @@
+import os
+import os.path
+import piquant.bias_models as bm
+import piquant.pwm as pwm
+import piquant.read_simulator as rs
+import utils
+
+GENOME = "ACGTTGCAAC" * 20 + "GGATCCTTAG" * 20
+PLUS_EXONS = [(11, 60), (101, 150)]
+MINUS_EXONS = [(201, 260), (301, 340)]
+
+
+def _reverse_complement(sequence):
+    complement = {"A": "T", "C": "G", "G": "C", "T": "A"}
+    return "".join([complement[b] for b in reversed(sequence)])
+
+
+def _write_test_files(dirname):
+    os.mkdir(os.path.join(dirname, "genome"))
+    with open(os.path.join(dirname, "genome", "1.fa"), "w") as f:
+        f.write(">1\n" + GENOME + "\n")
+
+    gtf_file = os.path.join(dirname, "transcripts.gtf")
+    with open(gtf_file, "w") as f:
+        for transcript, strand, exons in [("T1", "+", PLUS_EXONS),
+                                          ("T2", "-", MINUS_EXONS)]:
+            for start, end in exons:
+                f.write("\t".join([
+                    "1", "test", "exon", str(start), str(end), ".", strand,
+                    ".", "gene_id \"G{t}\"; transcript_id \"{t}\"".format(
+                        t=transcript)]) + "\n")
+
+    pro_file = os.path.join(dirname, "transcripts.pro")
+    with open(pro_file, "w") as f:
+        f.write("1:11-150W\tT1\tCDS\t100\t0.5\t10\t0\t0\n")
+        f.write("1:201-340C\tT2\tCDS\t100\t0.5\t10\t0\t0\n")
+        f.write("1:11-60W\tT3\tNC\t50\t0.0\t0\t0\t0\n")
+
+    return pro_file, gtf_file, os.path.join(dirname, "genome")
+
+
+def _get_transcriptome():
+    with utils.temp_dir_created() as dirname:
+        return rs.read_transcriptome(*_write_test_files(dirname))
+
+
+def _get_records(reads, lines_per_read):
+    lines = reads.split("\n")[:-1]
+    return [lines[i:i + lines_per_read]
+            for i in range(0, len(lines), lines_per_read)]
+
+
+def test_read_transcriptome_returns_expressed_transcript_sequences():
+    transcriptome = _get_transcriptome()
+    assert transcriptome.ids == ["T1", "T2"]
+
+    plus_seq = "".join([GENOME[s - 1:e] for s, e in PLUS_EXONS])
+    minus_seq = _reverse_complement(
+        "".join([GENOME[s - 1:e] for s, e in MINUS_EXONS]))
+    assert transcriptome.bases.tostring() == plus_seq + minus_seq
+    assert list(transcriptome.lengths) == [100, 100]
+
+
+def test_get_chunk_sizes_returns_correct_sizes():
+    assert rs.get_chunk_sizes(10, 4) == [4, 4, 2]
+    assert rs.get_chunk_sizes(8, 4) == [4, 4]
+
+
+def test_simulate_chunk_returns_reads_matching_genome_locations():
+    transcriptome = _get_transcriptome()
+    reads, bed = rs.simulate_chunk(transcriptome, 0, 100, 1, 20, seed=1)
+
+    records = _get_records(reads, 2)
+    bed_records = [line.split("\t") for line in bed.split("\n")[:-1]]
+    assert len(records) == len(bed_records) == 100
+
+    for (name, sequence), bed_record in zip(records, bed_records):
+        assert name[1:] == bed_record[3]
+        start, end = int(bed_record[1]), int(bed_record[2])
+        if end - start == 20:
+            genomic = GENOME[start:end]
+            if bed_record[5] == "-":
+                genomic = _reverse_complement(genomic)
+            assert sequence == genomic
+
+
+def test_simulate_chunk_returns_paired_end_reads_with_errors():
+    transcriptome = _get_transcriptome()
+    reads, bed = rs.simulate_chunk(
+        transcriptome, 0, 50, 1, 20, paired_end=True, errors=True)
+
+    records = _get_records(reads, 4)
+    assert len(records) == len(bed.split("\n")[:-1]) == 100
+    for left, right in zip(records[::2], records[1::2]):
+        assert left[0].endswith("/1") and right[0].endswith("/2")
+        assert left[0][:-2] == right[0][:-2]
+        assert len(left[1]) == len(left[3]) == 20
+
+
+def test_simulate_chunk_is_reproducible_for_seed_and_chunk():
+    transcriptome = _get_transcriptome()
+    first = rs.simulate_chunk(transcriptome, 2, 50, 1, 20, seed=3)
+    assert rs.simulate_chunk(transcriptome, 2, 50, 1, 20, seed=3) == first
+    assert rs.simulate_chunk(transcriptome, 3, 50, 1, 20, seed=3) != first
+
+
+def test_simulate_chunk_biases_fragments_by_pwm():
+    transcriptome = _get_transcriptome()
+    with utils.temp_dir_created() as dirname:
+        pwm_file = os.path.join(dirname, "test.pwm")
+        with open(pwm_file, "w") as f:
+            f.write("0.85\n0.05\n0.05\n0.05\n")
+        bias_pwm = pwm.PWM(pwm_file)
+
+    def _get_fraction_starting_with_a(reads):
+        sequences = [r[1] for r in _get_records(reads, 2)]
+        return sum([s.startswith("A") for s in sequences]) / \
+            float(len(sequences))
+
+    unbiased, _ = rs.simulate_chunk(transcriptome, 0, 1000, 1, 20, seed=1)
+    biased, bed = rs.simulate_chunk(
+        transcriptome, 0, 1000, 1, 20, seed=1,
+        bias_model=bm.PWMBias(bias_pwm))
+    assert len(_get_records(biased, 2)) == len(bed.split("\n")[:-1]) == 1000
+    assert _get_fraction_starting_with_a(biased) > \
+        _get_fraction_starting_with_a(unbiased) + 0.2
+
+
+def test_simulate_chunk_biases_fragments_by_position():
+    transcriptome = _get_transcriptome()
+
+    def _get_mean_position(reads):
+        fields = [r[0].split(":") for r in _get_records(reads, 2)]
+        return sum([(int(f[-3]) + int(f[-2])) / 2.0 / int(f[-4])
+                    for f in fields]) / len(fields)
+
+    unbiased, _ = rs.simulate_chunk(
+        transcriptome, 0, 1000, 1, 20, fragment_length=30, seed=1)
+    biased, _ = rs.simulate_chunk(
+        transcriptome, 0, 1000, 1, 20, fragment_length=30, seed=1,
+        bias_model=bm.PositionalBias(decay=5.0))
+    assert _get_mean_position(biased) > _get_mean_position(unbiased) + 0.1
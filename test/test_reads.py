@@ -0,0 +1,502 @@
+import gzip
+import numpy as np
+import os
+import os.path
+import piquant.reads as reads
+import pytest
+import StringIO
+import utils
+
+
+def _get_fragments(num_fragments, lines_per_fragment):
+    return ["".join(["f{f}l{l}\n".format(f=f, l=l)
+                     for l in range(lines_per_fragment)])
+            for f in range(num_fragments)]
+
+
+def _write_reads_file(dirname, fragments):
+    reads_file = os.path.join(dirname, "reads.fasta")
+    with open(reads_file, "w") as f:
+        f.write("".join(fragments))
+    return reads_file
+
+
+def _read_reads_file(reads_file, lines_per_fragment):
+    with open(reads_file) as f:
+        return list(reads.read_fragments(f, lines_per_fragment))
+
+
+def test_get_lines_per_fragment_returns_correct_values():
+    assert reads.get_lines_per_fragment(False, False) == 2
+    assert reads.get_lines_per_fragment(True, False) == 4
+    assert reads.get_lines_per_fragment(False, True) == 4
+    assert reads.get_lines_per_fragment(True, True) == 8
+
+
+def test_read_fragments_yields_fragments():
+    fragments = _get_fragments(3, 4)
+    f = StringIO.StringIO("".join(fragments))
+    assert list(reads.read_fragments(f, 4)) == fragments
+
+
+def test_read_fragments_raises_error_for_incomplete_fragment():
+    f = StringIO.StringIO("".join(_get_fragments(2, 4)) + "a\n")
+    with pytest.raises(ValueError):
+        list(reads.read_fragments(f, 4))
+
+
+def test_shuffle_fragments_keeps_fragments_together():
+    fragments = _get_fragments(100, 4)
+    with utils.temp_dir_created() as dirname:
+        reads_file = _write_reads_file(dirname, fragments)
+        reads.shuffle_fragments(reads_file, reads_file, 4, seed=1)
+        shuffled = _read_reads_file(reads_file, 4)
+    assert shuffled != fragments
+    assert sorted(shuffled) == sorted(fragments)
+
+
+def test_shuffle_fragments_is_reproducible_with_seed():
+    fragments = _get_fragments(100, 2)
+    with utils.temp_dir_created() as dirname:
+        reads_file = _write_reads_file(dirname, fragments)
+        out_files = [os.path.join(dirname, "out" + str(i)) for i in range(2)]
+        for out_file in out_files:
+            reads.shuffle_fragments(reads_file, out_file, 2, seed=7)
+        outputs = [_read_reads_file(f, 2) for f in out_files]
+    assert outputs[0] == outputs[1]
+
+
+def test_shuffle_fragments_spills_to_temporary_files_when_memory_limited():
+    fragments = _get_fragments(1000, 2)
+    with utils.temp_dir_created() as dirname:
+        reads_file = _write_reads_file(dirname, fragments)
+        reads.shuffle_fragments(
+            reads_file, reads_file, 2, seed=3, buffer_size=1024)
+        shuffled = _read_reads_file(reads_file, 2)
+        assert os.listdir(dirname) == ["reads.fasta"]
+    assert shuffled != fragments
+    assert sorted(shuffled) == sorted(fragments)
+
+
+def test_split_fragment_returns_left_and_right_reads():
+    fragment = ">r/1\nAC\n>r/2\nGT\n"
+    assert reads.split_fragment(fragment) == (">r/1\nAC\n", ">r/2\nGT\n")
+
+
+def test_split_fragment_reorders_right_read_first():
+    fragment = "@r/2\nGT\n+\nII\n@r/1\nAC\n+\nII\n"
+    assert reads.split_fragment(fragment) == \
+        ("@r/1\nAC\n+\nII\n", "@r/2\nGT\n+\nII\n")
+
+
+def test_fragment_shuffler_yields_permutation_of_added_fragments():
+    fragments = _get_fragments(50, 2)
+    shuffler = reads.FragmentShuffler(2, num_buckets=3, seed=1)
+    try:
+        for fragment in fragments:
+            shuffler.add(fragment)
+        shuffled = list(shuffler.shuffled())
+    finally:
+        shuffler.close()
+    assert shuffled != fragments
+    assert sorted(shuffled) == sorted(fragments)
+
+
+def test_writing_reads_file_writes_uncompressed_file():
+    with utils.temp_dir_created() as dirname:
+        reads_file = os.path.join(dirname, "reads.fasta")
+        with reads.writing_reads_file(reads_file) as f:
+            f.write(">r\nAC\n")
+        with open(reads_file) as f:
+            assert f.read() == ">r\nAC\n"
+
+
+def test_writing_reads_file_writes_compressed_file():
+    with utils.temp_dir_created() as dirname:
+        reads_file = os.path.join(dirname, "reads.fasta.gz")
+        with reads.writing_reads_file(reads_file) as f:
+            f.write(">r\nAC\n")
+        with gzip.open(reads_file) as f:
+            assert f.read() == ">r\nAC\n"
+
+
+def test_count_fragments_returns_number_of_fragments():
+    with utils.temp_dir_created() as dirname:
+        reads_file = _write_reads_file(dirname, _get_fragments(7, 4))
+        assert reads.count_fragments(reads_file, 4) == 7
+
+
+def test_subsample_fragments_selects_corresponding_paired_reads():
+    with utils.temp_dir_created() as dirname:
+        in_files = [os.path.join(dirname, end + ".fasta")
+                    for end in ["l", "r"]]
+        out_files = [os.path.join(dirname, end + ".out.fasta")
+                     for end in ["l", "r"]]
+        for in_file, end in zip(in_files, ["1", "2"]):
+            with open(in_file, "w") as f:
+                for i in range(100):
+                    f.write(">r{i}/{e}\nAC\n".format(i=i, e=end))
+
+        reads.subsample_fragments(in_files, out_files, 30, seed=1)
+
+        left, right = [_read_reads_file(f, 2) for f in out_files]
+    assert len(left) == 30
+    assert [r.replace("/1", "") for r in left] == \
+        [r.replace("/2", "") for r in right]
+
+
+def test_subsample_fragments_raises_error_for_too_few_fragments():
+    with utils.temp_dir_created() as dirname:
+        reads_file = _write_reads_file(dirname, _get_fragments(5, 2))
+        with pytest.raises(ValueError):
+            reads.subsample_fragments(
+                [reads_file], [reads_file + ".out"], 6)
+
+
+def test_merge_fragments_preserves_order_of_each_set_of_reads():
+    with utils.temp_dir_created() as dirname:
+        files = {}
+        for name, prefix, num_reads in [("a", "r", 20), ("b", "x", 10)]:
+            files[name] = [os.path.join(dirname, name + end + ".fasta")
+                           for end in ["l", "r"]]
+            for reads_file, end in zip(files[name], ["1", "2"]):
+                with open(reads_file, "w") as f:
+                    for i in range(num_reads):
+                        f.write(">{p}{i}/{e}\nAC\n".format(
+                            p=prefix, i=i, e=end))
+        out_files = [os.path.join(dirname, end + ".out.fasta")
+                     for end in ["l", "r"]]
+
+        reads.merge_fragments(files["a"], files["b"], out_files, seed=1)
+
+        left, right = [_read_reads_file(f, 2) for f in out_files]
+    assert len(left) == 30
+    assert [r.replace("/1", "") for r in left] == \
+        [r.replace("/2", "") for r in right]
+    assert [r for r in left if r.startswith(">r")] == \
+        [">r{i}/1\nAC\n".format(i=i) for i in range(20)]
+    assert [r for r in left if r.startswith(">x")] == \
+        [">x{i}/1\nAC\n".format(i=i) for i in range(10)]
+
+
+def test_add_substitution_errors_changes_only_erroneous_bases():
+    rng = np.random.RandomState(1)
+    original = np.frombuffer("ACGTN" * 2000, dtype=np.uint8).reshape(100, 100)
+    with_errors = original.copy()
+    qualities = reads.add_substitution_errors(with_errors, rng)
+
+    assert len(qualities) == 100
+    assert qualities[0] > qualities[-1]
+    changed = with_errors != original
+    assert 0 < changed.sum() < 0.05 * changed.size
+    assert not changed[original == ord("N")].any()
+
+
+def test_inject_errors_writes_fastq_preserving_read_names():
+    with utils.temp_dir_created() as dirname:
+        reads_file = os.path.join(dirname, "reads.fasta")
+        with open(reads_file, "w") as f:
+            for i in range(25):
+                f.write(">r{i}/1\n{s}\n".format(i=i, s="ACGT" * (5 + i % 2)))
+        out_file = os.path.join(dirname, "reads.fastq")
+
+        reads.inject_errors(reads_file, out_file, seed=1, batch_size=10)
+        records = _read_reads_file(out_file, 4)
+
+    assert len(records) == 25
+    for i, record in enumerate(records):
+        name, sequence, _, qualities = record.split("\n")[:4]
+        assert name == "@r{i}/1".format(i=i)
+        assert len(sequence) == len(qualities) == 20 + 4 * (i % 2)
+
+
+def test_index_fragments_returns_fragment_offsets():
+    fragments = _get_fragments(5, 4)
+    with utils.temp_dir_created() as dirname:
+        reads_file = _write_reads_file(dirname, fragments)
+        index = reads.index_fragments(reads_file, 4)
+    assert list(index) == [sum(len(f) for f in fragments[:i])
+                           for i in range(6)]
+
+
+def test_index_fragments_raises_error_for_incomplete_fragment():
+    with utils.temp_dir_created() as dirname:
+        reads_file = _write_reads_file(
+            dirname, _get_fragments(3, 4) + ["a\n"])
+        with pytest.raises(ValueError):
+            reads.index_fragments(reads_file, 4)
+
+
+def test_get_fragment_index_writes_and_reads_sidecar_file():
+    with utils.temp_dir_created() as dirname:
+        reads_file = _write_reads_file(dirname, _get_fragments(6, 2))
+        index = reads.get_fragment_index(reads_file, 2)
+        assert os.path.exists(reads_file + ".fidx")
+        assert list(reads.get_fragment_index(reads_file, 2)) == list(index)
+        assert len(reads.get_fragment_index(reads_file, 4)) == 4
+
+
+def test_copy_fragments_writes_selected_fragments():
+    fragments = _get_fragments(10, 2)
+    selected = [7, 0, 1, 2, 5]
+    with utils.temp_dir_created() as dirname:
+        reads_file = _write_reads_file(dirname, fragments)
+        index = reads.get_fragment_index(reads_file, 2)
+        out_f = StringIO.StringIO()
+        reads.copy_fragments(reads_file, index, selected, out_f)
+    assert out_f.getvalue() == "".join([fragments[i] for i in selected])
+
+
+def test_top_scoring_fragments_retains_highest_scoring_fragments():
+    rng = np.random.RandomState(1)
+    scores = rng.random_sample(1000)
+    top_scoring = reads.TopScoringFragments(10)
+    for start in range(0, 1000, 7):
+        top_scoring.add(np.arange(start, min(start + 7, 1000)),
+                        scores[start:start + 7])
+
+    assert top_scoring.num_fragments == 1000
+    assert len(top_scoring.numbers) <= 20
+    assert list(top_scoring.selected()) == \
+        sorted(np.argsort(scores)[-10:])
+
+
+def test_top_scoring_fragments_merges_candidates():
+    scores = np.arange(20, dtype=np.float64) % 7
+    first, second = [reads.TopScoringFragments(3) for i in range(2)]
+    first.add(np.arange(10), scores[:10])
+    second.add(np.arange(10, 20), scores[10:])
+    first.merge(second)
+
+    assert first.num_fragments == 20
+    assert sorted(scores[first.selected()]) == [5, 6, 6]
+
+
+def test_top_scoring_fragments_selects_no_fragments():
+    top_scoring = reads.TopScoringFragments(0)
+    top_scoring.add(np.arange(5), np.ones(5))
+    assert top_scoring.num_fragments == 5
+    assert len(top_scoring.selected()) == 0
+
+
+def test_score_fragments_selection_does_not_depend_on_processes():
+    chunk_size, batch_size = reads._SCORE_CHUNK_SIZE, reads._SCORE_BATCH_SIZE
+    reads._SCORE_CHUNK_SIZE, reads._SCORE_BATCH_SIZE = 7, 3
+    fragments = _get_fragments(50, 2)
+    try:
+        with utils.temp_dir_created() as dirname:
+            reads_file = _write_reads_file(dirname, fragments)
+            index = reads.index_fragments(reads_file, 2)
+            selections = [
+                reads.score_fragments(
+                    reads_file, index, 10, 2, 1, seed=3,
+                    processes=processes).selected()
+                for processes in [1, 3]]
+    finally:
+        reads._SCORE_CHUNK_SIZE, reads._SCORE_BATCH_SIZE = \
+            chunk_size, batch_size
+
+    assert len(selections[0]) == 10
+    assert list(selections[0]) == list(selections[1])
+
+
+def test_score_fragments_scores_every_fragment():
+    fragments = _get_fragments(20, 2)
+    with utils.temp_dir_created() as dirname:
+        reads_file = _write_reads_file(dirname, fragments)
+        top_scoring = reads.score_fragments(
+            reads_file, reads.index_fragments(reads_file, 2), 20, 2, 1,
+            weighted_sampling=True)
+
+    assert top_scoring.num_fragments == 20
+    assert list(top_scoring.selected()) == range(20)
+
+
+def _write_fastq_file(dirname, name, records):
+    reads_file = os.path.join(dirname, name)
+    with open(reads_file, "w") as f:
+        for read_name, sequence in records:
+            f.write("@{n}\n{s}\n+\n{q}\n".format(
+                n=read_name, s=sequence, q="I" * len(sequence)))
+    return reads_file
+
+
+def test_scan_reads_gathers_statistics_of_valid_reads():
+    with utils.temp_dir_created() as dirname:
+        reads_file = _write_fastq_file(
+            dirname, "reads.fastq",
+            [("r1", "ACGG"), ("r2", "GGCCNT"), ("r3", "TTTT")])
+        stats = reads.scan_reads([reads_file])
+
+    assert stats["valid"]
+    assert stats["errors"] == []
+    assert stats["num_reads"] == stats["num_fragments"] == 3
+    assert stats["files"] == {"reads.fastq": 3}
+    assert stats["read_lengths"] == {"4": 2, "6": 1}
+    assert stats["base_composition"]["T"] == 5.0 / 14
+    assert stats["base_composition"]["N"] == 1.0 / 14
+    assert stats["gc_content"] == 7.0 / 14
+
+
+def test_scan_reads_detects_truncated_record():
+    with utils.temp_dir_created() as dirname:
+        reads_file = _write_fastq_file(
+            dirname, "reads.fastq", [("r1", "ACGT"), ("r2", "ACGT")])
+        with open(reads_file, "r+") as f:
+            f.truncate(os.path.getsize(reads_file) - 3)
+        stats = reads.scan_reads([reads_file])
+
+    assert not stats["valid"]
+    assert stats["num_reads"] == 1
+    assert stats["errors"] == ["reads.fastq ends with an incomplete record"]
+
+
+def test_scan_reads_detects_malformed_records():
+    with utils.temp_dir_created() as dirname:
+        reads_file = os.path.join(dirname, "reads.fastq")
+        with open(reads_file, "w") as f:
+            f.write("@r1\nACGT\n+\nIII\n>r2\nACGT\n+\nIIII\n")
+        stats = reads.scan_reads([reads_file])
+
+    assert not stats["valid"]
+    assert stats["errors"] == ["reads.fastq contains 2 malformed records"]
+
+
+def test_scan_reads_matches_names_of_mates():
+    with utils.temp_dir_created() as dirname:
+        left_file = _write_fastq_file(
+            dirname, "reads.1.fastq",
+            [("f{i}/1".format(i=i), "ACGT") for i in range(10)])
+        right_file = _write_fastq_file(
+            dirname, "reads.2.fastq",
+            [("f{i}/2".format(i=i), "ACGT") for i in range(10)])
+        stats = reads.scan_reads([left_file, right_file])
+
+    assert stats["valid"]
+    assert stats["paired_end"]
+    assert stats["num_reads"] == 20
+    assert stats["num_fragments"] == 10
+
+
+def test_scan_reads_detects_mates_out_of_step():
+    with utils.temp_dir_created() as dirname:
+        left_file = _write_fastq_file(
+            dirname, "reads.1.fastq",
+            [("f{i}/1".format(i=i), "ACGT") for i in range(1, 10)])
+        right_file = _write_fastq_file(
+            dirname, "reads.2.fastq",
+            [("f{i}/2".format(i=i), "ACGT") for i in range(10)])
+        stats = reads.scan_reads([left_file, right_file])
+
+    assert not stats["valid"]
+    assert stats["errors"] == [
+        "9 pairs of left and right reads are misnamed",
+        "Left and right reads files contain 9 and 10 reads"]
+
+
+def test_scan_reads_checks_interleaved_mates():
+    with utils.temp_dir_created() as dirname:
+        reads_file = _write_reads_file(
+            dirname, [">f1/1\nACGT\n>f1/2\nACGT\n>f2/1\nACGT\n>f3/2\nACGT\n"])
+        stats = reads.scan_reads([reads_file], paired_end=True)
+
+    assert not stats["valid"]
+    assert stats["num_fragments"] == 2
+    assert stats["errors"] == [
+        "reads.fasta contains 1 fragments whose mates are misnamed"]
+
+
+def _write_simulated_reads_file(dirname, transcripts):
+    reads_file = os.path.join(dirname, "reads.fasta")
+    with open(reads_file, "w") as f:
+        for i, transcript in enumerate(transcripts):
+            f.write(">1:100-1200W:{t}:{i}:902:1:300:S/1\nACGT\n".format(
+                t=transcript, i=i + 1))
+    return reads_file
+
+
+def _write_sam_file(dirname, alignments, tags=None):
+    sam_file = os.path.join(dirname, "alignments.sam")
+    with open(sam_file, "w") as f:
+        f.write("@HD\tVN:1.0\n")
+        for (transcript, i, flag, target), tag in zip(
+                alignments, tags or [""] * len(alignments)):
+            f.write(("1:100-1200W:{t}:{i}:902:1:300:S\t{f}\t{r}\t1\t255\t" +
+                     "4M\t*\t0\t0\tACGT\tIIII{g}\n").format(
+                t=transcript, i=i, f=flag, r=target, g=tag))
+    return sam_file
+
+
+def test_index_read_origins_records_transcript_of_each_read():
+    with utils.temp_dir_created() as dirname:
+        reads_file = _write_simulated_reads_file(
+            dirname, ["T2", "T10", "T1", "T2"])
+        origins_file = os.path.join(dirname, "origins.npz")
+        reads.index_read_origins(
+            reads_file, ["T1", "T2", "T3", "T10"]).save(origins_file)
+        read_origins = reads.load_read_origins(origins_file)
+
+    assert read_origins.origins.dtype == np.int32
+    assert list(read_origins.origins) == [1, 3, 0, 1]
+
+
+def test_read_origins_counts_reads_from_each_transcript():
+    with utils.temp_dir_created() as dirname:
+        reads_file = _write_simulated_reads_file(
+            dirname, ["T2", "T10", "T2", "T1", "T2", "T10"])
+        read_origins = reads.index_read_origins(
+            reads_file, ["T1", "T2", "T3", "T10"])
+
+    assert list(read_origins.count_transcripts(4)) == [1, 3, 0, 2]
+
+
+def test_index_read_origins_raises_error_for_unknown_transcript():
+    with utils.temp_dir_created() as dirname:
+        reads_file = _write_simulated_reads_file(dirname, ["T1", "T4"])
+        with pytest.raises(ValueError):
+            reads.index_read_origins(reads_file, ["T1", "T2"])
+
+
+def test_count_read_assignments_counts_primary_assignments():
+    transcript_ids = ["T1", "T2", "T3"]
+    with utils.temp_dir_created() as dirname:
+        read_origins = reads.index_read_origins(
+            _write_simulated_reads_file(dirname, ["T1", "T1", "T2", "T3"]),
+            transcript_ids)
+        sam_file = _write_sam_file(dirname, [
+            ("T1", 1, 0, "T1"), ("T1", 1, 256, "T2"),
+            ("T1", 2, 16, "T2"), ("T2", 3, 0, "T2"),
+            ("T2", 3, 0, "T3"), ("T3", 4, 4, "*")])
+        assigned, correct = reads.count_read_assignments(
+            sam_file, read_origins, transcript_ids)
+
+    assert list(assigned) == [1, 2, 0]
+    assert list(correct) == [1, 1, 0]
+
+
+def test_count_read_assignments_counts_tagged_sampled_assignments():
+    transcript_ids = ["T1", "T2", "T3"]
+    with utils.temp_dir_created() as dirname:
+        read_origins = reads.index_read_origins(
+            _write_simulated_reads_file(dirname, ["T1", "T2", "T3"]),
+            transcript_ids)
+        sam_file = _write_sam_file(dirname, [
+            ("T1", 1, 0, "T2"), ("T1", 1, 256, "T1"),
+            ("T2", 2, 0, "T2"), ("T2", 2, 256, "T3"),
+            ("T3", 3, 0, "T3")], tags=[
+            "\tZW:f:0", "\tZW:f:1\tXM:i:0", "\tZW:f:1", "\tZW:f:0",
+            "\tZW:f:0"])
+        assigned, correct = reads.count_read_assignments(
+            sam_file, read_origins, transcript_ids, sampled_tag="ZW")
+
+    assert list(assigned) == [1, 1, 0]
+    assert list(correct) == [1, 1, 0]
+
+
+def test_count_read_assignments_raises_error_for_unknown_read():
+    with utils.temp_dir_created() as dirname:
+        read_origins = reads.index_read_origins(
+            _write_simulated_reads_file(dirname, ["T1"]), ["T1"])
+        sam_file = _write_sam_file(dirname, [("T1", 2, 0, "T1")])
+        with pytest.raises(ValueError):
+            reads.count_read_assignments(sam_file, read_origins, ["T1"])
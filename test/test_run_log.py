@@ -0,0 +1,142 @@
+import os.path
+import piquant.file_writer as fw
+import piquant.run_log as run_log
+import subprocess
+import utils
+
+SCRIPT_NAME = "script.sh"
+
+
+def _write_and_run_logged_script(dirname, steps, exit_status=0):
+    with fw.writing_to_file(fw.BashScriptWriter, dirname, SCRIPT_NAME) \
+            as writer:
+        run_log.add_run_logging(writer, dirname)
+        for step in steps:
+            with run_log.logged_step(writer, step):
+                writer.add_line("true")
+        writer.add_line("exit " + str(exit_status))
+
+    subprocess.call([os.path.join(dirname, SCRIPT_NAME)])
+
+
+def test_add_run_logging_writes_metrics_only_on_job_state_changes():
+    with utils.temp_dir_created() as dirname:
+        with fw.writing_to_file(fw.BashScriptWriter, dirname, SCRIPT_NAME) \
+                as writer:
+            run_log.add_run_logging(
+                writer, dirname, os.path.join(dirname, "metrics.prom"))
+            with run_log.logged_step(writer, "step"):
+                writer.add_line("true")
+
+        with open(os.path.join(dirname, SCRIPT_NAME)) as f:
+            lines = [line.strip() for line in f]
+        metrics_lines = [i for i, line in enumerate(lines)
+                         if "write_sweep_metrics.py" in line]
+        assert len(metrics_lines) == 1
+        assert lines[metrics_lines[0] - 1] == \
+            "if [ \"$1\" == job ]; then"
+
+
+def test_read_run_log_returns_none_if_no_log_exists():
+    with utils.temp_dir_created() as dirname:
+        assert run_log.read_run_log(dirname) is None
+
+
+def test_read_run_log_returns_header_information():
+    with utils.temp_dir_created() as dirname:
+        run_log.write_run_log_header(
+            dirname, run_log.QUANTIFICATION_RUN,
+            quant_method="Salmon", read_depth=30)
+
+        log = run_log.read_run_log(dirname)
+        assert log.run_type == run_log.QUANTIFICATION_RUN
+        assert log.params["quant_method"] == "Salmon"
+        assert log.params["read_depth"] == "30"
+
+
+def test_read_run_log_returns_queued_state_for_unstarted_run():
+    with utils.temp_dir_created() as dirname:
+        run_log.write_run_log_header(dirname, run_log.SIMULATION_RUN)
+        assert run_log.read_run_log(dirname).job_state == run_log.QUEUED
+
+
+def test_read_run_log_returns_succeeded_state_for_successful_script():
+    with utils.temp_dir_created() as dirname:
+        _write_and_run_logged_script(dirname, [])
+        assert run_log.read_run_log(dirname).job_state == run_log.SUCCEEDED
+
+
+def test_read_run_log_returns_failed_state_for_failed_script():
+    with utils.temp_dir_created() as dirname:
+        _write_and_run_logged_script(dirname, [], exit_status=1)
+        assert run_log.read_run_log(dirname).job_state == run_log.FAILED
+
+
+def test_read_run_log_returns_completed_script_steps():
+    steps = ["first", "second"]
+    with utils.temp_dir_created() as dirname:
+        _write_and_run_logged_script(dirname, steps)
+
+        log = run_log.read_run_log(dirname)
+        assert [s.step for s in log.steps] == steps
+        assert all([s.start <= s.end for s in log.steps])
+
+
+def test_recording_step_logs_step_span():
+    with utils.temp_dir_created() as dirname:
+        with run_log.recording_step(dirname, "step"):
+            pass
+
+        log = run_log.read_run_log(dirname)
+        assert len(log.steps) == 1
+        assert log.steps[0].step == "step"
+        assert log.steps[0].end is not None
+
+
+def test_read_run_log_returns_span_for_each_script_execution():
+    with utils.temp_dir_created() as dirname:
+        _write_and_run_logged_script(dirname, [])
+        _write_and_run_logged_script(dirname, [], exit_status=1)
+
+        jobs = run_log.read_run_log(dirname).jobs
+        assert [j.state for j in jobs] == \
+            [run_log.SUCCEEDED, run_log.FAILED]
+        assert jobs[0].end <= jobs[1].start
+
+
+def test_get_step_duration_returns_none_for_incomplete_step():
+    with utils.temp_dir_created() as dirname:
+        _write_and_run_logged_script(dirname, ["step"])
+        assert run_log.get_step_duration(dirname, "other") is None
+
+
+def test_get_step_duration_returns_duration_of_completed_step():
+    with utils.temp_dir_created() as dirname:
+        _write_and_run_logged_script(dirname, ["step"])
+        step = run_log.read_run_log(dirname).steps[0]
+        assert run_log.get_step_duration(dirname, "step") == \
+            step.end - step.start
+
+
+def _write_and_run_waiting_script(dirname, wait_dir):
+    with fw.writing_to_file(fw.BashScriptWriter, dirname, SCRIPT_NAME) \
+            as writer:
+        run_log.add_wait_for_run(writer, wait_dir, poll_interval=0)
+
+    return subprocess.call([os.path.join(dirname, SCRIPT_NAME)])
+
+
+def test_add_wait_for_run_continues_when_run_succeeded():
+    with utils.temp_dir_created() as dirname:
+        wait_dir = os.path.join(dirname, "wait")
+        os.mkdir(wait_dir)
+        _write_and_run_logged_script(wait_dir, [])
+        assert _write_and_run_waiting_script(dirname, wait_dir) == 0
+
+
+def test_add_wait_for_run_exits_when_run_failed():
+    with utils.temp_dir_created() as dirname:
+        wait_dir = os.path.join(dirname, "wait")
+        os.mkdir(wait_dir)
+        _write_and_run_logged_script(wait_dir, [], exit_status=1)
+        assert _write_and_run_waiting_script(dirname, wait_dir) == 1
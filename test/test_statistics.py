@@ -197,3 +197,30 @@ def test_specificity_statistic_calculates_correct_value():
 def test_specificity_statistic_calculates_correct_grouped_values():
     _check_grouped_statistic_values(
         statistics._Specificity, _specificity, _group_tpm_pairs)
+
+
+def _get_timing_stats():
+    return pd.DataFrame.from_dict({
+        "method": ["A", "A", "A", "B"],
+        "threads": [1, 2, 4, 2],
+        statistics.QUANT_TIME: [100.0, 50.0, 40.0, 30.0]
+    })
+
+
+def test_add_scaling_statistics_calculates_speedup_relative_to_fewest_threads():
+    stats = statistics.add_scaling_statistics(
+        _get_timing_stats(), "threads", ["method"])
+    assert list(stats[statistics.SPEEDUP]) == [1.0, 2.0, 2.5, 1.0]
+
+
+def test_add_scaling_statistics_calculates_efficiency():
+    stats = statistics.add_scaling_statistics(
+        _get_timing_stats(), "threads", ["method"])
+    assert list(stats[statistics.EFFICIENCY]) == [1.0, 1.0, 0.625, 1.0]
+
+
+def test_add_scaling_statistics_does_nothing_without_quantification_times():
+    stats = _get_timing_stats()
+    del stats[statistics.QUANT_TIME]
+    stats = statistics.add_scaling_statistics(stats, "threads", ["method"])
+    assert statistics.SPEEDUP not in stats
@@ -0,0 +1,76 @@
+import json
+import os.path
+import piquant.run_log as run_log
+import piquant.sweep_trace as sweep_trace
+import utils
+
+
+def _get_run_log(run_dir, jobs, steps=[]):
+    return run_log.RunLog(
+        run_dir, run_log.QUANTIFICATION_RUN, {"quant_method": "Salmon"},
+        jobs[-1].state, jobs,
+        [run_log.StepSpan(*s) for s in steps], {}, {})
+
+
+def _get_job(start, end):
+    return run_log.JobSpan(
+        start, end, run_log.RUNNING if end is None else run_log.SUCCEEDED)
+
+
+def _get_span_events(events, category=None):
+    return [e for e in events if e["ph"] == "X" and
+            (category is None or e["cat"] == category)]
+
+
+def test_get_trace_events_returns_no_events_for_no_jobs():
+    assert sweep_trace.get_trace_events([], now=0) == []
+
+
+def test_get_trace_events_assigns_overlapping_jobs_to_different_slots():
+    logs = [_get_run_log("a", [_get_job(0, 10)]),
+            _get_run_log("b", [_get_job(5, 15)])]
+    events = _get_span_events(sweep_trace.get_trace_events(logs, now=20))
+    assert set([e["tid"] for e in events]) == set([0, 1])
+
+
+def test_get_trace_events_reuses_slots_for_consecutive_jobs():
+    logs = [_get_run_log("a", [_get_job(0, 10)]),
+            _get_run_log("b", [_get_job(0, 5)]),
+            _get_run_log("c", [_get_job(6, 15)])]
+    events = _get_span_events(sweep_trace.get_trace_events(logs, now=20))
+    slots = dict([(e["name"], e["tid"]) for e in events])
+    assert slots["c"] == slots["b"]
+    assert slots["a"] != slots["b"]
+
+
+def test_get_trace_events_returns_times_relative_to_first_job():
+    logs = [_get_run_log("a", [_get_job(100, 102.5)])]
+    event = _get_span_events(sweep_trace.get_trace_events(logs, now=200))[0]
+    assert event["ts"] == 0
+    assert event["dur"] == 2500000
+
+
+def test_get_trace_events_places_steps_in_slot_of_job():
+    logs = [_get_run_log("a", [_get_job(0, 10)]),
+            _get_run_log("b", [_get_job(5, 15)], [("quant", 6, 9)])]
+    events = sweep_trace.get_trace_events(logs, now=20)
+    step = _get_span_events(events, run_log.QUANTIFICATION_RUN)[0]
+    job = [e for e in _get_span_events(events) if e["name"] == "b"][0]
+    assert step["name"] == "quant"
+    assert step["tid"] == job["tid"]
+
+
+def test_get_trace_events_ends_unfinished_spans_now():
+    logs = [_get_run_log("a", [_get_job(0, None)], [("quant", 1, None)])]
+    events = _get_span_events(sweep_trace.get_trace_events(logs, now=20))
+    assert all([e["ts"] + e["dur"] == 20000000 for e in events])
+
+
+def test_write_trace_writes_trace_events():
+    logs = [_get_run_log("a", [_get_job(0, 10)])]
+    with utils.temp_dir_created() as dirname:
+        trace_file = os.path.join(dirname, "trace.json")
+        sweep_trace.write_trace(trace_file, logs, now=20)
+        with open(trace_file) as f:
+            trace = json.load(f)
+    assert trace["traceEvents"] == sweep_trace.get_trace_events(logs, now=20)
@@ -250,3 +250,16 @@ def test_get_grouped_stats_calculates_correct_values():
     for group in set(GROUPS):
         assert stats[name1].ix[group] == len(tpms[tpms[GROUP_TEST_COL] == group])
         assert stats[name2].ix[group] == len(tp_tpms[tp_tpms[GROUP_TEST_COL] == group])
+
+
+def test_get_assignment_precision_calculates_correct_values():
+    tpms = _get_test_tpms()
+    tpms[t.ASSIGNED_READS] = [10, 5, 4, 0, 6, 5, 0]
+    tpms[t.CORRECT_READS] = [8, 5, 2, 0, 6, 0, 0]
+
+    overall = t.get_assignment_precision(tpms)
+    assert overall[t.ASSIGNMENT_PRECISION].ix[0] == 21 / 30.0
+
+    grouped = t.get_assignment_precision(tpms, GROUP_TEST_COL)
+    assert grouped[t.ASSIGNMENT_PRECISION].ix[0] == 16 / 20.0
+    assert grouped[t.ASSIGNMENT_PRECISION].ix[1] == 5 / 10.0
@@ -0,0 +1,184 @@
+import os
+import os.path
+import piquant.worker as worker
+import pytest
+import stat
+import subprocess
+import sys
+import time
+import utils
+
+PIQUANT_DIR = os.path.dirname(os.path.abspath(worker.__file__))
+CLIENT_SCRIPT = os.path.join(PIQUANT_DIR, "run_support_script.py")
+WORKER_SCRIPT = os.path.join(PIQUANT_DIR, "support_worker.py")
+
+TEST_SCRIPT = """
+import os
+import sys
+sys.stdout.write("out " + " ".join(sys.argv[1:]))
+sys.stderr.write("err " + os.getcwd())
+sys.exit(3)
+"""
+
+TEST_STDIN_SCRIPT = """
+import os
+import sys
+sys.stdout.write(os.environ.get("PIQUANT_TEST", "") + " " + sys.stdin.read())
+"""
+
+
+def _run_client(socket_path, script, args, cwd, env={}, stdin_data=None):
+    client_env = dict(os.environ)
+    client_env.update(env)
+    client_env[worker.SOCKET_VARIABLE] = socket_path
+    with open(os.devnull) as null:
+        client = subprocess.Popen(
+            [sys.executable, CLIENT_SCRIPT, script] + args, cwd=cwd,
+            env=client_env,
+            stdin=null if stdin_data is None else subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = client.communicate(stdin_data)
+    return client.returncode, stdout, stderr
+
+
+def _start_worker(socket_path):
+    server = subprocess.Popen(
+        [sys.executable, WORKER_SCRIPT, "--log-level=warning",
+         "--socket=" + socket_path])
+    for i in range(600):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.1)
+    return server
+
+
+def test_get_socket_path_returns_environment_variable_value():
+    os.environ[worker.SOCKET_VARIABLE] = "/a/socket"
+    try:
+        assert worker.get_socket_path() == "/a/socket"
+    finally:
+        del os.environ[worker.SOCKET_VARIABLE]
+
+
+def test_get_script_command_runs_script_via_client():
+    command = worker.get_script_command("/a/script.py")
+    assert command == CLIENT_SCRIPT + " /a/script.py"
+
+
+def test_run_script_executes_script_directly_if_no_worker_is_running():
+    with utils.temp_dir_created() as dirname:
+        utils.write_executable_script(
+            dirname, "script.sh", "echo $1; exit 2")
+        code, stdout, _ = _run_client(
+            os.path.join(dirname, "no.sock"),
+            os.path.join(dirname, "script.sh"), ["arg"], dirname)
+        assert code == 2
+        assert stdout == "arg\n"
+
+
+def test_run_script_runs_script_in_worker_if_running():
+    with utils.temp_dir_created() as dirname:
+        socket_path = os.path.join(dirname, "worker.sock")
+        script = os.path.join(dirname, "script.py")
+        with open(script, "w") as f:
+            f.write(TEST_SCRIPT)
+
+        server = _start_worker(socket_path)
+        try:
+            code, stdout, stderr = _run_client(
+                socket_path, script, ["a", "b"], dirname)
+        finally:
+            server.terminate()
+            server.wait()
+
+        assert code == 3
+        assert stdout == "out a b"
+        assert stderr == "err " + os.path.realpath(dirname)
+
+
+def test_run_script_runs_script_in_worker_with_client_environment():
+    with utils.temp_dir_created() as dirname:
+        socket_path = os.path.join(dirname, "worker.sock")
+        script = os.path.join(dirname, "script.py")
+        with open(script, "w") as f:
+            f.write(TEST_STDIN_SCRIPT)
+
+        server = _start_worker(socket_path)
+        try:
+            code, stdout, _ = _run_client(
+                socket_path, script, [], dirname, env={"PIQUANT_TEST": "env"})
+        finally:
+            server.terminate()
+            server.wait()
+
+        assert code == 0
+        assert stdout == "env "
+
+
+def test_run_script_executes_script_directly_if_stdin_is_redirected():
+    with utils.temp_dir_created() as dirname:
+        socket_path = os.path.join(dirname, "worker.sock")
+        script = os.path.join(dirname, "script.py")
+        with open(script, "w") as f:
+            f.write("#!" + sys.executable + TEST_STDIN_SCRIPT)
+        os.chmod(script, 0755)
+
+        server = _start_worker(socket_path)
+        try:
+            code, stdout, _ = _run_client(
+                socket_path, script, [], dirname, env={"PIQUANT_TEST": "env"},
+                stdin_data="input")
+        finally:
+            server.terminate()
+            server.wait()
+
+        assert code == 0
+        assert stdout == "env input"
+
+
+def test_serve_restricts_socket_to_current_user():
+    with utils.temp_dir_created() as dirname:
+        socket_path = os.path.join(dirname, "worker.sock")
+        server = _start_worker(socket_path)
+        try:
+            mode = os.lstat(socket_path).st_mode
+        finally:
+            server.terminate()
+            server.wait()
+
+        assert stat.S_IMODE(mode) == 0600
+
+
+def test_run_script_executes_script_directly_if_socket_is_not_a_socket():
+    with utils.temp_dir_created() as dirname:
+        socket_path = os.path.join(dirname, "worker.sock")
+        open(socket_path, "w").close()
+        utils.write_executable_script(
+            dirname, "script.sh", "echo $1; exit 2")
+        code, stdout, _ = _run_client(
+            socket_path, os.path.join(dirname, "script.sh"), ["arg"], dirname)
+        assert code == 2
+        assert stdout == "arg\n"
+
+
+@pytest.mark.skipif(os.getuid() != 0,
+                    reason="changing socket ownership requires root")
+def test_run_script_executes_script_directly_if_socket_owned_by_other_user():
+    with utils.temp_dir_created() as dirname:
+        socket_path = os.path.join(dirname, "worker.sock")
+        utils.write_executable_script(
+            dirname, "script.sh", "echo $1; exit 2")
+
+        # A shell script run by the worker would fail as invalid Python
+        server = _start_worker(socket_path)
+        try:
+            os.chown(socket_path, os.getuid() + 1, -1)
+            code, stdout, _ = _run_client(
+                socket_path, os.path.join(dirname, "script.sh"), ["arg"],
+                dirname)
+        finally:
+            server.terminate()
+            server.wait()
+
+        assert code == 2
+        assert stdout == "arg\n"